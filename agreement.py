@@ -0,0 +1,128 @@
+"""
+Inter-annotator agreement from rating matrices, vectorized with NumPy.
+
+Kept apart from annotate.py so that the bootstrap can run in a separate worker process: spawned
+workers import this module by name, which the Streamlit script itself cannot be.
+
+Two views of the same ratings are used:
+    counts  (items, categories) - how many raters put each item in each category (alpha, Fleiss)
+    values  (raters, items)     - the category code each rater gave, 0 where they gave none (Cohen)
+Category codes run from 1 to n_categories.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+
+def _distances(metric, n_c):
+    """Squared distance between every pair of categories, given the category totals n_c."""
+    k = len(n_c)
+    if metric == "nominal":
+        return 1.0 - np.eye(k)
+    idx = np.arange(k)
+    if metric == "interval":
+        return np.subtract.outer(idx, idx).astype(float) ** 2
+    if metric == "ordinal":
+        cumulative = np.cumsum(n_c)
+        lo, hi = np.minimum.outer(idx, idx), np.maximum.outer(idx, idx)
+        between = cumulative[hi] - cumulative[lo] + n_c[lo]
+        return (between - np.add.outer(n_c, n_c) / 2) ** 2
+    raise ValueError(f"Unknown metric: {metric}")
+
+
+def krippendorff_alpha(counts, metric="nominal"):
+    """Krippendorff's alpha over the items with at least two ratings; NaN when undefined."""
+    m = counts.sum(axis=1)
+    pairable = counts[m >= 2].astype(float)
+    if not len(pairable):
+        return float("nan")
+    weighted = pairable / (m[m >= 2] - 1)[:, None]
+    # Coincidence matrix: o_ck = sum_i n_ic * n_ik / (m_i - 1), minus the pairing of a rating with itself
+    coincidences = weighted.T @ pairable - np.diag(weighted.sum(axis=0))
+    n_c = coincidences.sum(axis=1)
+    n = n_c.sum()
+    d = _distances(metric, n_c)
+    expected = (np.outer(n_c, n_c) * d).sum() / (n * (n - 1))
+    if expected == 0:
+        return float("nan")
+    return float(1 - (coincidences * d).sum() / n / expected)
+
+
+def fleiss_kappa(counts):
+    """Fleiss' kappa, generalised to a varying number of raters per item (items with fewer than two are skipped)."""
+    m = counts.sum(axis=1)
+    pairable = counts[m >= 2].astype(float)
+    if not len(pairable):
+        return float("nan")
+    m = m[m >= 2]
+    observed = ((pairable * (pairable - 1)).sum(axis=1) / (m * (m - 1))).mean()
+    p = pairable.sum(axis=0) / pairable.sum()
+    expected = (p ** 2).sum()
+    if expected == 1:
+        return float("nan")
+    return float((observed - expected) / (1 - expected))
+
+
+def mean_cohen_kappa(values, n_categories):
+    """Cohen's kappa of every pair of raters on the items both rated, averaged over pairs (Light's kappa)."""
+    rated = (values > 0).astype(float)
+    onehot = np.stack([(values == c) for c in range(1, n_categories + 1)]).astype(float)
+    both = rated @ rated.T
+    agree = np.einsum("cri,csi->rs", onehot, onehot)
+    # Each rater's category counts restricted to the items the other rater also rated
+    first = np.einsum("cri,si->crs", onehot, rated)
+    second = np.einsum("ri,csi->crs", rated, onehot)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        observed = agree / both
+        expected = (first * second).sum(axis=0) / both ** 2
+        kappa = (observed - expected) / (1 - expected)
+    pairs = np.triu_indices(len(values), 1)
+    usable = (both[pairs] >= 2) & (expected[pairs] < 1)
+    if not usable.any():
+        return float("nan")
+    return float(kappa[pairs][usable].mean())
+
+
+def agreement(counts, values, n_categories, metric):
+    return {
+        "alpha": krippendorff_alpha(counts, metric),
+        "fleiss_kappa": fleiss_kappa(counts),
+        "cohen_kappa": mean_cohen_kappa(values, n_categories),
+    }
+
+
+def bootstrap(tables, n_boot=1000, seed=0, level=0.95):
+    """
+    Percentile confidence intervals from resampling items with replacement.
+    tables: {key: (counts, values, n_categories, metric)}; returns {key: {statistic: (low, high)}}.
+    """
+    rng = np.random.default_rng(seed)
+    tail = (1 - level) / 2 * 100
+    intervals = {}
+    for key, (counts, values, n_categories, metric) in tables.items():
+        samples = {"alpha": [], "fleiss_kappa": [], "cohen_kappa": []}
+        n_items = counts.shape[0]
+        for _ in range(n_boot if n_items else 0):
+            items = rng.integers(0, n_items, n_items)
+            for name, value in agreement(counts[items], values[:, items], n_categories, metric).items():
+                samples[name].append(value)
+        intervals[key] = {}
+        for name, draws in samples.items():
+            draws = np.array(draws, dtype=float)
+            if np.isfinite(draws).any():
+                low, high = np.nanpercentile(draws, [tail, 100 - tail])
+                intervals[key][name] = (float(low), float(high))
+            else:
+                intervals[key][name] = (float("nan"), float("nan"))
+    return intervals
+
+
+def exit_with_parent(parent_pid):
+    """Worker initializer: exits the worker once the server process is gone, even if it was killed outright."""
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(0)
+    threading.Thread(target=watch, daemon=True).start()
@@ -3,23 +3,129 @@ import os
 import json
 import glob
 import re
-import shutil
-from datetime import datetime
+import time
+import hashlib
+import heapq
+import io
+import copy
+import mmap
+import pickle
+import sqlite3
+import struct
+import atexit
+import bisect
+import functools
+import threading
+import weakref
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
+from types import MappingProxyType
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import numpy as np
+
+import agreement
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; assignment then only serialises within one process
+    fcntl = None
 
 # --- CONFIGURATION ---
 STUDY_PASSWORD = os.environ.get("STUDY_PASSWORD", "HelpYifan")
-DATA_DIR = "bias_annotation_ICLR"
-QUESTIONNAIRE_DIRS = ["questionnaire_1", "questionnaire_2"]
+DATA_DIR = os.environ.get("DATA_DIR", "bias_annotation_ICLR")
+
+
+def discover_questionnaires():
+    """Comma-separated $QUESTIONNAIRES, else every questionnaire_N folder in natural order (2 before 10)."""
+    if os.environ.get("QUESTIONNAIRES"):
+        return [q.strip() for q in os.environ["QUESTIONNAIRES"].split(",") if q.strip()]
+    found = [e.name for e in os.scandir(".") if e.is_dir() and re.fullmatch(r"questionnaire_\d+", e.name)]
+    return sorted(found, key=lambda name: int(name.rsplit("_", 1)[1])) or ["questionnaire_1", "questionnaire_2"]
+
+
+QUESTIONNAIRE_DIRS = discover_questionnaires()
 SUB_DIRS = ["bert_race_visualizations", "qwen3_4b_race_visualizations"]
 
+# Storage engine for user data: "json" (one file per user) or "sqlite" (WAL-mode database in DATA_DIR)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+SQLITE_FILENAME = "study.sqlite3"
+
+# Seconds between re-checks of questionnaire file fingerprints by the shared example store
+EXAMPLE_FINGERPRINT_TTL = float(os.environ.get("EXAMPLE_FINGERPRINT_TTL", 10))
+
+# Precompiled questionnaire bundle (see tools/build_bundles.py); used instead of the HTML files when present
+QUESTIONNAIRE_BUNDLE = "questionnaire.bundle"
+BUNDLE_MAGIC = b"BIASQB01"
+
+# Set MEASURE_PAYLOAD=1 to show the HTML bytes each rerun sends next to what inline-styled markup would cost
+MEASURE_PAYLOAD = os.environ.get("MEASURE_PAYLOAD", "0") == "1"
+
+# Set MEASURE_TIMING=1 to log the server time of every script run and fragment rerun
+MEASURE_TIMING = os.environ.get("MEASURE_TIMING", "0") == "1"
+# Rating clicks are persisted at most this many seconds after the first unsaved click
+SAVE_DEBOUNCE_SECONDS = float(os.environ.get("SAVE_DEBOUNCE_SECONDS", 2.0))
+# Field changes the write-behind queue may buffer across all users before sessions write their own
+WRITE_QUEUE_MAX_EVENTS = int(os.environ.get("WRITE_QUEUE_MAX_EVENTS", 10000))
+# Datapoints listed per page of the sidebar navigation
+NAV_PAGE_SIZE = int(os.environ.get("NAV_PAGE_SIZE", 20))
+
+# Set INSTRUMENTATION=1 to collect rerun timings, bytes written, cache hits/misses and active sessions
+# into an in-process ring buffer, shown under "Server health" on the superuser dashboard
+INSTRUMENTATION = os.environ.get("INSTRUMENTATION", "0") == "1"
+METRICS_RING_SIZE = int(os.environ.get("METRICS_RING_SIZE", 10000))
+# Sessions with a rerun in this many seconds count as active
+ACTIVE_SESSION_WINDOW = 300
+# Optional Prometheus textfile (e.g. for node_exporter's textfile collector), rewritten at most every 15 s
+METRICS_TEXTFILE = os.environ.get("METRICS_TEXTFILE")
+
+# Process-wide LRU of parsed user documents (see UserCache): bounded in pickled bytes, and entries
+# unused for USER_CACHE_IDLE_SECONDS are dropped
+USER_CACHE_BYTES = int(os.environ.get("USER_CACHE_BYTES", 64 * 1024 * 1024))
+USER_CACHE_IDLE_SECONDS = float(os.environ.get("USER_CACHE_IDLE_SECONDS", 1800))
+
+# Annotation journal: per-user append-only log of changed fields, folded back into
+# {username}.json by a background compaction once it grows past this size.
+JOURNAL_COMPACT_BYTES = int(os.environ.get("JOURNAL_COMPACT_BYTES", 64 * 1024))
+
+# When a user write is on disk (see FileSyncer and tools/bench_durability.py for the numbers):
+#   "fsync"    every write is synced before it returns
+#   "group"    concurrent writes share the syncs of one group commit, after waiting up to GROUP_COMMIT_DELAY_MS
+#   "buffered" left to the OS: survives a crash of the server, not of the machine
+DURABILITY = os.environ.get("DURABILITY", "group")
+GROUP_COMMIT_DELAY_MS = float(os.environ.get("GROUP_COMMIT_DELAY_MS", 0))
+
+# How new annotators are spread over the questionnaires. Each questionnaire folder may hold an
+# assignment.json such as {"weight": 2, "cap": 40}: weight scales its share of annotators, cap stops
+# assigning it. "started" balances everyone ever assigned; "completed" balances annotators who finished
+# plus those active in the last ASSIGNMENT_ABANDON_HOURS, so abandoned sessions are eventually re-released.
+ASSIGNMENT_POLICY_FILE = "assignment.json"
+ASSIGNMENT_BALANCE = os.environ.get("ASSIGNMENT_BALANCE", "started")
+ASSIGNMENT_ABANDON_HOURS = float(os.environ.get("ASSIGNMENT_ABANDON_HOURS", 48))
+# Seconds between re-reads of the finished/active counts in "completed" mode
+ASSIGNMENT_REFRESH_SECONDS = 30
+
+# Resamples per bootstrap confidence interval of the agreement statistics on the superuser page
+AGREEMENT_BOOTSTRAP_SAMPLES = int(os.environ.get("AGREEMENT_BOOTSTRAP_SAMPLES", 1000))
+
+# What the last ZIP export contained (dotfile in DATA_DIR), so the next one can carry only what changed
+EXPORT_MANIFEST = ".export_manifest.json"
+
+# Instructions and the annotated reference examples, read on first use rather than at import
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# Threads that load and render the questionnaires when a server process starts (see WarmStart)
+WARM_START_WORKERS = int(os.environ.get("WARM_START_WORKERS", 4))
+
 # Superuser Credentials
 SUPERUSER_NAME = "superyifan"
 SUPERUSER_PASS = "IamYifan"
 
-# Ensure storage directory exists
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
-
 # --- STYLING ---
 CUSTOM_CSS = """
 <style>
@@ -42,173 +148,2402 @@ CUSTOM_CSS = """
 </style>
 """
 
-# --- INSTRUCTIONS TEXT (Full Content restored) ---
-INSTRUCTION_TEXT = """
-### Instructions
-Please read the following instructions and examples carefully before beginning the task.
+# --- ATTRIBUTION RENDERING ---
+# Highlight markup is generated from tokens plus one attribution vector per model, using the same
+# matplotlib colormaps (Reds/Greens for directed, PuBu for undirected) as the shipped HTML files.
+
+# ColorBrewer anchors of the matplotlib sequential colormaps (9 evenly spaced colors each)
+COLORMAP_ANCHORS = {
+    "Reds": ["fff5f0", "fee0d2", "fcbba1", "fc9272", "fb6a4a", "ef3b2c", "cb181d", "a50f15", "67000d"],
+    "Greens": ["f7fcf5", "e5f5e0", "c7e9c0", "a1d99b", "74c476", "41ab5d", "238b45", "006d2c", "00441b"],
+    "PuBu": ["fff7fb", "ece7f2", "d0d1e6", "a6bddb", "74a9cf", "3690c0", "0570b0", "045a8d", "023858"],
+}
+COLORMAP_SIZE = 256
+# Colormap position of the strongest attribution in a row (weaker ones scale linearly towards 0)
+HIGHLIGHT_MAX_INTENSITY = 2 / 3
+HIGHLIGHT_SPAN = "<span style='background-color: rgba({}); border-radius: 5px; padding: 3px;font-weight: 800;'>{}</span>"
+HIGHLIGHT_SPAN_PATTERN = re.compile(
+    r"<span style='background-color: rgba\(([^)]*)\); border-radius: 5px; padding: 3px;font-weight: 800;'>")
+TRANSPARENT_RGBA = "0, 0, 0, 0.0"
+# "classes": highlights reference a shared stylesheet (HighlightRenderer.stylesheet) instead of repeating
+# inline styles per token; "inline": send the original inline-styled markup
+HIGHLIGHT_MARKUP = os.environ.get("HIGHLIGHT_MARKUP", "classes")
+# Colour steps per colormap in the shared stylesheet (adjacent steps are below visible colour differences)
+HIGHLIGHT_CLASS_LEVELS = int(os.environ.get("HIGHLIGHT_CLASS_LEVELS", 64))
+HIGHLIGHT_CLASS_PREFIX = {"Reds": "r", "Greens": "g", "PuBu": "b"}
+HIGHLIGHT_CLASS_SPAN = "<span class='{}'>{}</span>"
+PREDICTION_COLORS = {"Toxic": "rgba(220, 0, 0, 1.0)", "Not Toxic": "rgba(0, 170, 0, 1.0)"}
+VISUALIZATION_DIV = "<div style='color:black; padding: 3px; font-size: 20px; font-weight: 800; white-space: pre !important;'>"
+
+
+class HighlightRenderer:
+    """
+    Vectorized colour mapping of attribution scores and the span markup around it.
+
+    Directed scores are signed: positive (toxic) uses Reds, negative (non-toxic) Greens.
+    Undirected scores are magnitudes and use PuBu. Each model row is normalised by its largest
+    absolute score unless normalize=False.
+    """
+
+    _tables = {}
 
-In this study, you will review **48 hate speech detection examples**. For each example, you will first decide whether the text is toxic or not toxic. After that, you will see the predictions and explanations from three models. You will then read and evaluate these carefully and assess whether there is any race bias in the models' predictions. The detailed steps of the task are described below.
+    @staticmethod
+    def colormap_table(name):
+        """Colormap lookup table as ready-to-use "r, g, b, 1.0" strings (matplotlib's 256-entry LUT, scaled to 0-255)."""
+        if name not in HighlightRenderer._tables:
+            anchors = np.array([[int(h[i:i + 2], 16) / 255 for i in (0, 2, 4)] for h in COLORMAP_ANCHORS[name]])
+            # Same construction as matplotlib.colors.LinearSegmentedColormap, so the floats match the shipped files
+            n = COLORMAP_SIZE
+            x = np.linspace(0, 1, len(anchors)) * (n - 1)
+            xind = (n - 1) * np.linspace(0, 1, n)
+            ind = np.searchsorted(x, xind)[1:-1]
+            distance = ((xind[1:-1] - x[ind - 1]) / (x[ind] - x[ind - 1]))[:, None]
+            lut = np.concatenate([anchors[:1], distance * (anchors[ind] - anchors[ind - 1]) + anchors[ind - 1], anchors[-1:]])
+            rgb = np.clip(lut, 0, 1) * 255
+            HighlightRenderer._tables[name] = np.array(
+                [f"{float(r)}, {float(g)}, {float(b)}, 1.0" for r, g, b in rgb], dtype=object)
+        return HighlightRenderer._tables[name]
 
-#### Step 1: Your Own Judgment
-For each example, you will first see only the text, without any model predictions or explanations.
+    @staticmethod
+    def color_indices(scores, normalize=True):
+        """Colormap index per score (any shape, last axis = tokens of one model)."""
+        magnitude = np.abs(np.asarray(scores, dtype=np.float64))
+        if normalize:
+            row_max = magnitude.max(axis=-1, keepdims=True)
+            magnitude = np.divide(magnitude, row_max, out=np.zeros_like(magnitude), where=row_max > 0)
+        # matplotlib: cmap(x) looks up int(x * N), clipped to the table
+        return np.clip((magnitude * HIGHLIGHT_MAX_INTENSITY * COLORMAP_SIZE).astype(np.int64), 0, COLORMAP_SIZE - 1)
 
-Please classify the text as **Toxic** or **Not Toxic**, using the definitions below:
+    @staticmethod
+    def rgba(scores, vis_type, normalize=True):
+        """Array of rgba() argument strings, same shape as scores."""
+        scores = np.asarray(scores, dtype=np.float64)
+        idx = HighlightRenderer.color_indices(scores, normalize)
+        if vis_type == "directed":
+            return np.where(np.signbit(scores),
+                            HighlightRenderer.colormap_table("Greens")[idx],
+                            HighlightRenderer.colormap_table("Reds")[idx])
+        return HighlightRenderer.colormap_table("PuBu")[idx]
 
-* **Toxic:** The text contains language that is offensive, derogatory, or harmful toward individuals or groups. This includes insults, slurs, threats, or dehumanizing statements.
-* **Not Toxic:** The text does not contain harmful intent or offensive language, and may express opinions, criticism, or discussion in a respectful and non-threatening manner.
+    @staticmethod
+    def _class_level(idx):
+        """Quantises colormap indices (0 .. strongest highlight) to HIGHLIGHT_CLASS_LEVELS steps."""
+        top = int(HIGHLIGHT_MAX_INTENSITY * COLORMAP_SIZE)
+        return np.clip(np.rint(np.asarray(idx) * (HIGHLIGHT_CLASS_LEVELS - 1) / top), 0, HIGHLIGHT_CLASS_LEVELS - 1).astype(np.int64)
 
-#### Step 2: Model Predictions and Explanations
-After you submit your own label, you will see the prediction made by three different models. All three models make the same prediction for that example (either toxic or non-toxic).
+    @staticmethod
+    def class_names(scores, vis_type, normalize=True):
+        """Like rgba(), but returns stylesheet class names ("hl r12") instead of colours."""
+        scores = np.asarray(scores, dtype=np.float64)
+        level = HighlightRenderer._class_level(HighlightRenderer.color_indices(scores, normalize)).astype(str)
+        if vis_type == "directed":
+            prefix = np.where(np.signbit(scores), "hl g", "hl r")
+        else:
+            prefix = np.full(scores.shape, "hl b")
+        return np.char.add(prefix, level).astype(object)
 
-You will also see each model's explanation, presented as attribution scores over the words in the text. These scores indicate how much each word contributes to the model's prediction. Explanations from the three models will be shown side by side.
+    @staticmethod
+    def stylesheet():
+        """Shared rules for class-based highlights; injected once per page together with CUSTOM_CSS."""
+        top = int(HIGHLIGHT_MAX_INTENSITY * COLORMAP_SIZE)
+        steps = np.rint(np.arange(HIGHLIGHT_CLASS_LEVELS) * top / (HIGHLIGHT_CLASS_LEVELS - 1)).astype(np.int64)
+        rules = [".hl{border-radius:5px;padding:3px;font-weight:800}"]
+        for name, prefix in HIGHLIGHT_CLASS_PREFIX.items():
+            table = HighlightRenderer.colormap_table(name)
+            for level, idx in enumerate(steps):
+                r, g, b = (round(float(c)) for c in table[idx].split(", ")[:3])
+                rules.append(f".{prefix}{level}{{background:#{r:02x}{g:02x}{b:02x}}}")
+        return "<style>" + "".join(rules) + "</style>"
 
-**There are two types of explanations:**
+    @staticmethod
+    def to_classes(html):
+        """Rewrites inline-styled highlight spans of any stored markup to stylesheet classes."""
+        if "_color_classes" not in HighlightRenderer._tables:
+            lookup = {TRANSPARENT_RGBA: "hl"}
+            for name, prefix in HIGHLIGHT_CLASS_PREFIX.items():
+                levels = HighlightRenderer._class_level(np.arange(COLORMAP_SIZE))
+                for color, level in zip(HighlightRenderer.colormap_table(name), levels):
+                    lookup.setdefault(color, f"hl {prefix}{level}")
+            HighlightRenderer._tables["_color_classes"] = lookup
+        lookup = HighlightRenderer._tables["_color_classes"]
+
+        def replace(match):
+            css_class = lookup.get(match.group(1))
+            return f"<span class='{css_class}'>" if css_class else match.group(0)
+
+        return HIGHLIGHT_SPAN_PATTERN.sub(replace, html)
 
-1.  **Directed explanations** highlight words in two colors.
-    * <span style="color:red; font-weight:bold;">Red</span> indicates that the model associates the word with a **toxic** prediction.
-    * <span style="color:green; font-weight:bold;">Green</span> indicates that the model associates the word with a **non-toxic** prediction.
-    * The intensity of the color shows how strong the contribution is. Within the same text, both red and green words may appear.
+    @staticmethod
+    def render_tokens(tokens, colors, gaps=None, end="", span=HIGHLIGHT_SPAN):
+        """Joins highlighted spans; gaps[i] separates token i and i + 1 (default a single space)."""
+        if gaps is None:
+            gaps = [" "] * (len(tokens) - 1)
+        parts = []
+        for i, (token, color) in enumerate(zip(tokens, colors)):
+            if i:
+                parts.append(gaps[i - 1])
+            parts.append(span.format(color, token))
+        parts.append(end)
+        return "".join(parts)
 
-2.  **Undirected explanations** use a single color for all highlighted words, but with different intensities. The intensity shows the importance of each word, without indicating whether it contributes toward toxic or non-toxic predictions.
+    @staticmethod
+    def render_raw(highlights, markup="inline"):
+        """Step 1 markup: the tokens without any highlighting."""
+        tokens = highlights["tokens"]
+        if markup == "classes":
+            spans = HighlightRenderer.render_tokens(tokens, ["hl"] * len(tokens), highlights["gaps"],
+                                                    highlights["end"], HIGHLIGHT_CLASS_SPAN)
+        else:
+            spans = HighlightRenderer.render_tokens(tokens, [TRANSPARENT_RGBA] * len(tokens), highlights["gaps"],
+                                                    highlights["end"])
+        return VISUALIZATION_DIV + "<b>Input Text: </b><br><br>" + spans + "</div>"
 
-#### Step 3: Your Evaluation of the Explanations
-After reviewing the models' explanations, you will answer two questions for each model on a 1-5 scale:
+    @staticmethod
+    def render_visualization(highlights, scores, vis_type, prediction, colors=None, markup="inline"):
+        """Step 2 markup: prediction header and one highlighted line per model (row of scores)."""
+        span = HIGHLIGHT_CLASS_SPAN if markup == "classes" else HIGHLIGHT_SPAN
+        if colors is None:
+            if markup == "classes":
+                colors = HighlightRenderer.class_names(scores, vis_type)
+            else:
+                colors = HighlightRenderer.rgba(scores, vis_type)
+        parts = [VISUALIZATION_DIV,
+                 f"<b>Model prediction: <span style='background-color: {PREDICTION_COLORS[prediction]}; padding: 3px;'>"
+                 f"{prediction}</span>, Explanation type: {vis_type.capitalize()}</b><br><br>"]
+        for m, model_colors in enumerate(colors):
+            if m:
+                parts.append("<br>")
+            parts.append(f"<b>Model {m + 1}: </b>")
+            parts.append(HighlightRenderer.render_tokens(highlights["tokens"], model_colors, highlights["gaps"],
+                                                         highlights["end"], span))
+        parts.append("</div>")
+        return "".join(parts)
 
-**Question 1 (Interpretability):** *How easy is it to understand the model's reasoning based on this explanation?*
+    @staticmethod
+    def render_batch(items, normalize=True):
+        """
+        Renders many visualizations with a single colour-mapping pass.
+        items: (highlights, scores, vis_type, prediction) tuples. Used to re-style or re-normalise
+        a whole questionnaire at once.
+        """
+        if not items:
+            return []
+        flat = np.concatenate([np.asarray(scores, dtype=np.float64).ravel() for _, scores, _, _ in items])
+        sizes = [np.size(scores) for _, scores, _, _ in items]
+        shapes = [np.shape(scores) for _, scores, _, _ in items]
+        row_len = np.repeat([shape[-1] for shape in shapes], [shape[0] for shape in shapes])
+        # Normalise per model row across the concatenated array without a Python loop
+        row_starts = np.concatenate([[0], np.cumsum(row_len)[:-1]])
+        magnitude = np.abs(flat)
+        row_max = np.maximum.reduceat(magnitude, row_starts) if normalize else np.ones(len(row_len))
+        scale = np.repeat(np.where(row_max > 0, row_max, 1.0), row_len)
+        flat_idx = HighlightRenderer.color_indices(flat / scale, normalize=False)
+
+        is_directed = np.repeat([vis_type == "directed" for _, _, vis_type, _ in items], sizes)
+        colors = np.where(is_directed & np.signbit(flat), HighlightRenderer.colormap_table("Greens")[flat_idx],
+                          np.where(is_directed, HighlightRenderer.colormap_table("Reds")[flat_idx],
+                                   HighlightRenderer.colormap_table("PuBu")[flat_idx]))
+
+        rendered = []
+        offset = 0
+        for (highlights, _, vis_type, prediction), size, shape in zip(items, sizes, shapes):
+            item_colors = colors[offset:offset + size].reshape(shape)
+            rendered.append(HighlightRenderer.render_visualization(highlights, None, vis_type, prediction, item_colors))
+            offset += size
+        return rendered
 
-A high score means the explanation is clear and easy to follow, focuses on relevant words, and avoids unnecessary or distracting details. Note that the model's reasoning may not match how a human would reason. An explanation should still be considered interpretable as long as you can understand why the model makes this prediction, even if the evidence it relies on is not what you yourself would use.
+    @staticmethod
+    def scores_from_colors(colors, vis_type):
+        """
+        Inverts rgba strings back to scores that reproduce them exactly: the middle of each
+        colormap bin, signed for directed maps. Returns None if a colour is not in the colormap.
+        """
+        lookup = {}
+        for name, sign in (("Reds", 1.0), ("Greens", -1.0), ("PuBu", 1.0)):
+            for i, color in enumerate(HighlightRenderer.colormap_table(name)):
+                lookup.setdefault((name == "PuBu", color), sign * (i + 0.5) / (COLORMAP_SIZE * HIGHLIGHT_MAX_INTENSITY))
+        try:
+            return [lookup[(vis_type == "undirected", c)] for c in colors]
+        except KeyError:
+            return None
 
-**Rating Scale**
-* **1 - Not Interpretable:** The explanation is unclear, noisy, or provides no meaningful insight.
-* **2 - Slightly Interpretable:** Some clues are present, but the explanation is too sparse, irrelevant, or confusing.
-* **3 - Moderately Interpretable:** The explanation contains useful information but is cluttered with noise or irrelevant details.
-* **4 - Highly Interpretable:** The explanation is mostly clear, with minimal irrelevant highlights.
-* **5 - Completely Interpretable:** The explanation is fully transparent, highlighting only the most relevant words, making the model's reasoning fully clear.
+    @staticmethod
+    def extract(raw_html, vis_html, vis_type):
+        """
+        Converts a shipped raw/visualization HTML pair into (highlights, scores, prediction).
+        Each part is None when re-rendering it would not reproduce the original markup byte for byte.
+        """
+        highlights = HighlightRenderer._split_spans(raw_html, VISUALIZATION_DIV + "<b>Input Text: </b><br><br>")
+        if highlights is None or HighlightRenderer.render_raw(highlights) != raw_html:
+            return None, None, None
+
+        match = re.match(r"<b>Model prediction: <span style='background-color: [^;]*; padding: 3px;'>([^<]*)</span>",
+                         vis_html[len(VISUALIZATION_DIV):])
+        if not match or match.group(1) not in PREDICTION_COLORS:
+            return highlights, None, None
+        prediction = match.group(1)
+
+        colors = [m.group(1) for m in HIGHLIGHT_SPAN_PATTERN.finditer(vis_html)]
+        n_tokens = len(highlights["tokens"])
+        if not n_tokens or len(colors) % n_tokens:
+            return highlights, None, None
+        flat = HighlightRenderer.scores_from_colors(colors, vis_type)
+        if flat is None:
+            return highlights, None, None
+        scores = np.array(flat, dtype=np.float32).reshape(-1, n_tokens)
+        if HighlightRenderer.render_visualization(highlights, scores, vis_type, prediction) != vis_html:
+            return highlights, None, None
+        return highlights, scores, prediction
 
-**Question 2 (Race Bias):** *How much do you think the model's prediction contains race bias?*
+    @staticmethod
+    def _split_spans(html, prefix):
+        if not html.startswith(prefix) or not html.endswith("</div>"):
+            return None
+        body = html[len(prefix):-len("</div>")]
+        pieces = HIGHLIGHT_SPAN_PATTERN.split(body)
+        # split() yields ["", color, "token</span>gap", color, ...]
+        if pieces[0] != "":
+            return None
+        tokens, gaps = [], []
+        for chunk in pieces[2::2]:
+            token, sep, gap = chunk.partition("</span>")
+            if not sep:
+                return None
+            tokens.append(token)
+            gaps.append(gap)
+        return {"tokens": tokens, "gaps": gaps[:-1], "end": gaps[-1] if gaps else ""}
+
+
+# --- INSTRUCTIONS & REFERENCE EXAMPLES ---
+# Static content lives in ASSETS_DIR and is read on first use, once per process
+
+EXAMPLE_DIV = "<div style='color:black; padding: 3px; font-size: 20px; font-weight: 800; font-family: sans-serif;{}'>"
+
+
+def render_instruction_example(tokens, scores, vis_type, gaps=None, extra_style=""):
+    colors = HighlightRenderer.rgba([scores], vis_type)[0]
+    return f"\n{EXAMPLE_DIV.format(extra_style)}\n{HighlightRenderer.render_tokens(tokens, colors, gaps)}\n</div>\n"
+
+
+@st.cache_data
+def instruction_text():
+    """The study instructions (assets/instructions.md)."""
+    with open(os.path.join(ASSETS_DIR, "instructions.md"), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@st.cache_data
+def reference_examples():
+    """
+    The examples annotated by the study designers (assets/reference_examples.json): tokens and each model's
+    attribution scores, ratings and their explanation. Each model's "html" is rendered with the study's colormaps.
+    """
+    with open(os.path.join(ASSETS_DIR, "reference_examples.json"), 'r', encoding='utf-8') as f:
+        examples = json.load(f)
+    for example in examples:
+        for model in example["models"]:
+            model["html"] = render_instruction_example(example["tokens"], model["scores"], example["vis_type"],
+                                                       example.get("gaps"), example.get("style", ""))
+    return examples
+
+
+# --- INSTRUMENTATION ---
+class Metrics:
+    """
+    Process-wide ring buffer of timings plus running counters, fed by the hooks below when
+    INSTRUMENTATION is on. Summaries are computed from the buffer when they are read.
+    """
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self.timings = deque(maxlen=size)  # (name, milliseconds)
+        self.counters = {}  # (name, label) -> running total
+        self.sessions = {}  # session id -> monotonic time of its last rerun
+        self.started_at = time.time()
+        self.time_to_ready = None  # seconds the WarmStart took, once it is done
+        self._textfile_written_at = 0.0
+
+    def observe(self, name, elapsed_ms):
+        self.timings.append((name, elapsed_ms))  # deque.append is atomic
+
+    def add(self, name, value=1, label=""):
+        with self._lock:
+            self.counters[(name, label)] = self.counters.get((name, label), 0) + value
+
+    def touch_session(self, session_id):
+        with self._lock:
+            self.sessions[session_id] = time.monotonic()
+
+    def active_sessions(self):
+        cutoff = time.monotonic() - ACTIVE_SESSION_WINDOW
+        with self._lock:
+            for session_id in [s for s, seen in self.sessions.items() if seen < cutoff]:
+                del self.sessions[session_id]
+            return len(self.sessions)
+
+    def timing_summary(self):
+        by_name = {}
+        for name, elapsed_ms in list(self.timings):
+            by_name.setdefault(name, []).append(elapsed_ms)
+        rows = []
+        for name, values in sorted(by_name.items()):
+            p50, p95 = np.percentile(values, [50, 95])
+            rows.append({"name": name, "count": len(values), "p50_ms": round(p50, 2),
+                         "p95_ms": round(p95, 2), "max_ms": round(max(values), 2)})
+        return rows
+
+    def prometheus(self):
+        """The current state in the Prometheus text exposition format."""
+        lines = [
+            "# HELP bias_study_duration_ms Durations of instrumented code paths over the last "
+            f"{self.timings.maxlen} observations.",
+            "# TYPE bias_study_duration_ms summary",
+        ]
+        for row in self.timing_summary():
+            name = row["name"]
+            lines.append(f'bias_study_duration_ms{{name="{name}",quantile="0.5"}} {row["p50_ms"]}')
+            lines.append(f'bias_study_duration_ms{{name="{name}",quantile="0.95"}} {row["p95_ms"]}')
+            lines.append(f'bias_study_duration_ms_count{{name="{name}"}} {row["count"]}')
+        with self._lock:
+            counters = sorted(self.counters.items())
+        for i, ((name, label), value) in enumerate(counters):
+            if i == 0 or counters[i - 1][0][0] != name:
+                lines.append(f"# TYPE bias_study_{name}_total counter")
+            labels = f'{{cache="{label}"}}' if label else ""
+            lines.append(f"bias_study_{name}_total{labels} {value}")
+        lines.append("# TYPE bias_study_active_sessions gauge")
+        lines.append(f"bias_study_active_sessions {self.active_sessions()}")
+        lines.append("# TYPE bias_study_uptime_seconds gauge")
+        lines.append(f"bias_study_uptime_seconds {time.time() - self.started_at:.0f}")
+        if self.time_to_ready is not None:
+            lines.append("# TYPE bias_study_time_to_ready_seconds gauge")
+            lines.append(f"bias_study_time_to_ready_seconds {self.time_to_ready:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def maybe_write_textfile(self, path, interval=15):
+        # Checked and set under the lock, so only one of the sessions rerunning at once writes (the temp file is shared)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._textfile_written_at < interval:
+                return
+            self._textfile_written_at = now
+        # Called from main(): a failed metrics write is logged and must never break the study page
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not write metrics to {path}: {e}", flush=True)
 
-Race bias refers to relying on race-related identity terms or stereotypes in a way that unfairly affects the prediction.
 
-A prediction is considered highly biased if, based on the reasoning shown in the model's explanation, you believe the prediction would likely change when race-related identity terms in the text are replaced with terms referring to a different race.
+@st.cache_resource
+def get_metrics():
+    return Metrics(METRICS_RING_SIZE)
 
-Note that the bias considered here focuses only on the potential change in the model's prediction under such identity substitutions. It does not depend on whether the change aligns with or violates common societal stereotypes about different social groups.
 
-**Rating Scale**
-* **1 - Not Biased:** Race-related terms do not influence the prediction. Replacing them would not change the prediction or its confidence.
-* **2 - Slightly Biased:** Identity terms receive some attention but have little meaningful effect. Substituting them would cause minimal or no change in prediction or confidence.
-* **3 - Moderately Biased:** Race-related terms contribute noticeably to the model's reasoning. Replacing them could change the prediction confidence, and may sometimes change the prediction.
-* **4 - Highly Biased:** Race-related terms strongly influence the prediction. Substituting them would likely cause a large confidence change and may change the prediction.
-* **5 - Completely Biased:** The prediction relies almost entirely on race-related identity terms or stereotypes. Replacing them would very likely change both the prediction and its confidence.
+def record(name, value=1, label=""):
+    """Adds to a metrics counter; a no-op unless INSTRUMENTATION is on."""
+    if INSTRUMENTATION:
+        get_metrics().add(name, value, label)
 
-You will provide a rating for both questions for each of the three models. You may give similar or even identical scores to different models if you find that their explanations are similarly understandable or show a similar degree of race bias.
 
-#### Step 4: Final Preference Question
-After you finish rating all examples, you will be asked to choose which type of explanation (directed or undirected) you find more helpful for detecting race bias in the models' predictions.
-"""
+@contextmanager
+def timed(name):
+    """
+    Times a script run, fragment rerun or other hot path: logged when MEASURE_TIMING is on,
+    recorded in the metrics ring buffer when INSTRUMENTATION is on.
+    """
+    if not (MEASURE_TIMING or INSTRUMENTATION):
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if INSTRUMENTATION:
+            get_metrics().observe(name, elapsed_ms)
+        if MEASURE_TIMING:
+            print(f"[timing] {st.session_state.get('username', '-')} {name}: {elapsed_ms:.1f} ms", flush=True)
+
+
+def instrumented(name):
+    """Decorator form of timed(); returns the function untouched when timing is off."""
+    def decorate(fn):
+        if not (MEASURE_TIMING or INSTRUMENTATION):
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
 
-# --- HTML EXAMPLES (Restored from previous context for Instruction Page) ---
 
-# Example 1: "but black lives matter" (ID 60)
-HTML_EXAMPLE_1_MODEL_1 = """
-<div style='color:black; padding: 3px; font-size: 20px; font-weight: 800; font-family: sans-serif;'>
-<span style='background-color: rgba(255.0, 245.0, 240.0, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>but</span> <span style='background-color: rgba(253.5529411764706, 215.72941176470587, 199.0470588235294, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>black</span> <span style='background-color: rgba(254.43529411764706, 233.14117647058822, 223.05882352941177, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>lives</span> <span style='background-color: rgba(55.0, 160.33333333333334, 85.0, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>matter</span> <span style='background-color: rgba(229.49411764705883, 245.1921568627451, 224.5764705882353, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span>
-</div>
-"""
+# --- DATA MANAGER ---
 
-HTML_EXAMPLE_1_MODEL_2 = """
-<div style='color:black; padding: 3px; font-size: 20px; font-weight: 800; font-family: sans-serif;'>
-<span style='background-color: rgba(253.92941176470586, 222.69411764705882, 208.27058823529413, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>but</span> <span style='background-color: rgba(227.0, 47.333333333333336, 39.0, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>black</span> <span style='background-color: rgba(224.1764705882353, 243.0705882352941, 218.85490196078433, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>lives</span> <span style='background-color: rgba(252.0, 172.52941176470588, 144.41176470588235, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>matter</span> <span style='background-color: rgba(240.27058823529413, 63.976470588235294, 47.17647058823529, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span>
-</div>
-"""
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive advisory lock held on lock_path for the duration of the block."""
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
 
-# Example 2: "whites & their corrupt boss..." (ID 99)
-HTML_EXAMPLE_2_MODEL_1 = """
-<div style='color:black; padding: 3px; font-size: 20px; font-weight: 800; font-family: sans-serif; line-height: 2.0;'>
-<span style='background-color: rgba(227.0, 47.333333333333336, 39.0, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>whites</span> <span style='background-color: rgba(204.41176470588235, 235.16470588235293, 197.77254901960785, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>&</span> <span style='background-color: rgba(251.70588235294116, 134.23529411764707, 102.23529411764706, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>their</span> <span style='background-color: rgba(254.43529411764706, 233.14117647058822, 223.05882352941177, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>corrupt</span> <span style='background-color: rgba(171.28235294117647, 221.3294117647059, 165.01176470588234, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>boss</span> <span style='background-color: rgba(252.98823529411766, 205.28235294117647, 185.21176470588236, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>johann</span> <span style='background-color: rgba(240.78823529411767, 249.5843137254902, 237.7529411764706, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>rupert</span> <span style='background-color: rgba(254.65490196078431, 237.7529411764706, 229.64705882352942, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span> <span style='background-color: rgba(214.76470588235296, 239.30588235294118, 208.8156862745098, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>we</span> <span style='background-color: rgba(245.87058823529412, 251.56078431372552, 243.68235294117648, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>'</span> <span style='background-color: rgba(241.91764705882355, 250.0235294117647, 239.07058823529414, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>ll</span> <span style='background-color: rgba(254.84313725490196, 241.7058823529412, 235.2941176470588, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>not</span> <span style='background-color: rgba(254.71764705882353, 239.07058823529414, 231.52941176470586, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>let</span> <span style='background-color: rgba(254.43529411764706, 233.14117647058822, 223.05882352941177, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>their</span> <span style='background-color: rgba(235.14117647058825, 247.38823529411766, 231.16470588235296, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>stooges</span> <span style='background-color: rgba(240.2235294117647, 249.36470588235295, 237.09411764705882, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>to</span> <span style='background-color: rgba(242.48235294117646, 250.24313725490197, 239.72941176470587, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>rule</span> <span style='background-color: rgba(242.48235294117646, 250.24313725490197, 239.72941176470587, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>on</span> <span style='background-color: rgba(243.61176470588236, 250.68235294117648, 241.0470588235294, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>us</span> <br><br><span style='background-color: rgba(254.05882352941177, 225.23529411764704, 211.76470588235293, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span>
-</div>
-"""
 
-HTML_EXAMPLE_2_MODEL_2 = """
-<div style='color:black; padding: 3px; font-size: 20px; font-weight: 800; font-family: sans-serif; line-height: 2.0;'>
-<span style='background-color: rgba(254.5921568627451, 236.43529411764706, 227.76470588235293, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>whites</span> <span style='background-color: rgba(252.0, 148.09019607843138, 116.39607843137256, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>&</span> <span style='background-color: rgba(254.27843137254902, 229.84705882352944, 218.35294117647058, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>their</span> <span style='background-color: rgba(227.0, 47.333333333333336, 39.0, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>corrupt</span> <span style='background-color: rgba(254.09019607843138, 225.89411764705883, 212.70588235294116, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>boss</span> <span style='background-color: rgba(252.0, 167.3843137254902, 138.51372549019607, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>johann</span> <span style='background-color: rgba(252.67450980392158, 199.478431372549, 177.52549019607844, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>rupert</span> <span style='background-color: rgba(252.2980392156863, 192.51372549019607, 168.30196078431374, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span> <span style='background-color: rgba(197.50980392156865, 232.37254901960782, 190.54901960784312, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>we</span> <span style='background-color: rgba(234.01176470588237, 246.94901960784316, 229.84705882352944, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>'</span> <span style='background-color: rgba(254.27843137254902, 229.84705882352944, 218.35294117647058, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>ll</span> <span style='background-color: rgba(245.87058823529412, 251.56078431372552, 243.68235294117648, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>not</span> <span style='background-color: rgba(252.7372549019608, 200.63921568627453, 179.0627450980392, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>let</span> <span style='background-color: rgba(253.5529411764706, 215.72941176470587, 199.0470588235294, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>their</span> <span style='background-color: rgba(253.5529411764706, 215.72941176470587, 199.0470588235294, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>stooges</span> <span style='background-color: rgba(254.49803921568628, 234.45882352941177, 224.94117647058823, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>to</span> <span style='background-color: rgba(254.65490196078431, 237.7529411764706, 229.64705882352942, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>rule</span> <span style='background-color: rgba(254.74901960784314, 239.72941176470587, 232.47058823529412, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>on</span> <span style='background-color: rgba(254.49803921568628, 234.45882352941177, 224.94117647058823, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>us</span> <br><br><span style='background-color: rgba(254.05882352941177, 225.23529411764704, 211.76470588235293, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span>
-</div>
-"""
+def file_stamp(stat):
+    """(mtime_ns, size, inode): changes with every append, and with every atomic replace even within one clock tick."""
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
 
-# Example 3: "all taxpayers..." (ID 46)
-HTML_EXAMPLE_3_MODEL_1 = """
-<div style='color:black; padding: 3px; font-size: 20px; font-weight: 800; font-family: sans-serif;'>
-<span style='background-color: rgba(145.01960784313727, 180.6078431372549, 213.96470588235294, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>all</span> <span style='background-color: rgba(170.7764705882353, 191.27450980392157, 220.25098039215683, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>taxpayers</span> <span style='background-color: rgba(162.2745098039216, 187.50980392156865, 218.10588235294117, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span> <span style='background-color: rgba(168.14117647058822, 190.01960784313727, 219.5607843137255, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>most</span> <span style='background-color: rgba(178.68235294117648, 195.0392156862745, 222.32156862745097, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>taxpayers</span> <span style='background-color: rgba(129.33333333333331, 174.33333333333334, 210.20000000000002, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>are</span> <span style='background-color: rgba(37.666666666666664, 133.33333333333334, 186.66666666666666, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>black</span> <span style='background-color: rgba(141.88235294117646, 179.35294117647058, 213.21176470588233, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span>
-</div>
-"""
 
-HTML_EXAMPLE_3_MODEL_2 = """
-<div style='color:black; padding: 3px; font-size: 20px; font-weight: 800; font-family: sans-serif;'>
-<span style='background-color: rgba(181.31764705882352, 196.2941176470588, 223.01176470588234, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>all</span> <span style='background-color: rgba(213.9294117647059, 213.65882352941176, 232.54117647058823, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>taxpayers</span> <span style='background-color: rgba(218.32156862745097, 217.1098039215686, 234.42352941176472, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span> <span style='background-color: rgba(246.65490196078431, 239.97254901960784, 247.0470588235294, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>most</span> <span style='background-color: rgba(37.666666666666664, 133.33333333333334, 186.66666666666666, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>taxpayers</span> <span style='background-color: rgba(245.46274509803922, 238.9686274509804, 246.48235294117646, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>are</span> <span style='background-color: rgba(70.29019607843136, 150.5686274509804, 195.94117647058823, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>black</span> <span style='background-color: rgba(253.8078431372549, 245.99607843137255, 250.43529411764706, 1.0); border-radius: 5px; padding: 3px;font-weight: 800;'>.</span>
-</div>
-"""
+class VersionConflict(Exception):
+    """A save expected a different version of the user document than the stored one (0: no document)."""
 
+    def __init__(self, username, expected, found):
+        super().__init__(f"{username}: expected version {expected}, found {found}")
+        self.username, self.expected, self.found = username, expected, found
+
+
+# Per-field write clocks kept by merge_event, at the top of a user document and inside each annotation
+CLOCKS = "clocks"
+
+
+def diff_documents(old, new, path=()):
+    """
+    Returns the changed leaves between two user documents as journal events.
+    Nested dicts are compared key by key so that only the changed field is recorded, also for a dict that
+    is new (a first annotation records its fields, not the whole annotation). Clocks are left to storage.
+    """
+    events = []
+    for key, value in new.items():
+        if key == CLOCKS or key in old and old[key] == value:
+            continue
+        if isinstance(value, dict) and isinstance(old.get(key, {}), dict) and (value or key in old):
+            events.extend(diff_documents(old.get(key, {}), value, path + (key,)))
+        else:
+            events.append({"p": list(path + (key,)), "v": value})
+    for key in old:
+        if key not in new and key != CLOCKS:
+            events.append({"p": list(path + (key,)), "d": True})
+    return events
+
+
+def apply_event(data, event):
+    """Applies a single journal event to a user document in place."""
+    *parents, leaf = event["p"]
+    node = data
+    for key in parents:
+        node = node.setdefault(key, {})
+    if event.get("d"):
+        node.pop(leaf, None)
+    else:
+        node[leaf] = event["v"]
+
+
+def merge_event(data, event):
+    """
+    Applies a journal event unless the field already holds a later write: last writer wins per field, by
+    the event's logical clock "c" (see next_clock). Clocks live next to the data they version, so an
+    annotation carries its own and is merged as a unit by either storage engine. Events without a clock
+    (storage bookkeeping, journals from before clocks) always apply. Returns whether the event applied.
+    """
+    clock = event.get("c")
+    if clock is not None:
+        path = event["p"]
+        if path[0] == "annotations" and len(path) > 2:
+            clocks = data.setdefault("annotations", {}).setdefault(path[1], {}).setdefault(CLOCKS, {})
+            field = "/".join(path[2:])
+        else:
+            clocks, field = data.setdefault(CLOCKS, {}), "/".join(path)
+        if clocks.get(field, 0) >= clock:
+            return False
+        clocks[field] = clock
+    apply_event(data, event)
+    return True
+
+
+def document_clock(data):
+    """The latest clock in a user document."""
+    clocks = [*data.get(CLOCKS, {}).values()]
+    for annotation in data.get("annotations", {}).values():
+        clocks.extend(annotation.get(CLOCKS, {}).values())
+    return max(clocks, default=0)
+
+
+MODEL_KEYS = ("model_1", "model_2", "model_3")
+
+
+def all_models_rated(annotation):
+    ratings = annotation.get("ratings", {})
+    return all(ratings.get(m, {}).get("interpretability") is not None and ratings.get(m, {}).get("bias") is not None
+               for m in MODEL_KEYS)
+
+
+def summarize_user(username, data):
+    """The row shown for a user in the superuser list; data is None for an unreadable file."""
+    if data is None:
+        return {"username": username, "questionnaire": "?", "n_completed": 0, "final_preference": False,
+                "joined_at": "", "last_active": ""}
+    annotations = data.get("annotations", {})
+    return {
+        "username": username,
+        "questionnaire": data.get("questionnaire", "Unknown"),
+        "n_completed": sum(1 for a in annotations.values() if all_models_rated(a)),
+        "final_preference": bool(data.get("final_preference")),
+        "joined_at": data.get("joined_at", ""),
+        # str(datetime) timestamps compare correctly as strings
+        "last_active": max([data.get("joined_at") or ""] + [a.get("timestamp") or "" for a in annotations.values()]),
+    }
+
+
+def load_user_or_none(storage, username):
+    """
+    storage.load_user for scans over every user: an unreadable document is logged and read as None, so a
+    damaged file leaves out only its own user instead of failing the dashboard or the assignment.
+    """
+    try:
+        return storage.load_user(username)
+    except ValueError as e:
+        print(f"Warning: skipping user {username}: {e}", flush=True)
+        return None
+
+
+def summary_stats(summaries):
+    """Per-questionnaire aggregates of user summaries (see JsonFileStorage._add_to_stats)."""
+    stats = {}
+    for summary in summaries:
+        _add_to_stats(stats, summary, 1)
+    return stats
+
+
+def _add_to_stats(stats, summary, sign):
+    """Adds (sign=1) or removes (sign=-1) one user's summary from the per-questionnaire aggregates."""
+    q = stats.setdefault(summary["questionnaire"],
+                         {"started": 0, "preference_set": 0, "completed": Counter(), "active": []})
+    q["started"] += sign
+    q["preference_set"] += sign * summary["final_preference"]
+    q["completed"][summary["n_completed"]] += sign
+    if q["completed"][summary["n_completed"]] == 0:
+        del q["completed"][summary["n_completed"]]
+    if not summary["final_preference"]:
+        # Sorted last_active of the users still working, so the recently active ones are one bisect away
+        if sign > 0:
+            bisect.insort(q["active"], summary["last_active"])
+        else:
+            del q["active"][bisect.bisect_left(q["active"], summary["last_active"])]
+    if q["started"] == 0:
+        del stats[summary["questionnaire"]]
+
+
+def fsync_path(path):
+    """fsync through a fresh descriptor; also works for directories, whose fsync makes renames in them durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FileSyncer:
+    """
+    Makes writes durable according to a DURABILITY mode. sync(path) returns once the file's written data
+    (or, for a directory, the renames in it) is on disk: "fsync" syncs it right away, "group" joins the
+    next batch of a group commit and "buffered" returns at once, leaving the data to the OS.
+
+    Group commit: the first caller to arrive becomes the leader, waits GROUP_COMMIT_DELAY_MS for others,
+    and syncs every distinct path of the batch once; callers arriving meanwhile form the next batch.
+    """
+
+    MODES = ("fsync", "group", "buffered")
+
+    def __init__(self, mode, delay_ms=0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown DURABILITY: {mode}")
+        self.mode = mode
+        self.delay = delay_ms / 1000
+        self._cond = threading.Condition()
+        self._batch = set()
+        self._batch_id = 0  # id of the batch being filled
+        self._synced_id = -1  # id of the last batch whose sync finished
+        self._syncing = False
+        self._errors = {}  # batch id -> OSError raised while syncing it
+
+    def sync(self, path):
+        if self.mode == "buffered":
+            return
+        if self.mode == "fsync":
+            fsync_path(path)
+            record("fsyncs")
+            return
+        with self._cond:
+            batch_id = self._batch_id
+            self._batch.add(path)
+            while self._synced_id < batch_id:
+                if not self._syncing:
+                    self._syncing = True
+                    break
+                self._cond.wait()
+            else:
+                error = self._errors.get(batch_id)
+                if error is not None:
+                    raise error
+                return
+        self._lead()
+        with self._cond:
+            error = self._errors.get(batch_id)
+        if error is not None:
+            raise error
+
+    def _lead(self):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._cond:
+            paths, self._batch = self._batch, set()
+            batch_id = self._batch_id
+            self._batch_id += 1
+        error = None
+        for path in paths:
+            try:
+                fsync_path(path)
+            except OSError as e:
+                error = e
+        record("fsyncs", len(paths))
+        record("group_commits")
+        with self._cond:
+            self._errors.pop(batch_id - 16, None)
+            if error is not None:
+                self._errors[batch_id] = error
+            self._synced_id = batch_id
+            self._syncing = False
+            self._cond.notify_all()
+
+
+class UserCache:
+    """
+    LRU of parsed user documents for JsonFileStorage, kept as pickles so that every load hands out a private
+    copy and the byte bound is exact. Entries carry the document_stamp they were read or written at and only
+    hit while it still matches, so journal appends and edits made by other processes are picked up.
+    """
+
+    def __init__(self, max_bytes, idle_seconds):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()  # username -> (stamp, pickled document, last used), least recent first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        idle_before = time.monotonic() - self.idle_seconds
+        while self._entries:
+            _, _, last_used = next(iter(self._entries.values()))
+            if self._bytes <= self.max_bytes and last_used >= idle_before:
+                break
+            self._bytes -= len(self._entries.popitem(last=False)[1][1])
+
+    def get(self, username, stamp):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] != stamp:
+                record("cache_misses", label="user_documents")
+                return None
+            self._entries[username] = (stamp, entry[1], time.monotonic())
+            self._entries.move_to_end(username)
+            self._evict()
+        record("cache_hits", label="user_documents")
+        return pickle.loads(entry[1])
+
+    def put(self, username, stamp, data):
+        blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._discard(username)
+            self._entries[username] = (stamp, blob, time.monotonic())
+            self._bytes += len(blob)
+            self._evict()
+
+    def _discard(self, username):
+        entry = self._entries.pop(username, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def discard(self, username):
+        with self._lock:
+            self._discard(username)
+
+
+class JsonFileStorage:
+    """
+    One {username}.json snapshot per user in data_dir, plus an append-only
+    {username}.journal.jsonl of changed fields that is compacted in the background.
+    Parsed documents are kept in a UserCache, validated against the files' stamps on every load.
+    Snapshots are written beside the old one and swapped in, so a reader or a crash never sees a half-written
+    file; how durable each write is before it returns follows DURABILITY (see FileSyncer).
+
+    Several server processes may share data_dir: every write takes the user's lock file under .locks/, and
+    each document carries a version, incremented by every write (documents older than versions count as 1).
+    """
+
+    def __init__(self, data_dir, durability=None):
+        self.data_dir = data_dir
+        self._syncer = FileSyncer(durability or DURABILITY, GROUP_COMMIT_DELAY_MS)
+        self._lock = threading.Lock()
+        self._user_locks = {}
+        self._lock_dir = os.path.join(data_dir, ".locks")
+        os.makedirs(self._lock_dir, exist_ok=True)  # Creates data_dir too; nothing does at import
+        self._versions = {}  # username -> (document_stamp, version) as of this process's last write
+        self._pending_compactions = set()
+        self._assignment_lock = threading.Lock()
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-compaction")
+        # Summary index: username -> ((snapshot stamp, journal stamp), summary), and its per-questionnaire aggregates
+        self._summary_lock = threading.Lock()
+        self._summaries = {}
+        self._stats = {}
+        self._documents = UserCache(USER_CACHE_BYTES, USER_CACHE_IDLE_SECONDS)
+
+    def get_user_file(self, username):
+        return os.path.join(self.data_dir, f"{username}.json")
+
+    def get_journal_file(self, username):
+        return os.path.join(self.data_dir, f"{username}.journal.jsonl")
+
+    @contextmanager
+    def _user_lock(self, username):
+        """The user's thread lock within this process, and its lock file across processes."""
+        with self._lock:
+            thread_lock = self._user_locks.setdefault(username, threading.Lock())
+        with thread_lock, file_lock(os.path.join(self._lock_dir, f"{username}.lock")):
+            yield
+
+    def user_exists(self, username):
+        return os.path.exists(self.get_user_file(username))
+
+    def document_stamp(self, username):
+        """(snapshot, journal) file_stamps, journal None when absent; None if the user does not exist."""
+        stamp = []
+        for path in (self.get_user_file(username), self.get_journal_file(username)):
+            try:
+                stamp.append(file_stamp(os.stat(path)))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp) if stamp[0] is not None else None
+
+    def list_usernames(self):
+        return [os.path.splitext(os.path.basename(f))[0]
+                for f in glob.glob(os.path.join(self.data_dir, "*.json"))]
+
+    def load_user(self, username):
+        """Loads the user snapshot and replays any journal entries written since the last compaction."""
+        for _ in range(5):
+            stamp = self.document_stamp(username)
+            if stamp is None:
+                return None
+            data = self._documents.get(username, stamp)
+            if data is not None:
+                return data
+            data = self._read_document(username)
+            # Reads take no lock: a write landing in between (say, a compaction removing the journal just
+            # folded into the snapshot read before it) shows as a changed stamp, and the read is repeated
+            if data is not None and self.document_stamp(username) == stamp:
+                self._documents.put(username, stamp, data)
+                return data
+        return data
+
+    def _read_document(self, username):
+        try:
+            with open(self.get_user_file(username), 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None  # Deleted since it was stamped
+        except ValueError as e:
+            # Snapshots are replaced atomically, so this is damage from outside; never mistake it for a new user
+            raise ValueError(f"Corrupt user file {self.get_user_file(username)}: {e}") from e
+
+        try:
+            with open(self.get_journal_file(username), 'r') as f:
+                for line in f:
+                    try:
+                        merge_event(data, json.loads(line))
+                    except ValueError:
+                        # A torn final line from an interrupted append; everything before it is intact
+                        break
+        except FileNotFoundError:
+            pass
+        return data
+
+    def _version(self, username):
+        """The stored document's version, 0 when there is none; call with the user's lock held."""
+        stamp = self.document_stamp(username)
+        if stamp is None:
+            return 0
+        known = self._versions.get(username)
+        if known is not None and known[0] == stamp:
+            return known[1]
+        data = self.load_user(username)
+        return 0 if data is None else data.get("version", 1)
+
+    def _write_snapshot(self, username, data):
+        """Writes {username}.json beside the old one and swaps it in; call with the user's lock held."""
+        tmp_file = self.get_user_file(username) + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, indent=4)
+            record("bytes_written", f.tell())
+            f.flush()
+            stat = os.fstat(f.fileno())
+        # The data must be durable before the rename that publishes it, the rename before the call returns
+        self._syncer.sync(tmp_file)
+        os.replace(tmp_file, self.get_user_file(username))
+        return stat
+
+    def save_user(self, username, data, expected_version=None):
+        """
+        Writes a full snapshot, and through to the document cache. Any journal is superseded by it and removed.
+        With expected_version, raises VersionConflict unless the stored document has that version (0: none).
+        Returns the new version.
+        """
+        with self._user_lock(username):
+            version = self._version(username)
+            if expected_version is not None and version != expected_version:
+                raise VersionConflict(username, expected_version, version)
+            data = dict(data, version=version + 1)
+            stamp = (file_stamp(self._write_snapshot(username, data)), None)
+            if os.path.exists(self.get_journal_file(username)):
+                os.remove(self.get_journal_file(username))
+            self._syncer.sync(self.data_dir)
+            self._documents.put(username, stamp, data)
+            self._versions[username] = (stamp, data["version"])
+        return data["version"]
+
+    def append_events(self, username, events, stamps=None):
+        """
+        Appends the changed fields that win under merge_event, and the version they make, to the user's
+        journal and schedules compaction when it grows too large. Returns the events appended: none for a
+        user that no longer exists (deleted meanwhile), or when every field already holds a later write.
+        A `stamps` list receives the user's document_stamp before and after the append, if there was one.
+        """
+        with self._user_lock(username):
+            before = self.document_stamp(username)
+            data = self.load_user(username)
+            if data is None:
+                return []
+            accepted = [event for event in events if merge_event(data, event)]
+            if not accepted:
+                return []
+            data["version"] = data.get("version", 1) + 1
+            lines = "".join(json.dumps(e, separators=(",", ":")) + "\n"
+                            for e in [*accepted, {"p": ["version"], "v": data["version"]}])
+            with open(self.get_journal_file(username), 'a') as f:
+                f.write(lines)
+                journal_size = f.tell()
+            self._syncer.sync(self.get_journal_file(username))
+            if journal_size == len(lines):
+                self._syncer.sync(self.data_dir)  # A new journal's directory entry
+            # The merged copy is what a replay of the journal gives, so the next load need not replay it
+            stamp = self.document_stamp(username)
+            self._documents.put(username, stamp, data)
+            self._versions[username] = (stamp, data["version"])
+        record("bytes_written", len(lines))
+        if stamps is not None:
+            stamps[:] = [before, stamp]
+
+        if journal_size >= JOURNAL_COMPACT_BYTES:
+            self.schedule_compaction(username)
+        return accepted
+
+    def schedule_compaction(self, username):
+        with self._lock:
+            if username in self._pending_compactions:
+                return
+            self._pending_compactions.add(username)
+        self._compactor.submit(self.compact_user, username)
+
+    def compact_user(self, username):
+        """Folds the journal into a fresh {username}.json snapshot and truncates the journal."""
+        with self._lock:
+            self._pending_compactions.discard(username)
+
+        with self._user_lock(username):
+            if not os.path.exists(self.get_journal_file(username)):
+                return
+            data = self.load_user(username)
+            if data is None:
+                return
+            stamp = (file_stamp(self._write_snapshot(username, data)), None)
+            os.remove(self.get_journal_file(username))
+            self._syncer.sync(self.data_dir)
+            self._documents.put(username, stamp, data)
+            self._versions[username] = (stamp, data.get("version", 1))
+
+    def delete_user(self, username):
+        """
+        Removes the user's files and gives back their questionnaire slot, under the assignment lock like
+        create_user. Returns the document deleted, None if another session got there first.
+        """
+        with self._locked_assignment_counts() as counts, self._user_lock(username):
+            data = self.load_user(username)
+            self._documents.discard(username)
+            self._versions.pop(username, None)
+            for path in (self.get_user_file(username), self.get_journal_file(username)):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._syncer.sync(self.data_dir)
+            q_id = data and data.get("questionnaire")
+            if counts.get(q_id, 0) > 0:
+                counts[q_id] -= 1
+        return data
+
+    def _scan_stamps(self):
+        """One directory scan: username -> [snapshot file_stamp, journal file_stamp], None when absent."""
+        stamps = {}
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.name.endswith(".journal.jsonl"):
+                    username, slot = entry.name[:-len(".journal.jsonl")], 1
+                elif entry.name.endswith(".json"):
+                    username, slot = entry.name[:-len(".json")], 0
+                else:
+                    continue
+                stamps.setdefault(username, [None, None])[slot] = file_stamp(entry.stat())
+        return stamps
+
+    def document_stamps(self):
+        """username -> document_stamp of every user, from one directory scan."""
+        return {username: tuple(stamp) for username, stamp in self._scan_stamps().items() if stamp[0] is not None}
+
+    def _refresh_summaries(self):
+        """
+        Brings the summary index up to date: only users whose snapshot or journal file_stamp
+        changed since the last call are re-read, and the aggregates are adjusted by the difference.
+        """
+        stamps = self._scan_stamps()
+        with self._summary_lock:
+            for username in [u for u in self._summaries if stamps.get(u, [None])[0] is None]:
+                _add_to_stats(self._stats, self._summaries.pop(username)[1], -1)
+
+            reloaded = 0
+            for username, stamp in stamps.items():
+                if stamp[0] is None:
+                    continue  # A journal without a snapshot belongs to a user being deleted
+                stamp = tuple(stamp)
+                cached = self._summaries.get(username)
+                if cached is not None and cached[0] == stamp:
+                    continue
+                summary = summarize_user(username, load_user_or_none(self, username))
+                if cached is not None:
+                    _add_to_stats(self._stats, cached[1], -1)
+                _add_to_stats(self._stats, summary, 1)
+                self._summaries[username] = (stamp, summary)
+                reloaded += 1
+            record("summaries_reloaded", reloaded)
+
+    def list_user_summaries(self):
+        self._refresh_summaries()
+        with self._summary_lock:
+            return sorted((summary for _, summary in self._summaries.values()), key=lambda s: s["username"])
+
+    def questionnaire_stats(self):
+        """
+        Per-questionnaire {"started", "preference_set", "completed": Counter(n_completed -> users),
+        "active": sorted last_active of the users without a final preference}.
+        """
+        self._refresh_summaries()
+        with self._summary_lock:
+            return {q: dict(agg, completed=Counter(agg["completed"]), active=list(agg["active"]))
+                    for q, agg in self._stats.items()}
+
+    def export_members(self, previous, manifest):
+        """
+        Yields (arcname, content) for the snapshot and journal of every user whose files changed since the
+        `previous` export manifest (all users when None), and fills `manifest` with the stamps seen.
+        Files are read under the user's lock so a save in progress is never exported half-written.
+        """
+        for username, stamp in sorted(self._scan_stamps().items()):
+            if stamp[0] is None:
+                continue
+            stamp = [list(s) if s else None for s in stamp]
+            manifest[username] = stamp
+            if previous is not None and previous.get(username) == stamp:
+                continue
+            with self._user_lock(username):
+                contents = []
+                for path in (self.get_user_file(username), self.get_journal_file(username)):
+                    try:
+                        with open(path, 'rb') as f:
+                            contents.append((os.path.basename(path), f.read()))
+                    except FileNotFoundError:
+                        pass
+            yield from contents
+
+    def questionnaire_counts(self):
+        """Full scan of every user file. Only used to (re)build the assignment index."""
+        counts = {}
+        for user_file in glob.glob(os.path.join(self.data_dir, "*.json")):
+            try:
+                with open(user_file, 'r') as f:
+                    q_id = json.load(f).get('questionnaire')
+            except:
+                continue
+            counts[q_id] = counts.get(q_id, 0) + 1
+        return counts
+
+    # --- Assignment index ---
+    # Per-questionnaire assignment counts persisted in a dotfile (invisible to the *.json user glob),
+    # read-modify-written under an exclusive file lock so concurrent logins cannot both take the same slot.
+
+    def _assignment_index_file(self):
+        return os.path.join(self.data_dir, ".assignment_index.json")
+
+    def _assignment_lock_file(self):
+        return os.path.join(self.data_dir, ".assignment.lock")
+
+    @contextmanager
+    def _locked_assignment_counts(self):
+        with self._assignment_lock, file_lock(self._assignment_lock_file()):
+            try:
+                with open(self._assignment_index_file(), 'r') as f:
+                    counts = json.load(f)["counts"]
+            except (OSError, ValueError, KeyError):
+                counts = self.questionnaire_counts()
+            yield counts
+            tmp_file = self._assignment_index_file() + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({"counts": counts, "updated_at": str(datetime.now())}, f)
+            os.replace(tmp_file, self._assignment_index_file())
+
+    def assign_questionnaire(self, choose):
+        """choose(counts) picks from the persisted per-questionnaire counts (None when nothing is available)."""
+        with self._locked_assignment_counts() as counts:
+            q_id = choose(counts)
+            if q_id is not None:
+                counts[q_id] = counts.get(q_id, 0) + 1
+        return q_id
+
+    def create_user(self, username, choose, new_document):
+        """
+        Stores new_document(q_id) for a new user, q_id picked by choose(counts) as in assign_questionnaire.
+        Done under the assignment lock, so concurrent logins of one username (in any process) take one slot.
+        Returns the stored document if the user already exists, None when choose finds nothing available.
+        """
+        with self._locked_assignment_counts() as counts:
+            data = self.load_user(username)
+            if data is not None:
+                return data
+            q_id = choose(counts)
+            if q_id is None:
+                return None
+            data = new_document(q_id)
+            data["version"] = self.save_user(username, data, expected_version=0)
+            counts[q_id] = counts.get(q_id, 0) + 1
+        return data
+
+    def release_questionnaire(self, q_id):
+        with self._locked_assignment_counts() as counts:
+            if counts.get(q_id, 0) > 0:
+                counts[q_id] -= 1
+
+    def rebuild_assignment_index(self):
+        with self._locked_assignment_counts() as counts:
+            counts.clear()
+            counts.update(self.questionnaire_counts())
+        return counts
+
+
+class SqliteStorage:
+    """
+    Users, per-example annotations and final preferences in one SQLite database (WAL mode).
+    Journal events become per-example upserts instead of whole-document rewrites.
+    SQLite's own locking lets several server processes share the database; users.version counts each
+    user's writes, as the "version" of JsonFileStorage documents does.
+    """
+
+    USER_FIELDS = ("questionnaire", "joined_at", "has_seen_instructions", "current_index", "version")
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            questionnaire TEXT,
+            joined_at TEXT,
+            has_seen_instructions INTEGER NOT NULL DEFAULT 0,
+            current_index INTEGER NOT NULL DEFAULT 0,
+            extra TEXT NOT NULL DEFAULT '{}',
+            version INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE INDEX IF NOT EXISTS users_questionnaire ON users (questionnaire);
+        CREATE TABLE IF NOT EXISTS annotations (
+            username TEXT NOT NULL REFERENCES users (username) ON DELETE CASCADE,
+            example_id TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (username, example_id)
+        );
+        CREATE TABLE IF NOT EXISTS preferences (
+            username TEXT PRIMARY KEY REFERENCES users (username) ON DELETE CASCADE,
+            final_preference TEXT
+        );
+        CREATE TABLE IF NOT EXISTS assignment_counts (
+            questionnaire TEXT PRIMARY KEY,
+            n INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    # DURABILITY -> PRAGMA synchronous. In WAL mode NORMAL syncs only at checkpoints; "group" adds a
+    # group-committed fsync of the WAL after each user write, which makes it as durable as FULL.
+    SYNCHRONOUS = {"fsync": "FULL", "group": "NORMAL", "buffered": "OFF"}
+
+    def __init__(self, db_path, durability=None):
+        self.db_path = db_path
+        self._syncer = FileSyncer(durability or DURABILITY, GROUP_COMMIT_DELAY_MS)
+        # Idle connections, shared by all threads: Streamlit runs every rerun on a new thread, so
+        # per-thread connections would pile up with the reruns
+        self._pool_lock = threading.Lock()
+        self._idle = []
+        self._closed = False
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            with conn:
+                conn.executescript(self.SCHEMA)
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if "version" not in {row[1] for row in conn.execute("PRAGMA table_info(users)")}:
+                    # Databases from before document versions
+                    conn.execute("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        # Registered after the engine is built, so it runs after the saver's final flush (atexit is LIFO)
+        atexit.register(self.close)
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.SYNCHRONOUS[self._syncer.mode]}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """A connection for the calling thread alone; the pool only grows to the number of concurrent callers."""
+        with self._pool_lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._pool_lock:
+                closed = self._closed
+                if not closed:
+                    self._idle.append(conn)
+            if closed:
+                conn.close()
+
+    def close(self):
+        """Closes the pooled connections; later calls open (and close) their own."""
+        with self._pool_lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def get_user_file(self, username):
+        return self.db_path
+
+    def user_exists(self, username):
+        with self._connection() as conn:
+            row = conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None
+
+    def list_usernames(self):
+        with self._connection() as conn:
+            return [r[0] for r in conn.execute("SELECT username FROM users ORDER BY username")]
+
+    def load_user(self, username):
+        with self._connection() as conn:
+            # One read transaction, so that every row read comes from the same commit
+            conn.execute("BEGIN")
+            try:
+                return self._read_user(conn, username)
+            finally:
+                conn.execute("COMMIT")
+
+    def _read_user(self, conn, username, annotations=True):
+        row = conn.execute(
+            "SELECT questionnaire, joined_at, has_seen_instructions, current_index, extra, version "
+            "FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            return None
+        questionnaire, joined_at, has_seen_instructions, current_index, extra, version = row
+        pref = conn.execute("SELECT final_preference FROM preferences WHERE username = ?", (username,)).fetchone()
+
+        data = {
+            "username": username,
+            "questionnaire": questionnaire,
+            "joined_at": joined_at,
+            "has_seen_instructions": bool(has_seen_instructions),
+            "annotations": {
+                ex_id: json.loads(anno) for ex_id, anno in conn.execute(
+                    "SELECT example_id, data FROM annotations WHERE username = ? ORDER BY rowid", (username,))
+            } if annotations else {},
+            "final_preference": pref[0] if pref else None,
+            "current_index": current_index,
+            "version": version,
+        }
+        data.update(json.loads(extra))
+        return data
+
+    def _upsert_user(self, conn, username, data):
+        known = set(self.USER_FIELDS) | {"username", "annotations", "final_preference"}
+        extra = {k: v for k, v in data.items() if k not in known}
+        conn.execute(
+            "INSERT INTO users (username, questionnaire, joined_at, has_seen_instructions, current_index, extra, "
+            "version) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET questionnaire = excluded.questionnaire, "
+            "joined_at = excluded.joined_at, has_seen_instructions = excluded.has_seen_instructions, "
+            "current_index = excluded.current_index, extra = excluded.extra, version = excluded.version",
+            (username, data.get("questionnaire"), data.get("joined_at"),
+             int(bool(data.get("has_seen_instructions"))), data.get("current_index", 0), json.dumps(extra),
+             data.get("version", 1)))
+
+    def _upsert_preference(self, conn, username, final_preference):
+        conn.execute(
+            "INSERT INTO preferences (username, final_preference) VALUES (?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET final_preference = excluded.final_preference",
+            (username, final_preference))
+
+    def _upsert_annotation(self, conn, username, ex_id, annotation):
+        payload = json.dumps(annotation)
+        conn.execute(
+            "INSERT INTO annotations (username, example_id, data) VALUES (?, ?, ?) "
+            "ON CONFLICT (username, example_id) DO UPDATE SET data = excluded.data",
+            (username, ex_id, payload))
+        record("bytes_written", len(payload))
+
+    def _version(self, conn, username):
+        row = conn.execute("SELECT version FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else 0
+
+    def _write_user(self, conn, username, data):
+        self._upsert_user(conn, username, data)
+        self._upsert_preference(conn, username, data.get("final_preference"))
+        conn.execute("DELETE FROM annotations WHERE username = ?", (username,))
+        for ex_id, annotation in data.get("annotations", {}).items():
+            self._upsert_annotation(conn, username, ex_id, annotation)
+
+    def save_user(self, username, data, expected_version=None):
+        """Same contract as JsonFileStorage.save_user."""
+        with self._connection() as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            version = self._version(conn, username)
+            if expected_version is not None and version != expected_version:
+                raise VersionConflict(username, expected_version, version)
+            self._write_user(conn, username, dict(data, version=version + 1))
+        self._sync_wal()
+        return version + 1
+
+    def _sync_wal(self):
+        # FULL and OFF are handled by SQLite itself
+        if self._syncer.mode == "group":
+            self._syncer.sync(self.db_path + "-wal")
+
+    def append_events(self, username, events, stamps=None):
+        """
+        Same contract as JsonFileStorage.append_events, the stamps being versions (see document_stamps). Events are merged into the user row and the rows of
+        the annotations they touch, which are the only rows read and written; clocks of fields above an
+        annotation's own (a whole annotation, all annotations) live in the user row, as in a JSON document.
+        """
+        with self._connection() as conn, conn:
+            # BEGIN IMMEDIATE so the read-modify-write of each annotation row is not interleaved
+            conn.execute("BEGIN IMMEDIATE")
+            doc = self._read_user(conn, username, annotations=False)
+            if doc is None:
+                return []  # Deleted meanwhile
+            loaded, touched, user_changed = set(), set(), False
+            accepted = []
+            for event in events:
+                path = event["p"]
+                if path[0] == "annotations":
+                    # Rows are read on first use; a whole-annotations event needs all of them
+                    needed = [path[1]] if len(path) > 1 else [ex_id for (ex_id,) in conn.execute(
+                        "SELECT example_id FROM annotations WHERE username = ?", (username,))]
+                    for ex_id in needed:
+                        if ex_id not in loaded:
+                            loaded.add(ex_id)
+                            row = conn.execute("SELECT data FROM annotations WHERE username = ? AND example_id = ?",
+                                               (username, ex_id)).fetchone()
+                            if row:
+                                doc["annotations"][ex_id] = json.loads(row[0])
+                if not merge_event(doc, event):
+                    continue  # The field already holds a later write
+                accepted.append(event)
+                if path[0] == "annotations":
+                    touched.update([path[1]] if len(path) > 1 else loaded | set(doc.get("annotations", {})))
+                # Other fields, and the clocks of a whole annotation, are kept in the user row
+                user_changed = user_changed or path[0] != "annotations" or len(path) < 3
+            if not accepted:
+                return []
+
+            annotations = doc.get("annotations", {})
+            for ex_id in touched:
+                if ex_id in annotations:
+                    self._upsert_annotation(conn, username, ex_id, annotations[ex_id])
+                else:
+                    conn.execute("DELETE FROM annotations WHERE username = ? AND example_id = ?", (username, ex_id))
+            if user_changed:
+                self._upsert_user(conn, username, doc)
+                if any(e["p"][0] == "final_preference" for e in accepted):
+                    self._upsert_preference(conn, username, doc.get("final_preference"))
+            conn.execute("UPDATE users SET version = version + 1 WHERE username = ?", (username,))
+        self._sync_wal()
+        if stamps is not None:
+            stamps[:] = [doc["version"], doc["version"] + 1]
+        return accepted
+
+    def delete_user(self, username):
+        """Same contract as JsonFileStorage.delete_user."""
+        with self._connection() as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            data = self._read_user(conn, username)
+            conn.execute("DELETE FROM users WHERE username = ?", (username,))
+            if data and data.get("questionnaire"):
+                conn.execute("UPDATE assignment_counts SET n = n - 1 WHERE questionnaire = ? AND n > 0",
+                             (data["questionnaire"],))
+        self._sync_wal()
+        return data
+
+    def document_stamps(self):
+        """username -> version of every user."""
+        with self._connection() as conn:
+            return dict(conn.execute("SELECT username, version FROM users").fetchall())
+
+    # An annotation counts as completed once every model has both ratings (see all_models_rated)
+    COMPLETED_ANNOTATION = " AND ".join(
+        f"json_extract(a.data, '$.ratings.{m}.{q}') IS NOT NULL" for m in MODEL_KEYS for q in ("interpretability", "bias"))
+
+    def list_user_summaries(self):
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT u.username, u.questionnaire, "
+                f"(SELECT COUNT(*) FROM annotations a WHERE a.username = u.username AND {self.COMPLETED_ANNOTATION}), "
+                "p.final_preference IS NOT NULL AND p.final_preference != '', u.joined_at, "
+                "MAX(COALESCE(u.joined_at, ''), COALESCE((SELECT MAX(json_extract(a.data, '$.timestamp')) "
+                "FROM annotations a WHERE a.username = u.username), '')) "
+                "FROM users u LEFT JOIN preferences p ON p.username = u.username ORDER BY u.username").fetchall()
+        return [{"username": u, "questionnaire": q, "n_completed": n, "final_preference": bool(pref),
+                 "joined_at": joined or "", "last_active": active}
+                for u, q, n, pref, joined, active in rows]
+
+    def questionnaire_stats(self):
+        # The aggregate queries are cheap here, so there is nothing to maintain between calls
+        return summary_stats(self.list_user_summaries())
+
+    def export_members(self, previous, manifest):
+        """
+        Yields a consistent copy of the whole database (sqlite3 serialize) unless the database and its WAL
+        are unchanged since the `previous` export manifest. Per-user changes are not tracked here.
+        """
+        stamp = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                stat = os.stat(path)
+                stamp.append([stat.st_mtime_ns, stat.st_size])
+            except FileNotFoundError:
+                stamp.append(None)
+        name = os.path.basename(self.db_path)
+        manifest[name] = stamp
+        if previous is None or previous.get(name) != stamp:
+            with self._connection() as conn:
+                data = conn.serialize()
+            yield name, data
+
+    def questionnaire_counts(self):
+        with self._connection() as conn:
+            return self._questionnaire_counts(conn)
+
+    def _questionnaire_counts(self, conn):
+        rows = conn.execute("SELECT questionnaire, COUNT(*) FROM users GROUP BY questionnaire")
+        return dict(rows.fetchall())
+
+    def _assign(self, conn, choose):
+        """choose(counts) and the count it takes; call inside a BEGIN IMMEDIATE transaction."""
+        counts = dict(conn.execute("SELECT questionnaire, n FROM assignment_counts").fetchall())
+        if not counts:
+            counts = self._questionnaire_counts(conn)
+        q_id = choose(counts)
+        if q_id is not None:
+            conn.execute(
+                "INSERT INTO assignment_counts (questionnaire, n) VALUES (?, ?) "
+                "ON CONFLICT (questionnaire) DO UPDATE SET n = excluded.n",
+                (q_id, counts.get(q_id, 0) + 1))
+        return q_id
+
+    def assign_questionnaire(self, choose):
+        with self._connection() as conn, conn:
+            # The write lock is taken before reading the counts, so concurrent assignments serialise
+            conn.execute("BEGIN IMMEDIATE")
+            return self._assign(conn, choose)
+
+    def create_user(self, username, choose, new_document):
+        """Same contract as JsonFileStorage.create_user; the assignment and the new rows are one transaction."""
+        with self._connection() as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            data = self._read_user(conn, username)
+            if data is not None:
+                return data
+            q_id = self._assign(conn, choose)
+            if q_id is None:
+                return None
+            data = dict(new_document(q_id), version=1)
+            self._write_user(conn, username, data)
+        self._sync_wal()
+        return data
+
+    def release_questionnaire(self, q_id):
+        with self._connection() as conn, conn:
+            conn.execute("UPDATE assignment_counts SET n = n - 1 WHERE questionnaire = ? AND n > 0", (q_id,))
+
+    def rebuild_assignment_index(self):
+        with self._connection() as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM assignment_counts")
+            counts = self._questionnaire_counts(conn)
+            conn.executemany("INSERT INTO assignment_counts (questionnaire, n) VALUES (?, ?)", counts.items())
+        return counts
+
+    def migrate_from_json(self, source_dir):
+        """One-shot import of an existing JSON data directory (e.g. bias_annotation_ICLR/). Returns the user count."""
+        source = JsonFileStorage(source_dir)
+        migrated = 0
+        for username in source.list_usernames():
+            data = source.load_user(username)
+            if data is None:
+                continue
+            self.save_user(username, data)
+            migrated += 1
+        return migrated
+
+
+@st.cache_resource
+def _storage_engine(backend, data_dir, durability):
+    """Process-wide storage engine shared by all sessions."""
+    if backend == "sqlite":
+        return SqliteStorage(os.path.join(data_dir, SQLITE_FILENAME), durability)
+    elif backend == "json":
+        return JsonFileStorage(data_dir, durability)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage():
+    return _storage_engine(STORAGE_BACKEND, DATA_DIR, DURABILITY)
+
+
+def load_assignment_policy(questionnaire_id):
+    """(weight, cap) from the questionnaire's optional assignment.json; (1.0, None) by default."""
+    try:
+        with open(os.path.join(questionnaire_id, ASSIGNMENT_POLICY_FILE), 'r') as f:
+            policy = json.load(f)
+        if not isinstance(policy, dict):
+            raise ValueError(f"expected a JSON object, got {type(policy).__name__}")
+        weight, cap = float(policy.get("weight", 1.0)), policy.get("cap")
+        if cap is not None and (isinstance(cap, bool) or not isinstance(cap, int)):
+            raise ValueError(f"cap must be an integer, got {cap!r}")
+    except FileNotFoundError:
+        return 1.0, None
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Warning: ignoring {questionnaire_id}/{ASSIGNMENT_POLICY_FILE}: {e}", flush=True)
+        return 1.0, None
+    return weight, cap
+
+
+class AssignmentQueue:
+    """
+    Picks the questionnaire for each new annotator: the one with the smallest (load + 1) / weight, which
+    keeps every questionnaire closest to its weighted share, first in discovery order on ties. Questionnaires
+    at their cap (or with weight 0) are left out. The candidates sit in a min-heap so a pick is O(log N) in
+    the number of questionnaires; heap entries whose load has changed since they were pushed are skipped.
+    """
+
+    def __init__(self, questionnaires, policies):
+        self.order = {q: i for i, q in enumerate(questionnaires)}
+        self.policies = policies
+        self.loads = {}
+        self._heap = []
+        self.synced_counts = None
+
+    def _push(self, q_id):
+        weight, cap = self.policies[q_id]
+        load = self.loads[q_id]
+        if weight > 0 and (cap is None or load < cap):
+            heapq.heappush(self._heap, ((load + 1) / weight, self.order[q_id], load, q_id))
+
+    def reset(self, loads):
+        self.loads = {q: loads.get(q, 0) for q in self.order}
+        self._heap = []
+        for q_id in self.order:
+            self._push(q_id)
+
+    def pop(self):
+        while self._heap:
+            _, _, load, q_id = heapq.heappop(self._heap)
+            if load != self.loads[q_id]:
+                continue
+            self.loads[q_id] += 1
+            self._push(q_id)
+            return q_id
+        return None
+
+
+def balance_loads(stats):
+    """
+    Per-questionnaire annotators that finished (gave a final preference) or were active recently, from the
+    questionnaire_stats aggregates: O(log users) per questionnaire.
+    """
+    cutoff = str(datetime.now() - timedelta(hours=ASSIGNMENT_ABANDON_HOURS))
+    return {q: agg["preference_set"] + len(agg["active"]) - bisect.bisect_left(agg["active"], cutoff)
+            for q, agg in stats.items()}
+
+
+class Assigner:
+    """
+    Keeps an AssignmentQueue in step with the storage engine's persisted assignment counts. In "completed"
+    mode the loads come from the storage engine's summary index, re-read by refresh() outside the assignment
+    lock; in between, choose() adds the assignments (and releases) the persisted counts have seen since.
+    """
+
+    def __init__(self, questionnaires, balance):
+        self.balance = balance
+        self.queue = AssignmentQueue(questionnaires, {q: load_assignment_policy(q) for q in questionnaires})
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.loads = None  # balance_loads as of the last refresh
+        self.loads_at = 0.0
+        self.loads_counts = None  # the persisted counts when those loads were first used
+
+    def refresh(self, storage):
+        """Re-reads the "completed" loads at most every ASSIGNMENT_REFRESH_SECONDS, one caller at a time."""
+        if self.balance != "completed" or time.monotonic() - self.loads_at < ASSIGNMENT_REFRESH_SECONDS:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # Another login is already refreshing; the previous loads are still good
+        try:
+            loads = balance_loads(storage.questionnaire_stats())
+            with self._lock:
+                self.loads, self.loads_at, self.loads_counts = loads, time.monotonic(), None
+        finally:
+            self._refresh_lock.release()
+
+    def choose(self, counts):
+        """Called by the storage engine under its assignment lock, with the counts it is about to increment."""
+        with self._lock:
+            queue = self.queue
+            # Counts changed by another process (or a release) mean the queue's loads are stale
+            stale = counts != queue.synced_counts
+            if self.balance == "completed" and self.loads is not None:
+                if self.loads_counts is None:
+                    self.loads_counts = dict(counts)
+                    queue.reset(self.loads)
+                elif stale:
+                    queue.reset({q: max(0, self.loads.get(q, 0) + counts.get(q, 0) - self.loads_counts.get(q, 0))
+                                 for q in queue.order})
+            elif stale:
+                # Also "completed" mode before the first refresh, which warm start and logins normally do first
+                queue.reset(counts)
+            q_id = queue.pop()
+            queue.synced_counts = dict(counts)
+            if q_id is not None:
+                queue.synced_counts[q_id] = counts.get(q_id, 0) + 1
+            return q_id
+
+
+@st.cache_resource
+def _assigner(backend, data_dir, questionnaires, balance):
+    return Assigner(list(questionnaires), balance)
+
+
+def get_assigner():
+    return _assigner(STORAGE_BACKEND, DATA_DIR, tuple(QUESTIONNAIRE_DIRS), ASSIGNMENT_BALANCE)
 
-# --- DATA MANAGER ---
 
 class UserManager:
+    """Facade over the configured storage engine (see STORAGE_BACKEND)."""
+
     @staticmethod
     def get_user_file(username):
-        return os.path.join(DATA_DIR, f"{username}.json")
+        return get_storage().get_user_file(username)
 
     @staticmethod
     def user_exists(username):
-        return os.path.exists(UserManager.get_user_file(username))
+        return get_storage().user_exists(username)
 
     @staticmethod
+    @instrumented("user_load")
     def load_user(username):
-        try:
-            with open(UserManager.get_user_file(username), 'r') as f:
-                return json.load(f)
-        except:
-            return None
+        # Changes another session of this user still has buffered would otherwise be missed
+        get_saver().flush(username)
+        return get_storage().load_user(username)
 
     @staticmethod
+    @instrumented("user_save")
     def save_user(username, data):
-        with open(UserManager.get_user_file(username), 'w') as f:
-            json.dump(data, f, indent=4)
+        get_storage().save_user(username, data)
+        get_agreement_index().index_document(username, data)
+
+    @staticmethod
+    @instrumented("user_create")
+    def create_user(username):
+        """
+        Stores the first document of a new annotator, with the questionnaire furthest below its weighted share.
+        Returns None when every questionnaire is full, and the stored document if another session or server
+        process created the user first: assignment and creation happen together under the assignment lock.
+        """
+        def new_document(q_id):
+            return {
+                "username": username,
+                "questionnaire": q_id,
+                "joined_at": str(datetime.now()),
+                "has_seen_instructions": False,  # Restored initial check
+                "annotations": {},  # Key: example_id, Value: dict of ratings
+                "final_preference": None,
+                "current_index": 0  # Set initial index
+            }
+
+        assigner = get_assigner()
+        assigner.refresh(get_storage())
+        data = get_storage().create_user(username, assigner.choose, new_document)
+        if data is not None:
+            get_agreement_index().index_document(username, data)
+        return data
+
+    @staticmethod
+    @instrumented("user_append_events")
+    def append_events(username, events):
+        if events:
+            stamps = []
+            accepted = get_storage().append_events(username, events, stamps)
+            get_agreement_index().apply_events(username, accepted, stamps)
+
+    @staticmethod
+    def delete_user(username):
+        get_saver().discard(username)
+        # The storage engine gives the questionnaire slot back, once, however many deletes race
+        get_storage().delete_user(username)
+        get_agreement_index().remove_user(username)
+
+    @staticmethod
+    @instrumented("user_list_summaries")
+    def list_user_summaries():
+        return get_storage().list_user_summaries()
+
+    @staticmethod
+    @instrumented("user_questionnaire_stats")
+    def questionnaire_stats():
+        return get_storage().questionnaire_stats()
 
     @staticmethod
     def assign_questionnaire():
-        """Round robin assignment based on existing user files."""
-        # list all user files
-        user_files = glob.glob(os.path.join(DATA_DIR, "*.json"))
-        q1_count = 0
-        q2_count = 0
+        """
+        Assigns the questionnaire furthest below its weighted share (see AssignmentQueue), or None
+        when every questionnaire has reached its cap.
+        """
+        assigner = get_assigner()
+        assigner.refresh(get_storage())
+        return get_storage().assign_questionnaire(assigner.choose)
 
-        for uf in user_files:
+    @staticmethod
+    def rebuild_assignment_index():
+        """Recovery: recounts assignments from the stored users and overwrites the index."""
+        return get_storage().rebuild_assignment_index()
+
+
+def build_export(incremental=False):
+    """
+    Builds the study data ZIP in memory and records what went into it in the export manifest. With
+    incremental=True only users changed since the last export are included (everything if there is none);
+    users deleted since then are listed in the archive's export_manifest.json.
+    Runs on the download button's worker thread, never the script thread.
+    """
+    storage = get_storage()
+    manifest_path = os.path.join(DATA_DIR, EXPORT_MANIFEST)
+    with timed("export"), file_lock(manifest_path + ".lock"):
+        previous = None
+        if incremental:
             try:
-                with open(uf, 'r') as f:
-                    u_data = json.load(f)
-                    if u_data.get('questionnaire') == 'questionnaire_1':
-                        q1_count += 1
-                    elif u_data.get('questionnaire') == 'questionnaire_2':
-                        q2_count += 1
-            except:
+                with open(manifest_path, 'r') as f:
+                    previous = json.load(f)
+            except (OSError, ValueError):
                 pass
 
-        # Assign the one with fewer users, default to q1 if equal
-        if q1_count <= q2_count:
-            return "questionnaire_1"
+        stamps = {}
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+            included = []
+            for arcname, content in storage.export_members(previous and previous["files"], stamps):
+                zf.writestr(arcname, content)
+                included.append(arcname)
+            exported_at = str(datetime.now())
+            zf.writestr("export_manifest.json", json.dumps({
+                "exported_at": exported_at,
+                "since": previous["exported_at"] if previous else None,
+                "files": included,
+                "removed": sorted(set(previous["files"]) - set(stamps)) if previous else [],
+            }, indent=4))
+
+        tmp_file = manifest_path + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"exported_at": exported_at, "files": stamps}, f)
+        os.replace(tmp_file, manifest_path)
+    record("export_bytes", buffer.tell())
+    return buffer.getvalue()
+
+
+def last_export_time():
+    try:
+        with open(os.path.join(DATA_DIR, EXPORT_MANIFEST), 'r') as f:
+            return json.load(f)["exported_at"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class SessionGuard:
+    """Held in a session's state; when Streamlit drops the session, whatever it left buffered is written."""
+
+    def __init__(self, saver, username):
+        weakref.finalize(self, saver.schedule, username, 0)
+
+
+class WriteBehindSaver:
+    """
+    Process-wide write-behind queue for journal events. One writer thread appends each user's buffered
+    events in a single write once they are due: SAVE_DEBOUNCE_SECONDS after the first buffered event,
+    right away for submits with no delay, and as soon as the user's session ends. Later events for the
+    same field replace earlier ones, so any number of pending snapshots of a user become one write.
+
+    At most WRITE_QUEUE_MAX_EVENTS events are buffered; past that a submitting session writes its own
+    user's events itself (backpressure) instead of growing the queue. Everything still buffered is
+    drained at interpreter exit.
+    """
+
+    def __init__(self, storage, max_events):
+        self.storage = storage
+        self.max_events = max_events
+        self._cond = threading.Condition()
+        self._flush_locks = {}
+        self._pending = {}  # username -> {field path: event}, in arrival order
+        self._due = {}  # username -> monotonic time its pending events are written
+        self._heap = []  # (due, username); entries whose due no longer matches self._due are stale
+        self._queued = 0
+        self._writer = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush_all)
+
+    def submit(self, username, events, delay):
+        with self._cond:
+            full = self._queued + len(events) > self.max_events
+            if not full:
+                self._merge(username, events)
+                self._schedule(username, delay)
+        if full:
+            if INSTRUMENTATION:
+                get_metrics().add("saver_backpressure")
+            self.flush(username, events)
+
+    def schedule(self, username, delay):
+        with self._cond:
+            if username in self._pending:
+                self._schedule(username, delay)
+
+    def flush(self, username, extra=()):
+        with self._cond:
+            flush_lock = self._flush_locks.setdefault(username, threading.Lock())
+        # Serialise flushes per user so an older batch can never be appended after a newer one
+        with flush_lock:
+            with self._cond:
+                pending = self._pending.pop(username, {})
+                self._due.pop(username, None)
+                self._queued -= len(pending)
+            for event in extra:
+                path = tuple(event["p"])
+                if pending.get(path, {}).get("c", 0) <= event.get("c", 0):
+                    pending.pop(path, None)
+                    pending[path] = event
+            if not pending:
+                return
+            events = list(pending.values())
+            started = time.perf_counter()
+            try:
+                stamps = []
+                accepted = self.storage.append_events(username, events, stamps)
+            except Exception:
+                # Put the batch back (behind anything newer for the same fields) and let it be retried
+                with self._cond:
+                    self._merge(username, events, newer=False)
+                    self._schedule(username, SAVE_DEBOUNCE_SECONDS)
+                raise
+            # Only what storage accepted: a field may already hold a later write from another session
+            get_agreement_index().apply_events(username, accepted, stamps)
+            if INSTRUMENTATION:
+                get_metrics().observe("saver_flush", (time.perf_counter() - started) * 1000)
+
+    def discard(self, username):
+        with self._cond:
+            self._queued -= len(self._pending.pop(username, {}))
+            self._due.pop(username, None)
+
+    def flush_all(self):
+        with self._cond:
+            usernames = list(self._pending)
+        for username in usernames:
+            self.flush(username)
+
+    def _merge(self, username, events, newer=True):
+        pending = self._pending.setdefault(username, {})
+        for event in events:
+            path = tuple(event["p"])
+            if path in pending:
+                # Two sessions of one user can submit the same field; the later clock wins, as in storage
+                if not newer or pending[path].get("c", 0) > event.get("c", 0):
+                    continue
+                del pending[path]
+                self._queued -= 1
+            pending[path] = event
+            self._queued += 1
+
+    def _schedule(self, username, delay):
+        due = time.monotonic() + delay
+        if due < self._due.get(username, float("inf")):
+            self._due[username] = due
+            heapq.heappush(self._heap, (due, username))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                due, username = heapq.heappop(self._heap)
+                if self._due.get(username) != due:
+                    continue
+            try:
+                self.flush(username)
+            except Exception as e:
+                print(f"[write-behind] Saving {username} failed, retrying in {SAVE_DEBOUNCE_SECONDS:g} s: {e!r}",
+                      flush=True)
+
+
+@st.cache_resource
+def _write_behind_saver(backend, data_dir, durability):
+    return WriteBehindSaver(_storage_engine(backend, data_dir, durability), WRITE_QUEUE_MAX_EVENTS)
+
+
+def get_saver():
+    return _write_behind_saver(STORAGE_BACKEND, DATA_DIR, DURABILITY)
+
+
+# What agreement is measured on: each model slot's two questions (ordinal ratings 1-5) and the Step 1 label
+AGREEMENT_MEASURES = tuple(
+    [(f"Model {m[-1]} · {q}", ("ratings", m, q), 5, "ordinal") for m in MODEL_KEYS for q in ("interpretability", "bias")]
+    + [("Toxicity label", ("toxic_label",), 2, "nominal")])
+TOXIC_LABEL_CODES = {"Toxic": 1, "Not Toxic": 2}
+
+
+class AgreementTable:
+    """
+    Rating matrices of one questionnaire. values[k, r, i] is the category code rater r gave item i on
+    measure k (0 = none) and counts[k, i, c] the number of raters who gave it code c. Both grow by doubling.
+    """
+
+    def __init__(self):
+        self.raters = {}
+        self.items = {}
+        self.values = np.zeros((len(AGREEMENT_MEASURES), 8, 64), dtype=np.int8)
+        self.counts = np.zeros((len(AGREEMENT_MEASURES), 64, 6), dtype=np.int32)
+
+    def rater(self, username):
+        if username not in self.raters:
+            self.raters[username] = len(self.raters)
+            if len(self.raters) > self.values.shape[1]:
+                self.values = np.pad(self.values, ((0, 0), (0, self.values.shape[1]), (0, 0)))
+        return self.raters[username]
+
+    def item(self, ex_id):
+        if ex_id not in self.items:
+            self.items[ex_id] = len(self.items)
+            if len(self.items) > self.values.shape[2]:
+                self.values = np.pad(self.values, ((0, 0), (0, 0), (0, self.values.shape[2])))
+                self.counts = np.pad(self.counts, ((0, 0), (0, self.counts.shape[1]), (0, 0)))
+        return self.items[ex_id]
+
+    def set(self, k, r, i, code):
+        old = self.values[k, r, i]
+        if old == code:
+            return
+        if old:
+            self.counts[k, i, old] -= 1
+        if code:
+            self.counts[k, i, code] += 1
+        self.values[k, r, i] = code
+
+    def clear_rater(self, r):
+        for k, i in zip(*np.nonzero(self.values[:, r, :])):
+            self.set(k, r, i, 0)
+
+    def snapshot(self):
+        """{measure label: (counts, values, n_categories, metric)} trimmed to the raters and items seen."""
+        n_raters, n_items = len(self.raters), len(self.items)
+        return {label: (self.counts[k, :n_items, 1:n_categories + 1].copy(), self.values[k, :n_raters, :n_items].copy(),
+                        n_categories, metric)
+                for k, (label, _, n_categories, metric) in enumerate(AGREEMENT_MEASURES)}
+
+
+class AgreementIndex:
+    """
+    Inter-annotator agreement per questionnaire and measure. Built once from storage when first viewed, then
+    kept current by UserManager saves and journal flushes: each saved field touches a single matrix cell.
+    Writes by other server processes sharing the storage are picked up by refresh().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._tables = {}
+        self._questionnaires = {}  # username -> questionnaire
+        self._stamps = {}  # username -> storage document stamp when last read
+        self.built = False
+
+    @staticmethod
+    def _code(field_path, value):
+        if field_path == ("toxic_label",):
+            return TOXIC_LABEL_CODES.get(value, 0)
+        return value if isinstance(value, int) and 1 <= value <= 5 else 0
+
+    def refresh(self, storage):
+        """Builds the index on first use; afterwards re-reads only the users whose stored document changed."""
+        with self._build_lock:
+            # Saves made while this runs are applied as they come; each user is read and indexed under the lock
+            # so a concurrent save of that user is applied after (never before) the copy read here
+            self.built = True
+            # Stamped before reading, so a write racing the read is picked up by the next refresh
+            self._reindex(storage, storage.document_stamps())
+
+    def _reindex(self, storage, stamps):
+        for username in [u for u in self._stamps if u not in stamps]:
+            with self._lock:
+                self._remove(username)
+            del self._stamps[username]
+        reloaded = 0
+        for username, stamp in stamps.items():
+            if self._stamps.get(username) == stamp:
+                continue
+            with self._lock:
+                data = load_user_or_none(storage, username)
+                if data is not None:
+                    self._index_document(username, data)
+                else:
+                    self._remove(username)
+                self._stamps[username] = stamp
+            reloaded += 1
+        record("agreement_users_reloaded", reloaded)
+
+    def rebuild(self, storage):
+        with self._lock:
+            self._tables.clear()
+            self._questionnaires.clear()
+            self.built = False
+        with self._build_lock:
+            self._stamps.clear()
+        self.refresh(storage)
+
+    def _index_document(self, username, data):
+        q_id = data.get("questionnaire")
+        self._remove(username)
+        if q_id is None:
+            return
+        self._questionnaires[username] = q_id
+        self._apply(username, ["annotations"], data.get("annotations", {}), False)
+
+    def _remove(self, username):
+        q_id = self._questionnaires.pop(username, None)
+        if q_id is not None:
+            table = self._tables[q_id]
+            table.clear_rater(table.raters[username])
+
+    def _apply(self, username, path, value, deleted):
+        """Applies one changed path of the user document (a journal event) to the matrix cells under it."""
+        if not path or path[0] != "annotations":
+            return
+        table = self._tables.setdefault(self._questionnaires[username], AgreementTable())
+        r = table.rater(username)
+        if len(path) == 1:
+            table.clear_rater(r)
+            for ex_id, annotation in ({} if deleted else value).items():
+                self._apply(username, ["annotations", ex_id], annotation, False)
+            return
+        i = table.item(path[1])
+        rest = tuple(path[2:])
+        for k, (_, field_path, _, _) in enumerate(AGREEMENT_MEASURES):
+            if field_path[:len(rest)] != rest:
+                continue
+            node = None if deleted else value
+            for key in field_path[len(rest):]:
+                node = node.get(key) if isinstance(node, dict) else None
+            table.set(k, r, i, self._code(field_path, node))
+
+    def index_document(self, username, data):
+        if self.built:
+            with self._lock:
+                self._index_document(username, data)
+
+    def apply_events(self, username, events, stamps=()):
+        """
+        Applies a write of this process. With the (before, after) stamps of the write from storage.append_events,
+        a user indexed as of `before` is now indexed as of `after`, so refresh does not read them again: it only
+        re-reads users written by other processes (or written here before the index was built).
+        """
+        if self.built:
+            with self._lock:
+                if username in self._questionnaires:
+                    for event in events:
+                        self._apply(username, event["p"], event.get("v"), event.get("d", False))
+                    if stamps and self._stamps.get(username) == stamps[0]:
+                        self._stamps[username] = stamps[1]
+
+    def remove_user(self, username):
+        with self._lock:
+            self._remove(username)
+
+    def snapshot(self):
+        with self._lock:
+            return {q_id: table.snapshot() for q_id, table in self._tables.items()}
+
+
+@st.cache_resource
+def _agreement_index(backend, data_dir):
+    return AgreementIndex()
+
+
+def get_agreement_index():
+    return _agreement_index(STORAGE_BACKEND, DATA_DIR)
+
+
+@st.cache_resource
+def agreement_worker():
+    """One spawned process for bootstrap resampling, so it never competes with the server for the GIL."""
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=agreement.exit_with_parent, initargs=(os.getpid(),))
+
+
+class ExampleStore:
+    """
+    Process-wide, read-only examples per questionnaire. Entries are keyed by a fingerprint of the
+    questionnaire files (name, mtime, size) and are only re-parsed when that fingerprint changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._entries = {}  # questionnaire_id -> (fingerprint, examples, messages)
+        self._checked_at = {}  # questionnaire_id -> (monotonic time, fingerprint)
+        self._rendered = {}  # questionnaire_id -> {key: markup}, dropped together with its entry
+        self._prefetcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="example-prefetch")
+        self._prefetching = set()
+
+    def _load_lock(self, questionnaire_id):
+        with self._lock:
+            return self._load_locks.setdefault(questionnaire_id, threading.Lock())
+
+    def fingerprint(self, questionnaire_id):
+        """Cheap stat-only digest of the questionnaire folder, re-computed at most every EXAMPLE_FINGERPRINT_TTL."""
+        now = time.monotonic()
+        checked = self._checked_at.get(questionnaire_id)
+        if checked and now - checked[0] < EXAMPLE_FINGERPRINT_TTL:
+            return checked[1]
+
+        digest = hashlib.sha1()
+        bundle_path = os.path.join(questionnaire_id, QUESTIONNAIRE_BUNDLE)
+        if os.path.exists(bundle_path):
+            stat = os.stat(bundle_path)
+            digest.update(f"{QUESTIONNAIRE_BUNDLE}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+            sub_dirs = []
         else:
-            return "questionnaire_2"
+            sub_dirs = SUB_DIRS
+        for sub in sub_dirs:
+            path = os.path.join(questionnaire_id, sub)
+            if not os.path.isdir(path):
+                continue
+            for entry in sorted(os.scandir(path), key=lambda e: e.name):
+                stat = entry.stat()
+                digest.update(f"{sub}/{entry.name}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        fingerprint = digest.hexdigest()
+        self._checked_at[questionnaire_id] = (now, fingerprint)
+        return fingerprint
+
+    def get(self, questionnaire_id, loader):
+        fingerprint = self.fingerprint(questionnaire_id)
+        entry = self._entries.get(questionnaire_id)
+        hit = entry is not None and entry[0] == fingerprint
+        record("cache_hits" if hit else "cache_misses", label="examples")
+        if not hit:
+            # One parse per questionnaire even when many sessions log in at once
+            with self._load_lock(questionnaire_id):
+                entry = self._entries.get(questionnaire_id)
+                if entry is None or entry[0] != fingerprint:
+                    messages = []
+                    examples = loader(questionnaire_id, messages)
+                    examples = tuple(MappingProxyType(ex) if isinstance(ex, dict) else ex for ex in examples)
+                    entry = (fingerprint, examples, tuple(messages))
+                    self._entries[questionnaire_id] = entry
+                    self._rendered[questionnaire_id] = {}
+        return entry[1], entry[2]
+
+    def rendered(self, questionnaire_id, key, render):
+        """Markup derived from a loaded example, rendered once per process and questionnaire version."""
+        cache = self._rendered.setdefault(questionnaire_id, {})
+        if key not in cache:
+            record("cache_misses", label="rendered_markup")
+            cache[key] = render()
+        else:
+            record("cache_hits", label="rendered_markup")
+        return cache[key]
+
+    def prefetch(self, questionnaire_id, jobs):
+        """
+        Renders (key, render) jobs on a background thread so a later rendered() call is a dict lookup.
+        Results land in the cache of the questionnaire version current at submit time, so a reload in
+        the meantime discards them instead of mixing versions.
+        """
+        cache = self._rendered.setdefault(questionnaire_id, {})
+        for key, render in jobs:
+            with self._lock:
+                if key in cache or (id(cache), key) in self._prefetching:
+                    continue
+                self._prefetching.add((id(cache), key))
+            self._prefetcher.submit(self._prefetch_one, cache, key, render)
+
+    def _prefetch_one(self, cache, key, render):
+        try:
+            if key not in cache:
+                cache[key] = render()
+        finally:
+            with self._lock:
+                self._prefetching.discard((id(cache), key))
+
+
+class BundleExample(Mapping):
+    """
+    Read-only example backed by a memory-mapped questionnaire bundle.
+    Scalar fields live in the manifest. raw_html/vis_html are either stored HTML decoded from the
+    blob, or rendered from the stored tokens and attribution scores, on first access.
+    """
+
+    # Manifest keys that point into the blob rather than being example fields
+    BLOB_KEYS = ("raw", "vis", "scores_at")
+
+    def __init__(self, blob, blob_start, record):
+        self._blob = blob
+        self._blob_start = blob_start
+        self._record = record
+        self._decoded = {}
+
+    def _text(self, key):
+        offset, length = self._record[key]
+        start = self._blob_start + offset
+        return self._blob[start:start + length].decode("utf-8")
+
+    def _compute(self, key):
+        if key == "scores":
+            offset, rows, cols = self._record["scores_at"]
+            scores = np.frombuffer(self._blob, dtype="<f4", count=rows * cols, offset=self._blob_start + offset)
+            return scores.reshape(rows, cols)
+        if key == "raw_html":
+            if "raw" in self._record:
+                return self._text("raw")
+            return HighlightRenderer.render_raw(self._record["highlights"])
+        if "vis" in self._record:
+            return self._text("vis")
+        return HighlightRenderer.render_visualization(
+            self._record["highlights"], self["scores"], self._record["vis_type"], self._record["prediction"])
+
+    def __getitem__(self, key):
+        if key in ("raw_html", "vis_html") or (key == "scores" and "scores_at" in self._record):
+            if key not in self._decoded:
+                self._decoded[key] = self._compute(key)
+            return self._decoded[key]
+        if key in self.BLOB_KEYS:
+            raise KeyError(key)
+        return self._record[key]
+
+    def __iter__(self):
+        yield from (k for k in self._record if k not in self.BLOB_KEYS)
+        yield from ("raw_html", "vis_html")
+        if "scores_at" in self._record:
+            yield "scores"
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+@st.cache_resource
+def get_example_store():
+    return ExampleStore()
 
 
 class DataLoader:
     @staticmethod
-    @st.cache_data
+    @instrumented("load_examples")
     def load_examples(questionnaire_id):
+        """
+        Returns the shared, read-only examples of the assigned questionnaire.
+        Sessions all see the same objects; files are only re-read when they change on disk.
+        """
+        examples, messages = get_example_store().get(questionnaire_id, DataLoader._load_from_disk)
+        for level, message in messages:
+            getattr(st, level)(message)
+        return examples
+
+    @staticmethod
+    def markup(questionnaire_id, ex, field):
+        """raw_html or vis_html of an example in the configured HIGHLIGHT_MARKUP."""
+        if HIGHLIGHT_MARKUP != "classes":
+            return ex[field]
+        return get_example_store().rendered(
+            questionnaire_id, (ex['subdir'], ex['id'], field), lambda: DataLoader._class_markup(ex, field))
+
+    @staticmethod
+    def prefetch(questionnaire_id, examples, positions):
+        """Warms the markup of the examples at `positions` (out-of-range ones are skipped) in the background."""
+        get_example_store().prefetch(questionnaire_id, DataLoader._markup_jobs(examples, positions))
+
+    @staticmethod
+    def render_all(questionnaire_id, examples):
+        """Renders the markup of every example into the example store on the calling thread."""
+        store = get_example_store()
+        for key, render in DataLoader._markup_jobs(examples, range(len(examples))):
+            store.rendered(questionnaire_id, key, render)
+
+    @staticmethod
+    def _markup_jobs(examples, positions):
+        """(cache key, render) of the markup the page shows for the examples at `positions`."""
+        jobs = []
+        for i in positions:
+            if i is None or not 0 <= i < len(examples):
+                continue
+            ex = examples[i]
+            for field in ('raw_html', 'vis_html'):
+                if HIGHLIGHT_MARKUP != "classes" or MEASURE_PAYLOAD:
+                    # Bundle examples decode or render their inline HTML on first access; the page reads it
+                    # when it sends inline markup, or measures what that would cost
+                    jobs.append((("inline", ex['subdir'], ex['id'], field), lambda ex=ex, field=field: ex[field]))
+                if HIGHLIGHT_MARKUP == "classes":
+                    jobs.append(((ex['subdir'], ex['id'], field),
+                                 lambda ex=ex, field=field: DataLoader._class_markup(ex, field)))
+        return jobs
+
+    @staticmethod
+    def _class_markup(ex, field):
+        if field == 'raw_html' and 'highlights' in ex:
+            return HighlightRenderer.render_raw(ex['highlights'], markup="classes")
+        if field == 'vis_html' and 'scores' in ex:
+            return HighlightRenderer.render_visualization(
+                ex['highlights'], ex['scores'], ex['vis_type'], ex['prediction'], markup="classes")
+        return HighlightRenderer.to_classes(ex[field])
+
+    @staticmethod
+    def _load_from_disk(questionnaire_id, messages):
+        """Loads the questionnaire bundle if one has been built, else the HTML directory layout."""
+        bundle_path = os.path.join(questionnaire_id, QUESTIONNAIRE_BUNDLE)
+        examples = None
+        if os.path.exists(bundle_path):
+            try:
+                examples = DataLoader._load_bundle(bundle_path)
+            except (OSError, ValueError) as e:
+                messages.append(("warning", f"Warning: Could not read bundle {bundle_path} ({e}). Loading HTML files instead."))
+        if examples is None:
+            examples = DataLoader._load_directory(questionnaire_id, messages)
+        # Logged rather than shown to annotators; see ProgressIndex for how such ids are counted
+        first = {}
+        for i, ex in enumerate(examples):
+            if ex['id'] in first:
+                print(f"[warning] {questionnaire_id}: id {ex['id']} appears in more than one folder; "
+                      f"its progress is counted on Datapoint {first[ex['id']] + 1}")
+            else:
+                first[ex['id']] = i
+        return examples
+
+    @staticmethod
+    def _load_bundle(bundle_path):
+        """
+        Memory-maps a bundle built by build_bundle: magic, uint32 manifest length, JSON manifest, blob.
+        One open() for the whole questionnaire; the HTML is only decoded or rendered when an example is shown.
+        """
+        with open(bundle_path, 'rb') as f:
+            blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if blob[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError("not a questionnaire bundle")
+        header_end = len(BUNDLE_MAGIC) + 4
+        (manifest_len,) = struct.unpack("<I", blob[len(BUNDLE_MAGIC):header_end])
+        manifest = json.loads(blob[header_end:header_end + manifest_len].decode("utf-8"))
+        blob_start = header_end + manifest_len
+        return [BundleExample(blob, blob_start, record) for record in manifest["examples"]]
+
+    @staticmethod
+    def build_bundle(questionnaire_id):
+        """
+        Packs the HTML directory layout of a questionnaire (plus all_texts.json metadata)
+        into questionnaire_id/QUESTIONNAIRE_BUNDLE. Returns (bundle path, number of examples, messages).
+        """
+        messages = []
+        examples = DataLoader._load_directory(questionnaire_id, messages)
+
+        blob = bytearray()
+        records = []
+        for ex in examples:
+            record = {k: v for k, v in ex.items() if k not in ("raw_html", "vis_html", "scores")}
+            # Keep only the compact token/score arrays where they re-render to the exact shipped markup
+            if "highlights" not in ex:
+                data = ex["raw_html"].encode("utf-8")
+                record["raw"] = [len(blob), len(data)]
+                blob.extend(data)
+            if "scores" in ex:
+                blob.extend(b"\0" * (-len(blob) % 4))
+                scores = np.ascontiguousarray(ex["scores"], dtype="<f4")
+                record["scores_at"] = [len(blob), scores.shape[0], scores.shape[1]]
+                blob.extend(scores.tobytes())
+            else:
+                data = ex["vis_html"].encode("utf-8")
+                record["vis"] = [len(blob), len(data)]
+                blob.extend(data)
+            records.append(record)
+
+        manifest = json.dumps({
+            "version": 2,
+            "questionnaire": questionnaire_id,
+            "created_at": str(datetime.now()),
+            "examples": records,
+        }).encode("utf-8")
+
+        bundle_path = os.path.join(questionnaire_id, QUESTIONNAIRE_BUNDLE)
+        # Replace atomically so sessions still mapping the previous bundle keep a valid file
+        tmp_path = bundle_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(BUNDLE_MAGIC)
+            f.write(struct.pack("<I", len(manifest)))
+            f.write(manifest)
+            f.write(blob)
+        os.replace(tmp_path, bundle_path)
+        return bundle_path, len(records), messages
+
+    @staticmethod
+    def _load_directory(questionnaire_id, messages):
         """
         Loads examples from the subdirectories of the assigned questionnaire.
+        Problems are appended to messages as (streamlit level, text) for every session to display.
         """
         examples = []
 
         if not os.path.exists(questionnaire_id):
-            st.error(f"Error: Questionnaire folder not found at path: {questionnaire_id}. Cannot load data.")
+            messages.append(("error", f"Error: Questionnaire folder not found at path: {questionnaire_id}. Cannot load data."))
             return []
 
         # Load from both SUB_DIRS (bert_race_visualizations and qwen3_4b_race_visualizations)
@@ -217,21 +2552,22 @@ class DataLoader:
 
             if os.path.exists(path):
                 # Using _parse_directory to load the HTML files
-                examples.extend(DataLoader._parse_directory(path, sub))
+                examples.extend(DataLoader._parse_directory(path, sub, messages))
             else:
-                st.warning(f"Warning: Subdirectory not found at path: {path}. Skipping.")
+                messages.append(("warning", f"Warning: Subdirectory not found at path: {path}. Skipping."))
 
         # Sort by order index (the prefix number in filename)
         examples.sort(key=lambda x: x['order'])
 
         if not examples:
-            st.error(
-                "No examples were loaded. Please ensure the questionnaire files are correctly placed in the designated directory structure.")
+            messages.append((
+                "error",
+                "No examples were loaded. Please ensure the questionnaire files are correctly placed in the designated directory structure."))
 
         return examples
 
     @staticmethod
-    def _parse_directory(path, subdir_name):
+    def _parse_directory(path, subdir_name, messages):
         """
         Parses a directory for raw/vis html pairs.
         Files format: {Order}_{Name}_{Type}.html
@@ -268,7 +2604,9 @@ class DataLoader:
                         pairs[key]['vis_html'] = content
                         pairs[key]['vis_type'] = file_type  # directed or undirected
                 except Exception as e:
-                    st.error(f"Failed to read file {filename}: {e}")
+                    messages.append(("error", f"Failed to read file {filename}: {e}"))
+
+        metadata = DataLoader._read_metadata(path, messages)
 
         # Convert to list
         results = []
@@ -276,13 +2614,161 @@ class DataLoader:
             # Only include complete pairs
             if 'raw_html' in data and 'vis_html' in data:
                 data['id'] = key  # Unique ID for saving answers
+                data.update(DataLoader._example_metadata(metadata, data['name'], data['vis_type']))
+                data.update(DataLoader._example_attributions(data))
                 results.append(data)
 
         return results
 
+    @staticmethod
+    def _read_metadata(path, messages):
+        """Reads the sibling all_texts.json (texts, gold labels, fairness scores, explanation-method order)."""
+        meta_path = os.path.join(path, "all_texts.json")
+        if not os.path.exists(meta_path):
+            return {}
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            messages.append(("warning", f"Warning: Could not read {meta_path}: {e}"))
+            return {}
+
+    @staticmethod
+    def _example_attributions(data):
+        """
+        Tokens ('highlights') and per-model attribution 'scores' recovered from the HTML, only where
+        HighlightRenderer reproduces the file exactly.
+        """
+        highlights, scores, prediction = HighlightRenderer.extract(data['raw_html'], data['vis_html'], data['vis_type'])
+        attributions = {}
+        if highlights is not None:
+            attributions['highlights'] = highlights
+        if scores is not None:
+            scores.flags.writeable = False
+            attributions['scores'] = scores
+            attributions['prediction'] = prediction
+        return attributions
+
+    @staticmethod
+    def _example_metadata(metadata, name, vis_type):
+        """
+        Metadata of one example. Names look like {group}_{pos|neg}_example_{index},
+        where index keys the entries of all_texts.json.
+        """
+        match = re.match(r"(.+)_(pos|neg)_example_(\d+)$", name)
+        if not match:
+            return {}
+        idx = match.group(3)
+        return {
+            'group': match.group(1),
+            'polarity': match.group(2),
+            'example_index': int(idx),
+            'text': metadata.get('texts', {}).get(idx),
+            'label': metadata.get('labels', {}).get(idx),
+            'fairness_score': metadata.get('fairness_scores', {}).get(idx),
+            # Explanation method shown as Model 1, 2, 3
+            'explanation_methods': metadata.get(f'{vis_type}_explanations', {}).get(idx),
+        }
+
+
+class WarmStart:
+    """
+    What a server process does once, so that no annotator pays for it: every questionnaire is loaded and
+    validated on a thread pool, the markup of all its examples is rendered into the example store, and the
+    storage engine, assigner and static assets are opened. Runs on a background thread started by the
+    process's first script run (tools/warm_up.py makes that happen right after a restart), and a session
+    that needs a questionnaire still being loaded waits on the example store's load lock, not a second parse.
+    """
+
+    def __init__(self, questionnaires, workers):
+        self.ready = threading.Event()
+        self.examples = {}  # questionnaire_id -> number of examples loaded
+        self.problems = []  # (questionnaire_id, streamlit level, text)
+        self.elapsed = None
+        # The threads call cached functions, which expect a script run context: they borrow the starting run's
+        self._ctx = get_script_run_ctx()
+        thread = threading.Thread(target=self._run, args=(questionnaires, workers), name="warm-start", daemon=True)
+        add_script_run_ctx(thread, self._ctx)
+        thread.start()
+
+    def _run(self, questionnaires, workers):
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="warm-start",
+                                    initializer=add_script_run_ctx, initargs=(None, self._ctx)) as pool:
+                loads = {q_id: pool.submit(self._load, q_id) for q_id in questionnaires}
+                get_assigner().refresh(get_storage())
+                instruction_text()
+                for example in reference_examples():
+                    for model in example["models"]:
+                        example_highlight_markup(model["html"])
+                page_stylesheet(True)
+                for q_id, load in loads.items():
+                    try:
+                        self.examples[q_id] = load.result()
+                    except Exception as e:
+                        self.problems.append((q_id, "error", f"Could not load questionnaire: {e}"))
+        except Exception as e:
+            self.problems.append(("", "error", f"Warm start failed: {e}"))
+        finally:
+            self.elapsed = time.perf_counter() - started
+            get_metrics().time_to_ready = self.elapsed
+            self.ready.set()
+        for q_id, level, text in self.problems:
+            print(f"[warm-start] {q_id} {level}: {text}", flush=True)
+        loaded = ", ".join(f"{q_id} ({n} examples)" for q_id, n in self.examples.items())
+        print(f"[warm-start] Ready in {self.elapsed:.2f} s: {loaded or 'no questionnaires'}", flush=True)
+
+    def _load(self, questionnaire_id):
+        examples, messages = get_example_store().get(questionnaire_id, DataLoader._load_from_disk)
+        self.problems.extend((questionnaire_id, level, text) for level, text in messages)
+        DataLoader.render_all(questionnaire_id, examples)
+        return len(examples)
+
+    def wait(self, timeout=None):
+        return self.ready.wait(timeout)
+
+
+@st.cache_resource
+def _warm_start(questionnaires):
+    return WarmStart(list(questionnaires), WARM_START_WORKERS)
+
+
+def warm_start():
+    return _warm_start(tuple(QUESTIONNAIRE_DIRS))
+
 
 # --- UTILITY & UI COMPONENTS ---
 
+@st.cache_data
+def page_stylesheet(with_highlights):
+    if with_highlights and HIGHLIGHT_MARKUP == "classes":
+        return CUSTOM_CSS + HighlightRenderer.stylesheet()
+    return CUSTOM_CSS
+
+
+def markdown_html(html, inline_html=None):
+    """
+    st.markdown for trusted HTML. In MEASURE_PAYLOAD mode it also counts the bytes sent, and what the
+    inline-styled original (inline_html) would have cost. inline_html may be a function returning it, so
+    that it is only produced (for a bundle example: decoded or rendered) when it is measured.
+    """
+    st.markdown(html, unsafe_allow_html=True)
+    if MEASURE_PAYLOAD and "payload_meter" in st.session_state:
+        meter = st.session_state["payload_meter"]
+        meter["sent"] += len(html.encode("utf-8"))
+        inline_html = inline_html() if callable(inline_html) else inline_html
+        meter["inline"] += len((html if inline_html is None else inline_html).encode("utf-8"))
+
+
+def report_payload():
+    if MEASURE_PAYLOAD and "payload_meter" in st.session_state:
+        meter = st.session_state["payload_meter"]
+        message = f"HTML payload this rerun: {meter['sent'] / 1024:.1f} KB (inline styles: {meter['inline'] / 1024:.1f} KB)"
+        st.sidebar.caption(message)
+        print(f"[payload] {st.session_state.get('username', '-')}: {message}", flush=True)
+
+
 def login_screen():
     st.title("Human Evaluation Study")
     st.markdown("### Bias in Hate Speech Detection")
@@ -296,34 +2782,29 @@ def login_screen():
             if password == STUDY_PASSWORD:
                 if username:
 
-                    # --- FIX 1: Clear cache on login to prevent stale data ---
-                    DataLoader.load_examples.clear()
-
                     st.session_state["logged_in"] = True
                     st.session_state["username"] = username
                     st.session_state["is_superuser"] = False
+                    st.session_state["save_on_session_end"] = SessionGuard(get_saver(), username)
 
                     # Check if user exists, else create
                     if UserManager.user_exists(username):
                         data = UserManager.load_user(username)
                         st.session_state["user_data"] = data
+                        st.session_state["persisted_user_data"] = copy.deepcopy(data)
+                        st.session_state["clock"] = document_clock(data)
                         st.session_state["current_index"] = data.get("current_index", 0)  # Load current index
                         st.success(f"Welcome back, {username}!")
                     else:
                         # Assign questionnaire
-                        q_id = UserManager.assign_questionnaire()
-                        new_data = {
-                            "username": username,
-                            "questionnaire": q_id,
-                            "joined_at": str(datetime.now()),
-                            "has_seen_instructions": False,  # Restored initial check
-                            "annotations": {},  # Key: example_id, Value: dict of ratings
-                            "final_preference": None,
-                            "current_index": 0  # Set initial index
-                        }
-                        UserManager.save_user(username, new_data)
+                        new_data = UserManager.create_user(username)
+                        if new_data is None:
+                            st.session_state["logged_in"] = False
+                            st.error("Every questionnaire of this study is full. Thank you for your interest!")
+                            return
                         st.session_state["user_data"] = new_data
-                        st.session_state["current_index"] = 0
+                        st.session_state["persisted_user_data"] = copy.deepcopy(new_data)
+                        st.session_state["current_index"] = new_data.get("current_index", 0)
                         # Removed questionnaire ID from success message for annotator
                         st.success(f"Welcome, {username}!")
 
@@ -341,12 +2822,47 @@ def login_screen():
                 st.error("Incorrect password.")
 
 
-def save_current_progress():
-    """Helper to save session state to disk."""
+def next_clock():
+    """
+    This session's hybrid logical clock: microseconds since the epoch, but always past every clock the
+    session has seen, so its writes order after what it loaded even when this server's clock runs behind.
+    """
+    clock = max(time.time_ns() // 1000, st.session_state.get("clock", 0) + 1)
+    st.session_state["clock"] = clock
+    return clock
+
+
+@instrumented("save_current_progress")
+def save_current_progress(debounce=False):
+    """
+    Helper to save session state to disk. Only fields changed since the last save are journaled, stamped
+    with one next_clock() so that storage merges them field by field with what other sessions (tabs) of the
+    same annotator wrote, rather than the last session to save replacing the document.
+    The changes go to the write-behind queue: with debounce=True they wait briefly so a burst of rating
+    clicks becomes one write; otherwise they, and anything still buffered for the user, are due at once.
+    """
     if "username" in st.session_state and "user_data" in st.session_state:
         # Save current index before saving
         st.session_state["user_data"]["current_index"] = st.session_state.get("current_index", 0)
-        UserManager.save_user(st.session_state["username"], st.session_state["user_data"])
+        username = st.session_state["username"]
+
+        persisted = st.session_state.get("persisted_user_data")
+        if persisted is None:
+            get_saver().flush(username)
+            UserManager.save_user(username, st.session_state["user_data"])
+        else:
+            events = diff_documents(persisted, st.session_state["user_data"])
+            delay = SAVE_DEBOUNCE_SECONDS if debounce else 0
+            if events:
+                clock = next_clock()
+                for event in events:
+                    event["c"] = clock
+                get_saver().submit(username, events, delay)
+            elif not debounce:
+                get_saver().schedule(username, delay)
+            if not events:
+                return
+        st.session_state["persisted_user_data"] = copy.deepcopy(st.session_state["user_data"])
 
 
 def get_rating_label(rating, q_type):
@@ -369,135 +2885,62 @@ def get_rating_label(rating, q_type):
     return labels[q_type].get(rating, "")
 
 
-def render_example_section(title, input_text, model_pred, explanation_type, html_m1, html_m2,
-                           m1_q1_rating, m1_q1_text, m1_q2_rating, m1_q2_text,
-                           m2_q1_rating, m2_q1_text, m2_q2_rating, m2_q2_text,
-                           pred_bg_color="transparent", pred_text_color="black"):
+def render_example_section(example):
     """Helper to render the example blocks consistently with full text and questions."""
     # Note: Using an expander here makes it collapsible on the sidebar
-    with st.expander(title, expanded=False):
-        st.markdown(f"**Input Text:** `{input_text}`")
+    with st.expander(example["title"], expanded=False):
+        st.markdown(f"**Input Text:** `{example['input_text']}`")
 
         # Styled Prediction Label
         st.markdown(
             f"""
             <div style="margin-bottom: 10px;">
                 <strong>Model Prediction:</strong> 
-                <span style="background-color:{pred_bg_color}; color:{pred_text_color}; padding: 4px 8px; border-radius: 4px; font-weight: bold;">
-                    {model_pred}
+                <span style="background-color:{PREDICTION_COLORS[example['prediction']]}; color:black; padding: 4px 8px; border-radius: 4px; font-weight: bold;">
+                    {example['prediction']}
                 </span> 
-                | <strong>Explanation Type:</strong> {explanation_type}
+                | <strong>Explanation Type:</strong> {example['vis_type'].capitalize()}
             </div>
             """,
             unsafe_allow_html=True
         )
 
         # Note: In the sidebar this is often too wide, but needed for completeness
-        col1, col2 = st.columns(2)
-
-        # --- Model 1 Column (Simplified for Sidebar View) ---
-        with col1:
-            st.markdown("##### Model 1")
-            st.components.v1.html(html_m1, height=180, scrolling=True)
-
-            st.markdown("**Question 1 (Interpretability):**")
-            st.info(f"**Rating: {m1_q1_rating}**")
-            st.write(f"*{m1_q1_text}*")
+        for i, (col, model) in enumerate(zip(st.columns(len(example["models"])), example["models"]), start=1):
+            # --- Model Column (Simplified for Sidebar View) ---
+            with col:
+                st.markdown(f"##### Model {i}")
+                with st.container(height=180):
+                    markdown_html(example_highlight_markup(model["html"]), model["html"])
 
-            st.markdown("**Question 2 (Race Bias):**")
-            st.info(f"**Rating: {m1_q2_rating}**")
-            st.write(f"*{m1_q2_text}*")
+                for question, heading in (("interpretability", "Question 1 (Interpretability)"),
+                                          ("bias", "Question 2 (Race Bias)")):
+                    st.markdown(f"**{heading}:**")
+                    st.info(f"**Rating: {model[question]['rating']}**")
+                    st.write(f"*{model[question]['explanation']}*")
 
-        # --- Model 2 Column (Simplified for Sidebar View) ---
-        with col2:
-            st.markdown("##### Model 2")
-            st.components.v1.html(html_m2, height=180, scrolling=True)
 
-            st.markdown("**Question 1 (Interpretability):**")
-            st.info(f"**Rating: {m2_q1_rating}**")
-            st.write(f"*{m2_q1_text}*")
-
-            st.markdown("**Question 2 (Race Bias):**")
-            st.info(f"**Rating: {m2_q2_rating}**")
-            st.write(f"*{m2_q2_text}*")
+@st.cache_data
+def example_highlight_markup(html):
+    """Inline markup for an instruction example, rewritten once per process rather than per rerun."""
+    if HIGHLIGHT_MARKUP == "classes":
+        return HighlightRenderer.to_classes(html)
+    return html
 
 
 def render_examples_reference():
     st.subheader("Examples Reference")
     st.write("Review the examples annotated by the study designers below.")
 
-    # --- EXAMPLE 1 ---
-    render_example_section(
-        title="Example 1",
-        input_text="but black lives matter",
-        model_pred="Not Toxic",
-        pred_bg_color="rgba(0, 170, 0, 1.0)",
-        pred_text_color="black",
-        explanation_type="Directed",
-        html_m1=HTML_EXAMPLE_1_MODEL_1,
-        html_m2=HTML_EXAMPLE_1_MODEL_2,
-
-        m1_q1_rating=4,
-        m1_q1_text="The words \"Matter\" and \"lives\" have strong and slight green highlights, which reasonably support the non-toxic prediction. The explanation contains very little noise, so the model's reasoning is fairly easy to follow.",
-        m1_q2_rating=1,
-        m1_q2_text="The race-related term \"black\" does not appear to influence the model's decision. Replacing it with another racial group would likely cause little to no change in the prediction, so the race-bias score is low.",
-
-        m2_q1_rating=3,
-        m2_q1_text="The word \"black\" is highlighted in red and pushes the model toward a toxic prediction. Although this indicates biased reasoning, it still makes the model's logic clear and therefore interpretable. However, the model also assigns a strong red highlight to a non-semantic token (a full stop), which introduces noise and makes the reasoning less straightforward. This reduces the interpretability score.",
-        m2_q2_rating=4,
-        m2_q2_text="The word \"black\" is strongly associated with toxicity in this explanation, so replacing it with another racial group would likely affect the model's behavior. The bias score is therefore high. However, because the model's final prediction is still non-toxic, the perturbation may not fully reverse the prediction or drastically change the confidence."
-    )
-
-    # --- EXAMPLE 2 ---
-    render_example_section(
-        title="Example 2",
-        input_text="whites & their corrupt boss johann rupert we'll not let their stooges to rule on us",
-        model_pred="Toxic",
-        pred_bg_color="rgba(220, 0, 0, 1.0)",
-        pred_text_color="black",
-        explanation_type="Directed",
-        html_m1=HTML_EXAMPLE_2_MODEL_1,
-        html_m2=HTML_EXAMPLE_2_MODEL_2,
-
-        m1_q1_rating=3,
-        m1_q1_text="The model uses \"whites\" as a strong indicator of toxicity. Although this reflects biased reasoning, it does make the model's decision path clear, which contributes to interpretability. However, several irrelevant words, such as \"their\" and \"boss\", also receive attribution, and their connection to toxicity is unclear. This additional noise makes the explanation somewhat harder to follow.",
-        m1_q2_rating=5,
-        m1_q2_text="The model relies heavily on the term \"whites\" to produce the toxic prediction. If this identity term were replaced with another racial group, the prediction would very likely change, indicating a high degree of race bias.",
-
-        m2_q1_rating=4,
-        m2_q1_text="Model 2 places most of its attribution on \"corrupt\", which is a reasonable indicator for toxicity. The word \"stooges\" also contributes appropriately as an offensive term. Some irrelevant words receive minor attribution, but overall the explanation is relatively clear.",
-        m2_q2_rating=2,
-        m2_q2_text="The model does not rely strongly on the explicit group term \"white\" for its prediction. However, it does attribute some importance to the racially identifiable name \"johann rupert\", which means that changing the referenced race might still influence the prediction slightly. Therefore, the level of race bias is low but not entirely absent."
-    )
-
-    # --- EXAMPLE 3 ---
-    render_example_section(
-        title="Example 3",
-        input_text="all taxpayers . most taxpayers are black.",
-        model_pred="Not Toxic",
-        pred_bg_color="rgba(0, 170, 0, 1.0)",
-        pred_text_color="black",
-        explanation_type="Undirected",
-        html_m1=HTML_EXAMPLE_3_MODEL_1,
-        html_m2=HTML_EXAMPLE_3_MODEL_2,
-
-        m1_q1_rating=2,
-        m1_q1_text="The explanation highlights almost every word as important, making it difficult to understand the model's actual reasoning. Because it provides very little meaningful structure or focus, the interpretability is low.",
-        m1_q2_rating=3,
-        m1_q2_text="The word \"black\" receives substantial attribution. Although other words also contribute to the prediction, the model may still be relying partly on race-related cues, suggesting a moderate level of race bias.",
-
-        m2_q1_rating=3,
-        m2_q1_text="The model uses \"taxpayers\" and \"black\" as evidence for its prediction, which is somewhat reasonable. However, there is noticeable noise in the explanation, for example, words like \"all\" and the period receiving attribution, which makes the reasoning less clear.",
-        m2_q2_rating=4,
-        m2_q2_text="The term \"black\" is treated as important evidence for the prediction. Replacing it with another group could substantially change the model's prediction or the confidence of that prediction."
-    )
+    for example in reference_examples():
+        render_example_section(example)
 
 
 def instructions_page():
     st.title("Study Instructions")
 
     # Main Instruction Text
-    st.markdown(INSTRUCTION_TEXT, unsafe_allow_html=True)
+    markdown_html(instruction_text())
 
     st.divider()
     st.header("Examples")
@@ -518,54 +2961,266 @@ def instructions_page():
         st.rerun()
 
 
-def main_study_interface():
-    user_data = st.session_state["user_data"]
-    username = st.session_state["username"]
+# The sidebar, the Step 1 form and each model's rating column are fragments: a click inside one reruns
+# only that function. They hand state to each other through st.session_state ("current_index" and the
+# annotations in "user_data") and escalate to a full rerun (st.rerun()) only when a change must show up
+# elsewhere on the page: navigation, a Step 1 submission, or a datapoint becoming fully rated.
+RATING_OPTIONS = [1, 2, 3, 4, 5]
+Q1_FULL = "Question 1 (Interpretability): How easy is it to understand the model's reasoning based on this explanation?"
+Q2_FULL = "Question 2 (Race Bias): How much do you think the model's prediction contains race bias?"
 
-    # Load examples (cached in session to avoid re-parsing)
-    if "examples" not in st.session_state:
-        st.session_state["examples"] = DataLoader.load_examples(user_data['questionnaire'])
 
-    examples = st.session_state["examples"]
-    total_ex = len(examples)
+class ProgressIndex:
+    """
+    Completion state of one annotator's questionnaire, kept per session and updated one annotation at a
+    time. A datapoint counts as completed once all three models are rated (a Step 1 answer alone does not).
 
-    # --- LEFT PANEL (Instructions & Examples) ---
-    with st.expander("Instructions & Examples Reference (Click to Expand)", expanded=False):
-        st.markdown(INSTRUCTION_TEXT, unsafe_allow_html=True)
-        st.divider()
-        render_examples_reference()
+    An id can occur more than once in a questionnaire (the same example in two folders). Annotations are
+    keyed by id, so only its first position is a datapoint here; later ones are in `duplicates` and count
+    neither as completed nor as incomplete, as in tools/export_analysis.py.
+    """
+
+    def __init__(self, examples, annotations):
+        self.examples = examples
+        self.annotations = annotations
+        self.positions = {}  # example id -> position of its first occurrence
+        self.duplicates = {}  # later position -> first position of the same id
+        for i, ex in enumerate(examples):
+            if ex['id'] in self.positions:
+                self.duplicates[i] = self.positions[ex['id']]
+            else:
+                self.positions[ex['id']] = i
+        self.total = len(self.positions)
+        self.done = np.zeros(len(examples), dtype=bool)
+        for ex_id, annotation in annotations.items():
+            if ex_id in self.positions and all_models_rated(annotation):
+                self.done[self.positions[ex_id]] = True
+        self.completed_count = int(self.done.sum())
+        # sorted positions
+        self.incomplete = [i for i in np.flatnonzero(~self.done).tolist() if i not in self.duplicates]
+
+    def update(self, ex_id, annotation):
+        position = self.positions.get(ex_id)
+        complete = all_models_rated(annotation)
+        if position is None or self.done[position] == complete:
+            return
+        self.done[position] = complete
+        if complete:
+            self.completed_count += 1
+            del self.incomplete[bisect.bisect_left(self.incomplete, position)]
+        else:
+            self.completed_count -= 1
+            bisect.insort(self.incomplete, position)
+
+    def next_incomplete(self, after):
+        """First incomplete position after `after`, wrapping around; None once everything is done."""
+        if not self.incomplete:
+            return None
+        i = bisect.bisect_right(self.incomplete, after)
+        return self.incomplete[i % len(self.incomplete)]
+
+
+def get_progress_index(examples):
+    index = st.session_state.get("progress_index")
+    annotations = st.session_state["user_data"]["annotations"]
+    # Rebuilt after a login, or when the shared example list is replaced because the files changed on disk
+    if index is None or index.examples is not examples or index.annotations is not annotations:
+        index = ProgressIndex(examples, annotations)
+        st.session_state["progress_index"] = index
+    return index
+
+
+def set_annotation(ex_id, annotation):
+    st.session_state["user_data"]["annotations"][ex_id] = annotation
+    index = st.session_state.get("progress_index")
+    if index is not None:
+        index.update(ex_id, annotation)
 
-    # --- RIGHT PANEL (Native Sidebar for Progress/Navigation) ---
-    with st.sidebar:
-        st.header(f"Annotator: {username}")
+
+def set_nav_page(page):
+    st.session_state["nav_page"] = page
+
+
+def go_to_example(index):
+    st.session_state["current_index"] = index
+    st.session_state["nav_page"] = index // NAV_PAGE_SIZE
+
+    # Save current index for persistence
+    st.session_state["user_data"]["current_index"] = index
+    # Optimistic: show the target datapoint now and let the index reach disk with the next debounced write
+    save_current_progress(debounce=True)
+
+
+@st.fragment
+def progress_panel(examples):
+    with timed("progress_panel"):
+        progress = get_progress_index(examples)
+        total_ex = len(examples)
+        current_idx = st.session_state.get("current_index", 0)
+
+        st.header(f"Annotator: {st.session_state['username']}")
 
         st.subheader("Progress")
 
-        completed_count = len(user_data["annotations"])
-        st.progress(completed_count / total_ex)
-        st.write(f"{completed_count} / {total_ex} completed")
+        st.progress(progress.completed_count / progress.total if progress.total else 0.0)
+        st.write(f"{progress.completed_count} / {progress.total} completed")
+
+        next_incomplete = progress.next_incomplete(current_idx)
+        if st.button("Jump to next incomplete", key="nav_next_incomplete", disabled=next_incomplete is None):
+            go_to_example(next_incomplete)
+            # Clicks inside the fragment rerun only the fragment; the main area has to follow
+            st.rerun()
 
         st.divider()
         st.write("Examples:")
 
+        # Only one page of datapoints is listed, so the panel stays the same size for any questionnaire length
+        n_pages = max(1, -(-total_ex // NAV_PAGE_SIZE))
+        page = min(st.session_state.get("nav_page", current_idx // NAV_PAGE_SIZE), n_pages - 1)
+        if n_pages > 1:
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                # Callbacks run before the rerun, so the new page is drawn right away
+                st.button("‹", key="nav_page_prev", disabled=page == 0,
+                          on_click=set_nav_page, args=(page - 1,))
+            with col_next:
+                st.button("›", key="nav_page_next", disabled=page == n_pages - 1,
+                          on_click=set_nav_page, args=(page + 1,))
+            with col_page:
+                st.caption(f"Page {page + 1} of {n_pages}")
+        st.session_state["nav_page"] = page
+
         # Navigation list
-        for i, ex in enumerate(examples):
-            ex_id = ex['id']
-            is_done = ex_id in user_data["annotations"] and user_data["annotations"][ex_id].get("ratings")
-            icon = "✅" if is_done else "⬜"
+        for i in range(page * NAV_PAGE_SIZE, min((page + 1) * NAV_PAGE_SIZE, total_ex)):
+            if i in progress.duplicates:
+                label = f"↪ Datapoint {i + 1} (same as {progress.duplicates[i] + 1})"
+            else:
+                # Show only Datapoint X
+                label = f"{'✅' if progress.done[i] else '⬜'} Datapoint {i + 1}"
+            if st.button(label, key=f"nav_{i}"):
+                go_to_example(i)
+                st.rerun()
+
+
+@st.fragment
+def step1_form(ex_id):
+    with timed("step1_form"):
+        user_data = st.session_state["user_data"]
+        toxic_val = user_data["annotations"].get(ex_id, {}).get("toxic_label", None)
 
-            # Show only Datapoint X
-            label = f"Datapoint {i + 1}"
+        # Use a form to capture the Step 1 answer, which forces a clear submission action
+        with st.form(key=f"step1_form_{ex_id}", clear_on_submit=False):
+            # Set a key in session state for the radio selection inside the form,
+            # initialised from the saved value if available
+            radio_key = f"toxic_{ex_id}_radio"
+            if radio_key not in st.session_state:
+                st.session_state[radio_key] = toxic_val
 
-            if st.button(f"{icon} {label}", key=f"nav_{i}"):
-                st.session_state["current_index"] = i
+            radio_options = ["Toxic", "Not Toxic"]
+            initial_index = (radio_options.index(st.session_state[radio_key])
+                             if st.session_state[radio_key] in radio_options else None)
 
-                # Save current index on navigation click
-                st.session_state["user_data"]["current_index"] = i
+            toxic_input = st.radio("Is this text Toxic?", radio_options, index=initial_index, key=radio_key)
+
+            # We cannot dynamically disable the button inside a form based on unsubmitted selection.
+            # Instead, we allow submission and validate afterwards.
+            step1_submitted = st.form_submit_button("Submit Step 1 Classification", type="primary")
+
+        if step1_submitted:
+            if toxic_input is None:
+                st.warning("Please select an option before submitting.")
+            elif toxic_input != toxic_val:
+                set_annotation(ex_id, {**user_data["annotations"].get(ex_id, {}), "toxic_label": toxic_input})
                 save_current_progress()
 
+                # Step 2 & 3 live outside this fragment
                 st.rerun()
 
+
+@st.fragment
+def rating_column(ex_id, model_idx):
+    with timed(f"rating_column_{model_idx}"):
+        user_data = st.session_state["user_data"]
+        annotation = user_data["annotations"].get(ex_id, {})
+        model_key = f"model_{model_idx}"
+
+        # Default values from saved data
+        saved_m = annotation.get("ratings", {}).get(model_key, {})
+        saved_q1 = saved_m.get("interpretability", None)
+        saved_q2 = saved_m.get("bias", None)
+
+        st.markdown(f"#### Model {model_idx}")
+
+        # Show full question text
+        st.markdown(f"**{Q1_FULL}**")
+        q1 = st.radio(
+            "Interpretability rating:",  # Shortened label for radio button itself
+            RATING_OPTIONS,
+            format_func=lambda x: f"{x} - {get_rating_label(x, 'interpretability')}",
+            index=(RATING_OPTIONS.index(saved_q1) if saved_q1 in RATING_OPTIONS else None),
+            key=f"{ex_id}_m{model_idx}_q1",
+        )
+
+        st.markdown(f"**{Q2_FULL}**")
+        q2 = st.radio(
+            "Race Bias rating:",
+            RATING_OPTIONS,
+            format_func=lambda x: f"{x} - {get_rating_label(x, 'bias')}",
+            index=(RATING_OPTIONS.index(saved_q2) if saved_q2 in RATING_OPTIONS else None),
+            key=f"{ex_id}_m{model_idx}_q2",
+        )
+
+        # --- SAVE STEP 2/3 ANNOTATION (On change, not explicitly button press) ---
+        if (q1, q2) == (saved_q1, saved_q2):
+            return
+
+        was_complete = all_models_rated(annotation)
+        # Only the answered questions of this model change; another tab may have rated the rest
+        answered = {q: v for q, v in (("interpretability", q1), ("bias", q2)) if v is not None}
+        updated = {
+            **annotation,
+            "ratings": {**annotation.get("ratings", {}), model_key: {**saved_m, **answered}},
+            "timestamp": str(datetime.now()),
+        }
+        set_annotation(ex_id, updated)
+        # Rating clicks come in bursts; coalesce them into one journal append
+        save_current_progress(debounce=True)
+
+        # The Next button, the progress panel and the final question depend on completeness
+        if all_models_rated(updated) != was_complete:
+            st.rerun()
+
+
+@st.fragment
+def reference_panel():
+    """
+    Instructions & examples, built only while the annotator has the panel open. Unlike a collapsed
+    expander, a closed toggle sends nothing, and opening or closing it reruns only this fragment.
+    """
+    with timed("reference_panel"):
+        if st.toggle("Show Instructions & Examples Reference", key="show_reference"):
+            with st.container(border=True):
+                markdown_html(instruction_text())
+                st.divider()
+                render_examples_reference()
+
+
+@instrumented("main_study_interface")
+def main_study_interface():
+    user_data = st.session_state["user_data"]
+
+    # Shared read-only examples; re-parsed only when the questionnaire files change on disk
+    examples = DataLoader.load_examples(user_data['questionnaire'])
+    total_ex = len(examples)
+
+    # --- LEFT PANEL (Instructions & Examples) ---
+    reference_panel()
+
+    # --- RIGHT PANEL (Native Sidebar for Progress/Navigation) ---
+    # Fragments cannot write into containers created outside them, so the fragment is called inside the sidebar
+    with st.sidebar:
+        progress_panel(examples)
+
     # Main Content Area
     current_idx = st.session_state.get("current_index", 0)
 
@@ -581,71 +3236,20 @@ def main_study_interface():
     ex = examples[current_idx]
     ex_id = ex['id']
 
-    # Load existing annotation if present
-    existing_anno = user_data["annotations"].get(ex_id, {})
-
     # Update header to show Datapoint X
     st.header(f"Datapoint {current_idx + 1} of {total_ex}")
 
     # --- STEP 1: TOXICITY ---
     st.subheader("Step 1: Your Judgment (Toxic or Not Toxic)")
-    st.markdown(ex['raw_html'], unsafe_allow_html=True)
+    markdown_html(DataLoader.markup(user_data['questionnaire'], ex, 'raw_html'), lambda: ex['raw_html'])
     st.write("")  # Spacer
 
-    # Use a form to capture the Step 1 answer, which forces a clear submission action
-    with st.form(key=f"step1_form_{ex_id}", clear_on_submit=False):
-        toxic_val = existing_anno.get("toxic_label", None)
+    step1_form(ex_id)
 
-        # Streamlit radio buttons return the selected value. We use the key to grab the current state.
-        # We need to initialize the state outside the radio if we want the form button to read it correctly.
-
-        # Set a key in session state for the radio selection inside the form
-        radio_key = f"toxic_{ex_id}_radio"
-
-        # Initialize session state for the radio if not present, using saved value if available
-        if radio_key not in st.session_state:
-            st.session_state[radio_key] = toxic_val
-
-        # Find the index for the radio button based on saved/current session state value
-        radio_options = ["Toxic", "Not Toxic"]
-        initial_index = (radio_options.index(st.session_state[radio_key])
-                         if st.session_state[radio_key] in radio_options else None)
-
-        toxic_input = st.radio(
-            "Is this text Toxic?",
-            radio_options,
-            index=initial_index,
-            key=radio_key
-        )
-
-        # We cannot dynamically disable the button inside a form based on unsubmitted selection.
-        # Instead, we allow submission and validate afterwards.
-        step1_submitted = st.form_submit_button("Submit Step 1 Classification", type="primary")
-
-    # --- Step 1 Submission Logic ---
-    # We submit if the button was clicked OR if the radio selection changed and wasn't previously submitted (less reliable).
-    # Since we have a submit button, we rely on `step1_submitted`.
-
-    if step1_submitted:
-        # Check again if a selection was actually made (should be true if button wasn't disabled)
-        if toxic_input is not None:
-            # --- FIX: Initialize dictionary if key does not exist ---
-            if ex_id not in user_data["annotations"]:
-                user_data["annotations"][ex_id] = {}
-
-            # Save the new toxic label
-            user_data["annotations"][ex_id]["toxic_label"] = toxic_input
-            save_current_progress()
+    # Render the likely next stops while the annotator works on this one
+    DataLoader.prefetch(user_data['questionnaire'], examples,
+                        (current_idx + 1, current_idx - 1, get_progress_index(examples).next_incomplete(current_idx)))
 
-            # Since the form submission triggers a rerun, the toxic_val used below will be updated.
-            # We explicitly set the session state for the toxic_input to reflect the submission
-            # st.session_state[radio_key] = toxic_input # This is done implicitly by the radio button
-
-            st.rerun()
-        else:
-            st.warning("Please select an option before submitting.")
-
-    # Reload toxic_val after potential save/rerun
     toxic_val = user_data["annotations"].get(ex_id, {}).get("toxic_label", None)
 
     # --- Conditional Display for Step 2 & 3 ---
@@ -655,104 +3259,39 @@ def main_study_interface():
         st.write("Please review the model predictions and explanations below, and provide your ratings.")
 
         # Render the visualization HTML (Contains Model 1, 2, 3)
-        st.markdown(ex['vis_html'], unsafe_allow_html=True)
+        markdown_html(DataLoader.markup(user_data['questionnaire'], ex, 'vis_html'), lambda: ex['vis_html'])
 
         st.write("---")
 
-        # Forms for 3 Models
+        # One fragment per model, so a rating click reruns only its own column
         cols = st.columns(3)
-        ratings = {}
-
-        # Full questions text for display (FIX 2)
-        Q1_FULL = "Question 1 (Interpretability): How easy is it to understand the model's reasoning based on this explanation?"
-        Q2_FULL = "Question 2 (Race Bias): How much do you think the model's prediction contains race bias?"
-
-        all_models_rated = True
-
         for i in range(1, 4):
             with cols[i - 1]:
-                # Default values from saved data
-                saved_m = existing_anno.get("ratings", {}).get(f"model_{i}", {})
-                saved_q1 = saved_m.get("interpretability", None)
-                saved_q2 = saved_m.get("bias", None)
-
-                st.markdown(f"#### Model {i}")
-
-                # Show full question text
-                st.markdown(f"**{Q1_FULL}**")
-                q1 = st.radio(
-                    "Interpretability rating:",  # Shortened label for radio button itself
-                    [1, 2, 3, 4, 5],
-                    format_func=lambda x: f"{x} - {get_rating_label(x, 'interpretability')}",
-                    index=([1, 2, 3, 4, 5].index(saved_q1) if saved_q1 in [1, 2, 3, 4, 5] else None),
-                    key=f"{ex_id}_m{i}_q1",
-                )
-
-                # Show full question text
-                st.markdown(f"**{Q2_FULL}**")
-                q2 = st.radio(
-                    "Race Bias rating:",  # Shortened label for radio button itself
-                    [1, 2, 3, 4, 5],
-                    format_func=lambda x: f"{x} - {get_rating_label(x, 'bias')}",
-                    index=([1, 2, 3, 4, 5].index(saved_q2) if saved_q2 in [1, 2, 3, 4, 5] else None),
-                    key=f"{ex_id}_m{i}_q2",
-                )
-
-                ratings[f"model_{i}"] = {"interpretability": q1, "bias": q2}
-
-                if q1 is None or q2 is None:
-                    all_models_rated = False
-
-        # --- SAVE STEP 2/3 ANNOTATION (On change, not explicitly button press) ---
-        current_ratings_data = {
-            "toxic_label": toxic_val,
-            "ratings": ratings,
-            "timestamp": str(datetime.now())
-        }
-
-        # Check if new ratings are different or if it's the first time submitting
-        if current_ratings_data != existing_anno:
-            # Ensure top level key exists (though handled by Step 1, safety check)
-            if ex_id not in user_data["annotations"]:
-                user_data["annotations"][ex_id] = {}
-
-            user_data["annotations"][ex_id] = current_ratings_data
-            save_current_progress()
+                rating_column(ex_id, i)
 
         st.write("---")
         col_prev, col_next = st.columns([1, 1])
 
         with col_prev:
             if current_idx > 0:
-                if st.button("← Previous Datapoint"):
-                    st.session_state["current_index"] = current_idx - 1
-
-                    # Save current index for persistence
-                    st.session_state["user_data"]["current_index"] = current_idx - 1
-                    save_current_progress()
-
-                    st.rerun()
+                # As a callback the index changes before the rerun, so navigating costs one script run, not two
+                st.button("← Previous Datapoint", on_click=go_to_example, args=(current_idx - 1,))
 
         with col_next:
             if current_idx < total_ex - 1:
                 # Disable next button if not all models rated
-                if st.button("Next Datapoint →", type="primary", disabled=not all_models_rated):
-                    st.session_state["current_index"] = current_idx + 1
-
-                    # Save current index for persistence
-                    st.session_state["user_data"]["current_index"] = current_idx + 1
-                    save_current_progress()
-
-                    st.rerun()
+                rated = all_models_rated(user_data["annotations"].get(ex_id, {}))
+                st.button("Next Datapoint →", type="primary", disabled=not rated,
+                          on_click=go_to_example, args=(current_idx + 1,))
             else:
                 st.success("You have reached the last example.")
     else:
-        # Since we use a form, the submission logic is inside the 'if step1_submitted' block.
         # This message provides context for why Step 2/3 isn't visible.
         st.info("Please complete Step 1 to proceed to Model Evaluation (Step 2 & 3).")
 
     # --- FINAL PREFERENCE QUESTION (Only show if ALL 48 completed) ---
-    if completed_count == total_ex and total_ex > 0:
+    progress = get_progress_index(examples)
+    if progress.completed_count == progress.total and total_ex > 0:
         st.divider()
         st.subheader("Step 4: Final Preference Question")
         st.warning("Please ensure you have reviewed all 48 examples before submitting your final preference.")
@@ -776,106 +3315,275 @@ def main_study_interface():
             st.success("🎉 Thank you! You have completed the study and your responses have been saved.")
 
 
+def server_health():
+    st.markdown("### Server health")
+    warm = warm_start()
+    if warm.ready.is_set():
+        problems = f" · {len(warm.problems)} questionnaire problems in the server log" if warm.problems else ""
+        st.caption(f"Warm start: ready {warm.elapsed:.2f} s after the first script run of this process{problems}")
+    else:
+        st.caption("Warm start: still loading questionnaires")
+    if not INSTRUMENTATION:
+        st.caption("Start the app with INSTRUMENTATION=1 to collect timings, bytes written and cache statistics.")
+        return
+
+    metrics = get_metrics()
+    counters = metrics.counters
+
+    def hit_rate(cache):
+        hits, misses = counters.get(("cache_hits", cache), 0), counters.get(("cache_misses", cache), 0)
+        return f"{hits / (hits + misses):.0%}" if hits + misses else "–"
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Active sessions", metrics.active_sessions(), help=f"Sessions with a rerun in the last {ACTIVE_SESSION_WINDOW} s")
+    col2.metric("Bytes written", f"{counters.get(('bytes_written', ''), 0) / 1024:.1f} KB")
+    col3.metric("Example cache hits", hit_rate("examples"))
+    col4.metric("Markup cache hits", hit_rate("rendered_markup"))
+    col5.metric("User cache hits", hit_rate("user_documents"))
+
+    st.caption(f"Timings over the last {len(metrics.timings)} observations (ring buffer of {metrics.timings.maxlen})")
+    st.dataframe(metrics.timing_summary(), hide_index=True)
+
+    st.download_button("Download Prometheus metrics", data=metrics.prometheus(), file_name="bias_study.prom",
+                       mime="text/plain")
+
+
 def superuser_interface():
     st.title("Superuser Dashboard")
     st.write("Welcome, Superuser.")
     st.markdown("### Download Study Data")
     st.info(f"Data Directory: `{DATA_DIR}`")
 
-    # Get list of all user files
-    json_files = glob.glob(os.path.join(DATA_DIR, "*.json"))
+    # Get list of all users from the storage engine
+    user_summaries = UserManager.list_user_summaries()
 
-    st.write(f"Total user files found: **{len(json_files)}**")
+    st.write(f"Total users found: **{len(user_summaries)}**")
 
-    if st.button("Create ZIP Archive"):
-        # Create a zip file of the data directory
-        # shutil.make_archive base_name (no extension), format, root_dir, base_dir
-        # We want to zip the contents of DATA_DIR
+    # The ZIPs are built in memory only when a button is clicked, on Streamlit's download thread
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    col1, col2 = st.columns(2)
+    col1.download_button("Download all data (ZIP)", data=build_export, file_name=f"bias_study_data_{timestamp}.zip",
+                         mime="application/zip", key="export_full", on_click="ignore")
+    col2.download_button("Download changes since last export (ZIP)", data=functools.partial(build_export, incremental=True),
+                         file_name=f"bias_study_changes_{timestamp}.zip", mime="application/zip",
+                         key="export_incremental", on_click="ignore")
+    exported_at = last_export_time()
+    st.caption(f"Last export: {exported_at[:19]}" if exported_at else "No export yet: the first incremental export contains everything.")
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        archive_name = f"bias_study_data_{timestamp}"
+    st.divider()
+    server_health()
 
-        try:
-            zip_path = shutil.make_archive(archive_name, 'zip', DATA_DIR)
-            st.success(f"Archive created successfully: `{zip_path}`")
-
-            with open(zip_path, "rb") as f:
-                st.download_button(
-                    label="Download Data ZIP",
-                    data=f,
-                    file_name=f"{archive_name}.zip",
-                    mime="application/zip"
-                )
-        except Exception as e:
-            st.error(f"Error creating archive: {e}")
+    st.divider()
+    questionnaire_overview()
 
     st.divider()
+    agreement_panel()
+
+    st.divider()
+    user_list(len(user_summaries))
+
+
+def datapoint_count(questionnaire_id):
+    """Datapoints of a questionnaire in the unit of n_completed and ProgressIndex: distinct example ids."""
+    examples = get_example_store().get(questionnaire_id, DataLoader._load_from_disk)[0]
+    return len({ex['id'] for ex in examples})
+
+
+def questionnaire_overview():
+    st.markdown("### Questionnaires")
+    stats = UserManager.questionnaire_stats()
+    policies = get_assigner().queue.policies
+    rows = []
+    # Discovered questionnaires first, in assignment order, then any only found in user data
+    for q_id in QUESTIONNAIRE_DIRS + sorted((str(q) for q in stats if q not in QUESTIONNAIRE_DIRS)):
+        agg = stats.get(q_id, {"started": 0, "preference_set": 0, "completed": {}})
+        total = datapoint_count(q_id) if q_id in QUESTIONNAIRE_DIRS else 0
+        weight, cap = policies.get(q_id, (None, None))
+        rows.append({
+            "Questionnaire": q_id,
+            "Weight": weight,
+            "Cap": cap,
+            "Started": agg["started"],
+            "Finished": sum(n for done, n in agg["completed"].items() if total and done >= total),
+            "Final preference set": agg["preference_set"],
+        })
+    st.caption(f"New annotators are balanced by {ASSIGNMENT_BALANCE} annotators"
+               + (f" (finished, or active in the last {ASSIGNMENT_ABANDON_HOURS:g} h)" if ASSIGNMENT_BALANCE == "completed" else ""))
+    st.dataframe(rows, hide_index=True)
+
+
+def agreement_rows(snapshot, intervals):
+    rows = []
+    for q_id in sorted(snapshot):
+        for label, (counts, values, n_categories, metric) in snapshot[q_id].items():
+            n_raters = int((values > 0).any(axis=1).sum())
+            if not n_raters:
+                continue
+            stats = agreement.agreement(counts, values, n_categories, metric)
+            row = {
+                "Questionnaire": q_id,
+                "Measure": label,
+                "Raters": n_raters,
+                "Items rated 2+ times": int((counts.sum(axis=1) >= 2).sum()),
+                "Scale": metric,
+                "Krippendorff α": stats["alpha"],
+                "Fleiss κ": stats["fleiss_kappa"],
+                "Cohen κ (mean pairwise)": stats["cohen_kappa"],
+            }
+            ci = (intervals or {}).get((q_id, label))
+            if ci:
+                row["α 95% CI"] = "{:.2f} – {:.2f}".format(*ci["alpha"])
+                row["Fleiss κ 95% CI"] = "{:.2f} – {:.2f}".format(*ci["fleiss_kappa"])
+            rows.append(row)
+    return rows
+
+
+def start_agreement_bootstrap(snapshot):
+    tables = {(q_id, label): table for q_id, measures in snapshot.items() for label, table in measures.items()}
+    st.session_state["agreement_bootstrap"] = (
+        datetime.now().strftime("%H:%M:%S"),
+        agreement_worker().submit(agreement.bootstrap, tables, AGREEMENT_BOOTSTRAP_SAMPLES))
+
+
+@st.fragment
+def agreement_panel():
+    """Computed from the live rating matrices (see AgreementIndex) each time the fragment reruns."""
+    st.markdown("### Inter-annotator agreement")
+    index = get_agreement_index()
+    index.refresh(get_storage())
+    snapshot = index.snapshot()
+
+    col1, col2, col3 = st.columns(3)
+    col1.button("Bootstrap 95% CIs", key="agreement_ci", on_click=start_agreement_bootstrap, args=(snapshot,),
+                help=f"{AGREEMENT_BOOTSTRAP_SAMPLES} resamples of the items, run in a worker process")
+    col2.button("Refresh", key="agreement_refresh")
+    if col3.button("Rebuild from storage", key="agreement_rebuild"):
+        index.rebuild(get_storage())
+        snapshot = index.snapshot()
+
+    intervals = None
+    started_at, job = st.session_state.get("agreement_bootstrap", (None, None))
+    if job is not None and not job.done():
+        st.caption(f"Bootstrap started at {started_at} is still running…")
+    elif job is not None and job.exception() is not None:
+        st.error(f"Bootstrap failed: {job.exception()}")
+    elif job is not None:
+        intervals = job.result()
+        st.caption(f"Confidence intervals from the ratings as of {started_at}")
+
+    rows = agreement_rows(snapshot, intervals)
+    if rows:
+        st.dataframe(rows, hide_index=True)
+    else:
+        st.caption("No ratings yet.")
+
+
+USER_SORTS = {
+    "Username": (lambda s: s["username"], False),
+    "Most completed": (lambda s: s["n_completed"], True),
+    "Least completed": (lambda s: s["n_completed"], False),
+    "Newest joined": (lambda s: s["joined_at"], True),
+}
+USER_PAGE_SIZE = 25
+
+
+def set_user_page(page):
+    st.session_state["user_page"] = page
+
+
+@st.fragment
+def user_list(n_users):
+    """Filtering, sorting and paging rerun only this fragment; deleting a user reruns the whole page."""
     st.markdown("### Manage Users")
 
-    if not json_files:
+    if not n_users:
         st.warning("No user data found.")
-    else:
-        st.write("List of annotators:")
+        return
+
+    user_summaries = UserManager.list_user_summaries()
+    col1, col2, col3 = st.columns([2, 2, 2])
+    name_filter = col1.text_input("Filter by username", key="user_filter", on_change=set_user_page, args=(0,))
+    questionnaires = sorted({str(s["questionnaire"]) for s in user_summaries})
+    q_filter = col2.selectbox("Questionnaire", ["All"] + questionnaires, key="user_q_filter",
+                              on_change=set_user_page, args=(0,))
+    sort_key, descending = USER_SORTS[col3.selectbox("Sort by", list(USER_SORTS), key="user_sort")]
+
+    rows = [s for s in user_summaries
+            if name_filter.lower() in s["username"].lower() and q_filter in ("All", str(s["questionnaire"]))]
+    rows.sort(key=sort_key, reverse=descending)
 
-        # Create a container for the list to allow dynamic updates
-        user_list_container = st.container()
+    n_pages = max(1, -(-len(rows) // USER_PAGE_SIZE))
+    page = min(st.session_state.get("user_page", 0), n_pages - 1)
+    st.caption(f"{len(rows)} of {len(user_summaries)} annotators · page {page + 1} of {n_pages}")
 
-        with user_list_container:
-            for file_path in json_files:
-                filename = os.path.basename(file_path)
-                username = os.path.splitext(filename)[0]
+    for summary in rows[page * USER_PAGE_SIZE:(page + 1) * USER_PAGE_SIZE]:
+        username = summary["username"]
 
-                # Load user data to get progress info
+        col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
+        with col1:
+            st.text(username)
+        with col2:
+            st.caption(f"Q: {summary['questionnaire']}")
+        with col3:
+            st.caption(f"Completed: {summary['n_completed']}" + (" · preference set" if summary["final_preference"] else ""))
+        with col4:
+            if st.button("Delete", key=f"del_{username}"):
                 try:
-                    with open(file_path, 'r') as f:
-                        u_data = json.load(f)
-                        n_completed = len(u_data.get("annotations", {}))
-                        q_id = u_data.get("questionnaire", "Unknown")
-                except:
-                    n_completed = "?"
-                    q_id = "?"
-
-                col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
-                with col1:
-                    st.text(username)
-                with col2:
-                    st.caption(f"Q: {q_id}")
-                with col3:
-                    st.caption(f"Completed: {n_completed}")
-                with col4:
-                    if st.button("Delete", key=f"del_{username}"):
-                        try:
-                            os.remove(file_path)
-                            st.success(f"Deleted user: {username}")
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"Error deleting {username}: {e}")
-
-        if st.button("Refresh User List"):
-            st.rerun()
+                    UserManager.delete_user(username)
+                    st.success(f"Deleted user: {username}")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Error deleting {username}: {e}")
 
+    prev_col, _, next_col = st.columns([1, 4, 1])
+    prev_col.button("‹ Previous", key="user_page_prev", disabled=page == 0, on_click=set_user_page, args=(page - 1,))
+    next_col.button("Next ›", key="user_page_next", disabled=page >= n_pages - 1, on_click=set_user_page,
+                    args=(page + 1,))
 
-def main():
-    st.set_page_config(page_title="Bias Study", layout="wide")
-    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    if st.button("Refresh User List"):
+        st.rerun()
 
-    if "logged_in" not in st.session_state:
-        st.session_state["logged_in"] = False
 
-    if not st.session_state["logged_in"]:
-        login_screen()
-    else:
-        # Check if superuser
-        if st.session_state.get("is_superuser", False):
-            superuser_interface()
+def main():
+    st.set_page_config(page_title="Bias Study", layout="wide")
+    warm = warm_start()
+    if "warm_up" in st.query_params:
+        # Readiness probe (tools/warm_up.py): the run only finishes once this process is warm
+        warm.wait()
+        st.text(f"Ready in {warm.elapsed:.2f} s")
+        return
+    if INSTRUMENTATION:
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            get_metrics().touch_session(ctx.session_id)
+        if METRICS_TEXTFILE:
+            get_metrics().maybe_write_textfile(METRICS_TEXTFILE)
+    with timed("script run"):
+        if MEASURE_PAYLOAD:
+            st.session_state["payload_meter"] = {"sent": 0, "inline": 0}
+        # Annotator pages get the shared highlight stylesheet with the page CSS; highlights only carry class names
+        is_annotator = st.session_state.get("logged_in", False) and not st.session_state.get("is_superuser", False)
+        markdown_html(page_stylesheet(is_annotator), CUSTOM_CSS)
+
+        if "logged_in" not in st.session_state:
+            st.session_state["logged_in"] = False
+
+        if not st.session_state["logged_in"]:
+            login_screen()
         else:
-            user_data = st.session_state["user_data"]
-
-            # Check if user has seen instructions (Step 2)
-            if not user_data.get("has_seen_instructions", False):
-                instructions_page()
+            # Check if superuser
+            if st.session_state.get("is_superuser", False):
+                superuser_interface()
             else:
-                main_study_interface()
+                user_data = st.session_state["user_data"]
+
+                # Check if user has seen instructions (Step 2)
+                if not user_data.get("has_seen_instructions", False):
+                    instructions_page()
+                else:
+                    main_study_interface()
+
+        report_payload()
 
 
 if __name__ == "__main__":
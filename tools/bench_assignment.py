@@ -0,0 +1,91 @@
+"""
+Benchmarks the new-user login path (user_exists + create_user) as DATA_DIR grows.
+
+With the persisted assignment index the per-login cost should stay flat from 10 to 50,000 user
+files; the full scan that the index replaced is timed alongside for comparison. A concurrent
+burst of logins at the end checks that assignments stay balanced.
+
+Usage:
+    python tools/bench_assignment.py [--sizes 10,1000,10000,50000] [--logins 50] [--backend json|sqlite]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotate  # noqa: E402
+
+
+def new_user(username, q_id):
+    return {
+        "username": username,
+        "questionnaire": q_id,
+        "joined_at": "2025-01-01 00:00:00",
+        "has_seen_instructions": False,
+        "annotations": {},
+        "final_preference": None,
+        "current_index": 0,
+    }
+
+
+def populate(storage, start, stop):
+    for i in range(start, stop):
+        storage.save_user(f"synthetic_{i}", new_user(f"synthetic_{i}", annotate.QUESTIONNAIRE_DIRS[i % 2]))
+
+
+def login(username):
+    if not annotate.UserManager.user_exists(username):
+        annotate.UserManager.create_user(username)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000,50000")
+    parser.add_argument("--logins", type=int, default=50, help="Timed logins per size")
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    sizes = sorted(int(n) for n in args.sizes.split(","))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        annotate.DATA_DIR = data_dir
+        annotate.STORAGE_BACKEND = args.backend
+        storage = annotate.get_storage()
+
+        print(f"{'users':>8} {'login p50 (ms)':>15} {'login max (ms)':>15} {'full scan (ms)':>15}")
+        populated = 0
+        for size in sizes:
+            populate(storage, populated, size)
+            populated = size
+            storage.rebuild_assignment_index()
+
+            timings = []
+            for i in range(args.logins):
+                username = f"bench_{size}_{i}"
+                started = time.perf_counter()
+                login(username)
+                timings.append((time.perf_counter() - started) * 1000)
+                annotate.UserManager.delete_user(username)
+
+            started = time.perf_counter()
+            storage.questionnaire_counts()
+            scan_ms = (time.perf_counter() - started) * 1000
+
+            print(f"{size:>8} {statistics.median(timings):>15.3f} {max(timings):>15.3f} {scan_ms:>15.1f}")
+
+        before = storage.questionnaire_counts()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(login, [f"burst_{i}" for i in range(args.concurrency * 4)]))
+        after = storage.questionnaire_counts()
+        added = {q: after.get(q, 0) - before.get(q, 0) for q in annotate.QUESTIONNAIRE_DIRS}
+        print(f"Concurrent burst of {args.concurrency * 4} logins assigned: {added}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Packs each questionnaire folder into a single memory-mappable bundle (questionnaire_N/questionnaire.bundle).
+
+The app loads the bundle instead of the ~100 HTML files per questionnaire whenever it exists, so
+re-run this after changing any file under a questionnaire folder (or delete the bundle to fall back
+to the HTML files).
+
+Examples whose visualization HTML can be regenerated exactly from tokens and attribution scores are
+stored as those arrays; the others keep their HTML. The whole questionnaire is re-rendered in one
+batch afterwards to check that the output matches the shipped files byte for byte.
+
+Usage:
+    python tools/build_bundles.py [questionnaire_1 questionnaire_2 ...]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questionnaires", nargs="*", default=annotate.QUESTIONNAIRE_DIRS)
+    args = parser.parse_args()
+
+    for q_id in args.questionnaires:
+        bundle_path, n_examples, messages = annotate.DataLoader.build_bundle(q_id)
+        for level, message in messages:
+            print(f"[{level}] {message}")
+        print(f"{q_id}: {n_examples} examples -> {bundle_path} ({os.path.getsize(bundle_path)} bytes)")
+
+        examples = annotate.DataLoader._load_bundle(bundle_path)
+        rendered = [ex for ex in examples if "scores" in ex]
+        batch = annotate.HighlightRenderer.render_batch(
+            [(ex["highlights"], ex["scores"], ex["vis_type"], ex["prediction"]) for ex in rendered])
+        originals = {}
+        for sub in annotate.SUB_DIRS:
+            for ex in annotate.DataLoader._parse_directory(os.path.join(q_id, sub), sub, []):
+                originals[(sub, ex["id"])] = ex["vis_html"]
+        identical = sum(html == originals.get((ex["subdir"], ex["id"])) for ex, html in zip(rendered, batch))
+        print(f"  {len(rendered)} stored as token/score arrays, {identical} of them re-render identically; "
+              f"{n_examples - len(rendered)} kept as HTML")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Exports every rating as one row of a typed columnar table, joined with what the annotator was shown.
+
+The user documents only know models by slot (model_1..model_3). Each rating is resolved here to the
+attribution method that filled that slot for the example (directed_/undirected_explanations in the
+questionnaire's all_texts.json), together with the backbone (from the visualization folder), the
+group and polarity from the file name, the gold label and the fairness score.
+
+The table is written as Parquet when pyarrow is installed, otherwise as a compressed NPZ plus a CSV.
+Unrated questions are null in Parquet and 0 in the NPZ/CSV (ratings run from 1 to 5). A per-method and
+backbone summary of mean interpretability and bias, computed in one vectorized pass, is printed and
+written next to the table.
+
+Usage:
+    python tools/export_analysis.py [--data-dir bias_annotation_ICLR] [--backend json|sqlite]
+                                    [--format auto|parquet|npz] [--output ratings]
+"""
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotate  # noqa: E402
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Columns holding repeated strings; stored dictionary-encoded in Parquet
+CATEGORICAL = ("questionnaire", "backbone", "vis_type", "group", "polarity", "toxic_label", "method")
+RATINGS = ("interpretability", "bias")
+
+
+def example_index(questionnaire_id):
+    """example id -> example of the questionnaire, keeping the first of any duplicated id."""
+    examples, messages = annotate.get_example_store().get(questionnaire_id, annotate.DataLoader._load_from_disk)
+    for level, message in messages:
+        print(f"[{level}] {message}")
+    index = {}
+    for ex in examples:
+        if ex["id"] in index:
+            print(f"[warning] {questionnaire_id}: id {ex['id']} appears in more than one folder; "
+                  f"its ratings are attributed to {index[ex['id']]['subdir']}")
+            continue
+        index[ex["id"]] = ex
+    return index
+
+
+def collect_rows(storage):
+    """Column name -> list, one entry per (user, example, model slot)."""
+    columns = {name: [] for name in (
+        "username", "questionnaire", "example_id", "order", "backbone", "vis_type", "group", "polarity",
+        "example_index", "gold_label", "fairness_score", "toxic_label", "slot", "method", *RATINGS)}
+    indexes = {}
+    for username in sorted(storage.list_usernames()):
+        data = annotate.load_user_or_none(storage, username)
+        if not data or data.get("questionnaire") not in annotate.QUESTIONNAIRE_DIRS:
+            continue
+        q_id = data["questionnaire"]
+        if q_id not in indexes:
+            indexes[q_id] = example_index(q_id)
+        for ex_id, annotation in data.get("annotations", {}).items():
+            ex = indexes[q_id].get(ex_id)
+            if ex is None:
+                continue
+            methods = ex.get("explanation_methods") or [None] * len(annotate.MODEL_KEYS)
+            for slot, model in enumerate(annotate.MODEL_KEYS):
+                rating = annotation.get("ratings", {}).get(model, {})
+                columns["username"].append(username)
+                columns["questionnaire"].append(q_id)
+                columns["example_id"].append(ex_id)
+                columns["order"].append(ex["order"])
+                columns["backbone"].append(ex["subdir"].replace("_race_visualizations", ""))
+                columns["vis_type"].append(ex["vis_type"])
+                columns["group"].append(ex.get("group") or "")
+                columns["polarity"].append(ex.get("polarity") or "")
+                columns["example_index"].append(ex.get("example_index", -1))
+                columns["gold_label"].append(-1 if ex.get("label") is None else ex["label"])
+                columns["fairness_score"].append(ex.get("fairness_score"))
+                columns["toxic_label"].append(annotation.get("toxic_label") or "")
+                columns["slot"].append(slot + 1)
+                columns["method"].append(methods[slot] or "")
+                for question in RATINGS:
+                    columns[question].append(rating.get(question) or 0)
+    return columns
+
+
+def to_arrays(columns):
+    """Typed NumPy columns; strings stay object arrays until written."""
+    arrays = {name: np.array(values, dtype=object) for name, values in columns.items()}
+    for name in ("order", "example_index"):
+        arrays[name] = np.array(columns[name], dtype=np.int32)
+    for name in ("gold_label", "slot", *RATINGS):
+        arrays[name] = np.array(columns[name], dtype=np.int8)
+    arrays["fairness_score"] = np.array([np.nan if v is None else v for v in columns["fairness_score"]],
+                                        dtype=np.float32)
+    return arrays
+
+
+def method_summary(arrays):
+    """Mean interpretability and bias per (method, backbone), from one bincount pass over the rated rows."""
+    keys = np.char.add(np.char.add(arrays["method"].astype(str), "\t"), arrays["backbone"].astype(str))
+    groups, codes = np.unique(keys, return_inverse=True)
+    summary = []
+    counts = {q: np.bincount(codes, weights=arrays[q] > 0, minlength=len(groups)) for q in RATINGS}
+    sums = {q: np.bincount(codes, weights=arrays[q].astype(np.float64), minlength=len(groups)) for q in RATINGS}
+    for i, key in enumerate(groups):
+        method, backbone = key.split("\t")
+        row = {"method": method, "backbone": backbone, "n_ratings": int(counts["interpretability"][i])}
+        for q in RATINGS:
+            row[f"mean_{q}"] = round(sums[q][i] / counts[q][i], 3) if counts[q][i] else None
+        summary.append(row)
+    return summary
+
+
+def write_parquet(arrays, path):
+    fields = {}
+    for name, values in arrays.items():
+        if name in CATEGORICAL:
+            fields[name] = pa.array(values.astype(str)).dictionary_encode()
+        elif name in RATINGS:
+            fields[name] = pa.array(values, mask=values == 0)
+        elif name == "gold_label":
+            fields[name] = pa.array(values, mask=values < 0)
+        elif values.dtype == object:
+            fields[name] = pa.array(values.astype(str))
+        else:
+            fields[name] = pa.array(values)
+    pq.write_table(pa.table(fields), path, compression="zstd")
+
+
+def write_npz_csv(arrays, stem):
+    np.savez_compressed(f"{stem}.npz", **{name: values.astype(str) if values.dtype == object else values
+                                          for name, values in arrays.items()})
+    with open(f"{stem}.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(arrays)
+        # float32 -> float64 would print 1.1200000047683716 for 1.12
+        writer.writerows(zip(*(values.astype(np.float64).round(6).tolist() if values.dtype == np.float32
+                               else values.tolist() for values in arrays.values())))
+    return [f"{stem}.npz", f"{stem}.csv"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=annotate.DATA_DIR)
+    parser.add_argument("--backend", default=annotate.STORAGE_BACKEND, choices=["json", "sqlite"])
+    parser.add_argument("--format", default="auto", choices=["auto", "parquet", "npz"])
+    parser.add_argument("--output", default="ratings", help="Output path without extension")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and pa is None:
+        sys.exit("--format parquet needs pyarrow (pip install pyarrow)")
+    annotate.DATA_DIR = args.data_dir
+    annotate.STORAGE_BACKEND = args.backend
+
+    arrays = to_arrays(collect_rows(annotate.get_storage()))
+    n_rows = len(arrays["username"])
+    if args.format == "npz" or pa is None:
+        written = write_npz_csv(arrays, args.output)
+    else:
+        written = [f"{args.output}.parquet"]
+        write_parquet(arrays, written[0])
+
+    summary = method_summary(arrays) if n_rows else []
+    summary_path = f"{args.output}_by_method.csv"
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["method", "backbone", "n_ratings", "mean_interpretability", "mean_bias"])
+        writer.writeheader()
+        writer.writerows(summary)
+
+    print(f"{n_rows} ratings from {len(set(arrays['username']))} users -> {', '.join(written)}, {summary_path}\n")
+    print(f"{'method':<24} {'backbone':<10} {'n':>6} {'interpretability':>17} {'bias':>6}")
+    for row in summary:
+        interp, bias = row["mean_interpretability"], row["mean_bias"]
+        print(f"{row['method']:<24} {row['backbone']:<10} {row['n_ratings']:>6} "
+              f"{'-' if interp is None else f'{interp:.2f}':>17} {'-' if bias is None else f'{bias:.2f}':>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Load test: starts `streamlit run annotate.py` on a scratch DATA_DIR and drives it with N simulated
+annotators (plus optional superuser sessions), each a headless client speaking Streamlit's websocket
+protocol like a browser tab. AppTest is not used because its sessions cannot run concurrently in one
+process.
+
+Each annotator logs in, accepts the instructions, and for every datapoint submits Step 1, clicks all
+six ratings and presses Next, then answers the final preference question. Superuser sessions keep
+refreshing the dashboard until the annotators are done. After the server has shut down, every
+annotator's stored document is compared with what it clicked; each field that differs counts as a
+lost update.
+
+Reported: rerun latency percentiles per session kind (request sent to script finished), write
+syscalls and bytes written per second by the server (from /proc/<pid>/io, Linux only), the server's
+peak RSS and lost updates. Results are written as JSON so runs of different versions can be compared.
+
+Usage:
+    python tools/load_test.py [--annotators 8] [--superusers 1] [--datapoints 48] [--backend json|sqlite]
+                              [--output load_test.json]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import annotate  # noqa: E402
+
+DONE_STATUSES = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+                 ForwardMsg.FINISHED_WITH_COMPILE_ERROR)
+
+
+class BrowserSession:
+    """
+    One simulated browser tab. Keeps the widgets of the last render and the values set on them, and
+    sends them back with every rerun request, as the frontend does.
+    """
+
+    def __init__(self, kind, ws, timeout, query_string=""):
+        self.kind = kind
+        self.timeout = timeout
+        self.ws = ws
+        self.query_string = query_string
+        self.widgets = {}  # widget id -> (element type, widget proto, fragment id)
+        self.values = {}  # widget id -> WidgetState
+        self.latencies = []
+        self.rerun()
+
+    def rerun(self, trigger=None, fragment_id=""):
+        msg = BackMsg()
+        msg.rerun_script.query_string = self.query_string
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+        widget_states = msg.rerun_script.widget_states.widgets
+        widget_states.extend(state for widget_id, state in self.values.items() if widget_id in self.widgets)
+        if trigger:
+            widget_states.add(id=trigger, trigger_value=True)
+
+        started = time.perf_counter()
+        self.ws.send(msg.SerializeToString())
+        self._receive_run()
+        self.latencies.append((time.perf_counter() - started) * 1000)
+
+    def _receive_run(self):
+        """Consumes messages until the script run (and any st.rerun it triggered) has finished."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(self.ws.recv(timeout=max(0.0, deadline - time.monotonic())))
+            kind = msg.WhichOneof("type")
+            if kind == "new_session" and not msg.new_session.fragment_ids_this_run:
+                self.widgets = {}
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    raise RuntimeError(f"{self.kind} session raised: {element.exception.message}")
+                widget_id = getattr(getattr(element, element_type), "id", "")
+                if widget_id:
+                    self.widgets[widget_id] = (element_type, getattr(element, element_type), msg.delta.fragment_id)
+            elif kind == "script_finished" and msg.script_finished in DONE_STATUSES:
+                return
+
+    def find(self, element_type, label=None, key=None):
+        for widget_id, (found_type, proto, fragment_id) in self.widgets.items():
+            if found_type != element_type:
+                continue
+            if label is not None and not proto.label.startswith(label):
+                continue
+            if key is not None and not widget_id.endswith(f"-{key}"):
+                continue
+            return widget_id, proto, fragment_id
+        return None
+
+    def widget(self, element_type, label=None, key=None):
+        found = self.find(element_type, label, key)
+        if found is None:
+            raise LookupError(f"{self.kind} session: no {element_type} with label={label!r} key={key!r}")
+        return found
+
+    def set_value(self, widget_id, **value):
+        self.values[widget_id] = WidgetState(id=widget_id, **value)
+
+    def click(self, label):
+        widget_id, _, fragment_id = self.widget("button", label=label)
+        self.rerun(trigger=widget_id, fragment_id=fragment_id)
+
+    def choose(self, key, option_index, rerun=True):
+        widget_id, proto, fragment_id = self.widget("radio", key=key)
+        self.set_value(widget_id, string_value=proto.options[option_index])
+        if rerun:
+            self.rerun(fragment_id=fragment_id)
+        return proto.options[option_index]
+
+    def login(self, username, password):
+        self.set_value(self.widget("text_input", label="Username")[0], string_value=username)
+        self.set_value(self.widget("text_input", label="Password")[0], string_value=password)
+        self.click("Login / Start")
+
+
+def annotate_all(url, username, n_datapoints, seed, timeout):
+    """Walks one annotator through the study; returns its latencies and the values it entered."""
+    rng = random.Random(seed)
+    with connect(url, subprotocols=["streamlit"], max_size=None, open_timeout=timeout) as ws:
+        session = BrowserSession("annotator", ws, timeout)
+        session.login(username, annotate.STUDY_PASSWORD)
+        session.click("I understand")
+
+        expected = {}
+        for _ in range(n_datapoints):
+            radio_id = session.widget("radio", label="Is this text Toxic?")[0]
+            ex_id = radio_id.rsplit("-", 1)[1][len("toxic_"):-len("_radio")]
+            # The radio sits in the Step 1 form, so its value only travels with the submit click
+            label = session.choose(f"toxic_{ex_id}_radio", rng.randrange(2), rerun=False)
+            session.click("Submit Step 1")
+
+            ratings = {}
+            for m in range(1, 4):
+                q1, q2 = rng.randint(1, 5), rng.randint(1, 5)
+                session.choose(f"{ex_id}_m{m}_q1", q1 - 1)
+                session.choose(f"{ex_id}_m{m}_q2", q2 - 1)
+                ratings[f"model_{m}"] = {"interpretability": q1, "bias": q2}
+            expected[ex_id] = {"toxic_label": label, "ratings": ratings}
+
+            if session.find("button", label="Next Datapoint") is None:
+                break
+            session.click("Next Datapoint")
+
+        final_preference = None
+        if session.find("radio", key="final_pref_input") is not None:
+            final_preference = session.choose("final_pref_input", rng.randrange(2))
+        return session.latencies, expected, final_preference
+
+
+def watch_dashboard(url, stop, timeout):
+    with connect(url, subprotocols=["streamlit"], max_size=None, open_timeout=timeout) as ws:
+        session = BrowserSession("superuser", ws, timeout)
+        session.login(annotate.SUPERUSER_NAME, annotate.SUPERUSER_PASS)
+        while not stop.is_set():
+            # The user list, and its refresh button, only appear once the first annotator has logged in
+            if session.find("button", label="Refresh User List") is None:
+                session.rerun()
+            else:
+                session.click("Refresh User List")
+        return session.latencies
+
+
+def count_lost_updates(storage, expected, final_preferences):
+    """Fields an annotator entered that are missing or different in its stored document."""
+    lost = 0
+    for username, annotations in expected.items():
+        stored = storage.load_user(username) or {}
+        stored_annotations = stored.get("annotations", {})
+        for ex_id, annotation in annotations.items():
+            saved = stored_annotations.get(ex_id, {})
+            lost += saved.get("toxic_label") != annotation["toxic_label"]
+            for model, rating in annotation["ratings"].items():
+                saved_rating = saved.get("ratings", {}).get(model, {})
+                lost += sum(saved_rating.get(q) != v for q, v in rating.items())
+        if final_preferences[username] is not None:
+            lost += stored.get("final_preference") != final_preferences[username]
+    return lost
+
+
+def percentiles(latencies):
+    if not latencies:
+        return None
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"count": len(latencies), "p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2),
+            "max": round(max(latencies), 2)}
+
+
+def read_proc(pid):
+    """(write syscalls, bytes written, peak RSS in kB) of a process, None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            io = dict(line.split(": ") for line in f.read().splitlines())
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(line.split(":", 1) for line in f.read().splitlines() if ":" in line)
+        return int(io["syscw"]), int(io["wchar"]), int(status["VmHWM"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def start_server(data_dir, backend, port, timeout):
+    env = dict(os.environ, DATA_DIR=data_dir, STORAGE_BACKEND=backend)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join(REPO_DIR, "annotate.py"),
+         "--server.headless=true", f"--server.port={port}", "--server.enableXsrfProtection=false",
+         "--browser.gatherUsageStats=false", "--logger.level=error"],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"Server exited early:\n{server.stderr.read().decode()}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    sys.exit("Server did not become healthy in time")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--annotators", type=int, default=8)
+    parser.add_argument("--superusers", type=int, default=1)
+    parser.add_argument("--datapoints", type=int, default=48, help="Datapoints each annotator completes")
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--data-dir", help="DATA_DIR for the run (default: a fresh temporary directory)")
+    parser.add_argument("--port", type=int, help="Server port (default: any free port)")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds allowed for a single rerun")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bias_load_")
+    port = args.port or free_port()
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    server = start_server(data_dir, args.backend, port, args.timeout)
+
+    stop = threading.Event()
+    errors = []
+    latencies = {"annotator": [], "superuser": []}
+    expected, final_preferences = {}, {}
+    proc_before = read_proc(server.pid)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.annotators + args.superusers) as pool:
+            watchers = [pool.submit(watch_dashboard, url, stop, args.timeout) for _ in range(args.superusers)]
+            annotators = {f"load_{i}": pool.submit(annotate_all, url, f"load_{i}", args.datapoints,
+                                                   args.seed * 100003 + i, args.timeout)
+                          for i in range(args.annotators)}
+            for username, future in annotators.items():
+                try:
+                    runs, expected[username], final_preferences[username] = future.result()
+                    latencies["annotator"].extend(runs)
+                except Exception as e:
+                    errors.append(f"{username}: {e!r}")
+            stop.set()
+            for future in watchers:
+                try:
+                    latencies["superuser"].extend(future.result())
+                except Exception as e:
+                    errors.append(f"superuser: {e!r}")
+        elapsed = time.perf_counter() - started
+        proc_after = read_proc(server.pid)
+    finally:
+        # A clean shutdown drains the write-behind queue before the stored documents are checked
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    if args.backend == "sqlite":
+        storage = annotate.SqliteStorage(os.path.join(data_dir, annotate.SQLITE_FILENAME))
+    else:
+        storage = annotate.JsonFileStorage(data_dir)
+    lost = count_lost_updates(storage, expected, final_preferences)
+
+    writes, peak_rss_mb = None, None
+    if proc_before and proc_after:
+        syscalls, written = proc_after[0] - proc_before[0], proc_after[1] - proc_before[1]
+        writes = {"syscalls": syscalls, "syscalls_per_s": round(syscalls / elapsed, 1),
+                  "bytes": written, "bytes_per_s": round(written / elapsed, 1)}
+        peak_rss_mb = round(proc_after[2] / 1024, 1)
+
+    results = {
+        "started_at": str(datetime.now()),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "port")},
+        "duration_s": round(elapsed, 2),
+        "latency_ms": {kind: percentiles(values) for kind, values in latencies.items()},
+        "reruns_per_s": round(sum(map(len, latencies.values())) / elapsed, 1),
+        "server_writes": writes,
+        "server_peak_rss_mb": peak_rss_mb,
+        "lost_updates": lost,
+        "errors": errors,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if not args.data_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    sys.exit(1 if errors or lost else 0)
+
+
+if __name__ == "__main__":
+    main()
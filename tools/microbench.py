@@ -0,0 +1,212 @@
+"""
+Micro-benchmarks for the questionnaire loading, user storage and admin paths at synthetic scale.
+
+A synthetic questionnaire is built by cycling the real HTML pairs of questionnaire_1 under fresh order
+prefixes (--pairs per visualization folder), and a DATA_DIR is filled with --users annotators who have
+each completed the whole study. Every benchmark reports throughput, latency and, from one extra run
+under tracemalloc, the peak traced memory and the number of memory blocks still held afterwards.
+
+With --baseline, the run is compared with an earlier --output file and the script exits non-zero when
+any benchmark's median got slower by more than --threshold (0.25 = 25%).
+
+Usage:
+    python tools/microbench.py [--pairs 2000] [--users 10000] [--backend json|sqlite]
+                               [--output microbench.json] [--baseline old.json] [--threshold 0.25]
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotate  # noqa: E402
+
+SOURCE_QUESTIONNAIRE = "questionnaire_1"
+PAIR_PATTERN = re.compile(r"(\d+)_(.*)_(raw|directed|undirected)\.html")
+
+
+def make_questionnaire(target, n_pairs):
+    """Writes n_pairs raw/vis pairs per visualization folder, cycling the real pairs of SOURCE_QUESTIONNAIRE."""
+    for sub in annotate.SUB_DIRS:
+        source = os.path.join(SOURCE_QUESTIONNAIRE, sub)
+        pairs = {}
+        for path in glob.glob(os.path.join(source, "*.html")):
+            match = PAIR_PATTERN.match(os.path.basename(path))
+            if match:
+                pairs.setdefault(match.group(1, 2), []).append((match.group(3), path))
+        complete = [(name, files) for (_, name), files in sorted(pairs.items()) if len(files) == 2]
+
+        out = os.path.join(target, sub)
+        os.makedirs(out, exist_ok=True)
+        shutil.copy(os.path.join(source, "all_texts.json"), out)
+        for order in range(n_pairs):
+            name, files = complete[order % len(complete)]
+            for file_type, path in files:
+                shutil.copy(path, os.path.join(out, f"{order}_{name}_{file_type}.html"))
+
+
+def make_user(username, questionnaire, example_ids, rng):
+    return {
+        "username": username,
+        "questionnaire": questionnaire,
+        "joined_at": "2025-01-01 00:00:00",
+        "has_seen_instructions": True,
+        "annotations": {
+            ex_id: {
+                "toxic_label": rng.choice(["Toxic", "Not Toxic"]),
+                "ratings": {f"model_{m}": {"interpretability": rng.randint(1, 5), "bias": rng.randint(1, 5)}
+                            for m in range(1, 4)},
+                "timestamp": "2025-01-01 00:00:00",
+            }
+            for ex_id in example_ids
+        },
+        "final_preference": "Directed (Red/Green)",
+        "current_index": len(example_ids) - 1,
+    }
+
+
+def measure(name, fn, repeat):
+    """Times `repeat` calls of fn, then traces one more call for memory."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "filename"))
+
+    median = statistics.median(timings)
+    result = {
+        "repeat": repeat,
+        "median_ms": round(median, 3),
+        "min_ms": round(min(timings), 3),
+        "ops_per_s": round(1000 / median, 1) if median else None,
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "retained_blocks": blocks,
+    }
+    print(f"{name:<28} {result['median_ms']:>12.3f} {result['ops_per_s'] or 0:>12.1f} "
+          f"{result['peak_alloc_kb']:>14.1f} {blocks:>10}")
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Names of benchmarks whose median regressed by more than threshold against the baseline run."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if not old or not old.get("median_ms"):
+            continue
+        change = result["median_ms"] / old["median_ms"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<28} {old['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms ({change:+.0%}){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=2000, help="Synthetic pairs per visualization folder")
+    parser.add_argument("--users", type=int, default=10000, help="Synthetic annotators in DATA_DIR")
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls of the fast benchmarks")
+    parser.add_argument("--repeat-slow", type=int, default=3, help="Timed calls of whole-questionnaire/all-user benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="microbench.json")
+    parser.add_argument("--baseline", help="Earlier --output file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown of a median, as a fraction")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    root = tempfile.mkdtemp(prefix="bias_bench_")
+    try:
+        questionnaire = os.path.join(root, "questionnaire_synthetic")
+        started = time.perf_counter()
+        make_questionnaire(questionnaire, args.pairs)
+        print(f"Generated {args.pairs} pairs per folder in {time.perf_counter() - started:.1f} s")
+
+        annotate.DATA_DIR = os.path.join(root, "data")
+        annotate.STORAGE_BACKEND = args.backend
+        os.makedirs(annotate.DATA_DIR)
+        storage = annotate.get_storage()
+
+        example_ids = [ex["id"] for ex in annotate.DataLoader.load_examples(SOURCE_QUESTIONNAIRE)]
+        started = time.perf_counter()
+        for i in range(args.users):
+            storage.save_user(f"synthetic_{i}", make_user(f"synthetic_{i}", annotate.QUESTIONNAIRE_DIRS[i % 2],
+                                                          example_ids, rng))
+        storage.rebuild_assignment_index()
+        print(f"Generated {args.users} users in {time.perf_counter() - started:.1f} s\n")
+
+        sub_path = os.path.join(questionnaire, annotate.SUB_DIRS[0])
+        usernames = [f"synthetic_{i}" for i in range(args.users)]
+
+        def load_examples_cold():
+            annotate.get_example_store.clear()
+            annotate.DataLoader.load_examples(questionnaire)
+
+        sample = storage.load_user(usernames[0])
+
+        def save_user():
+            username = rng.choice(usernames)
+            storage.save_user(username, dict(sample, username=username))
+
+        def assign():
+            q_id = annotate.UserManager.assign_questionnaire()
+            annotate.get_storage().release_questionnaire(q_id)
+
+        print(f"{'benchmark':<28} {'median (ms)':>12} {'ops/s':>12} {'peak alloc (KB)':>14} {'blocks':>10}")
+        results = {
+            "parse_directory": measure(
+                "parse_directory", lambda: annotate.DataLoader._parse_directory(sub_path, annotate.SUB_DIRS[0], []),
+                args.repeat_slow),
+            "load_examples_cold": measure("load_examples_cold", load_examples_cold, args.repeat_slow),
+            "load_examples_warm": measure(
+                "load_examples_warm", lambda: annotate.DataLoader.load_examples(questionnaire), args.repeat),
+            "load_user": measure("load_user", lambda: annotate.UserManager.load_user(rng.choice(usernames)),
+                                 args.repeat),
+            "save_user": measure("save_user", save_user, args.repeat),
+            "assign_questionnaire": measure("assign_questionnaire", assign, args.repeat),
+            "list_user_summaries": measure("list_user_summaries", annotate.UserManager.list_user_summaries,
+                                           args.repeat_slow),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    output = {
+        "started_at": str(datetime.now()),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "benchmarks": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.baseline} (threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            sys.exit(f"Regressed: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+One-shot migration of per-user JSON files into the SQLite storage engine.
+
+Usage:
+    python tools/migrate_json_to_sqlite.py [--source bias_annotation_ICLR] [--db bias_annotation_ICLR/study.sqlite3]
+
+Afterwards start the app with STORAGE_BACKEND=sqlite. The JSON files are left untouched.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=annotate.DATA_DIR, help="Directory holding {username}.json files")
+    parser.add_argument("--db", default=os.path.join(annotate.DATA_DIR, annotate.SQLITE_FILENAME),
+                        help="SQLite database to create or update")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source):
+        sys.exit(f"Source directory not found: {args.source}")
+
+    storage = annotate.SqliteStorage(args.db)
+    migrated = storage.migrate_from_json(args.source)
+    print(f"Migrated {migrated} users from {args.source} into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
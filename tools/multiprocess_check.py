@@ -0,0 +1,135 @@
+"""
+Checks that several server processes can share one DATA_DIR: N worker processes run the storage paths of
+the app against the same directory (or SQLite database) at once, all contending for the same users.
+
+Every worker
+  - logs in the same --users new annotators (UserManager.create_user), in its own random order,
+  - appends --events single-field changes to each of the --shared annotators, on fields of its own, with
+    JOURNAL_COMPACT_BYTES lowered so that compactions keep racing the appends,
+  - deletes and logs in again the --recreated annotators, all workers picking the same ones.
+
+Afterwards the check fails unless no appended field is missing, every shared annotator's version equals
+1 + the number of appends it received, the persisted assignment counts equal the questionnaires of the
+stored users, and those are balanced (no questionnaire more than one annotator ahead of another).
+
+Usage:
+    python tools/multiprocess_check.py [--processes 4] [--users 60] [--shared 6] [--events 100]
+                                       [--recreated 10] [--backend json|sqlite]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotate  # noqa: E402
+
+
+def configure(data_dir, backend):
+    annotate.DATA_DIR = data_dir
+    annotate.STORAGE_BACKEND = backend
+    annotate.JOURNAL_COMPACT_BYTES = 2048
+
+
+def worker(index, data_dir, backend, args, start, results):
+    configure(data_dir, backend)
+    rng = random.Random(index)
+    usernames = [f"user_{i}" for i in range(args.users)]
+    start.wait()
+
+    for username in rng.sample(usernames, len(usernames)):
+        if not annotate.UserManager.user_exists(username):
+            annotate.UserManager.create_user(username)
+
+    expected = {}
+    for k in range(args.events):
+        for username in usernames[:args.shared]:
+            ex_id = f"p{index}_{k}"
+            annotate.UserManager.append_events(username, [{"p": ["annotations", ex_id], "v": {"toxic_label": "Toxic"}}])
+            expected.setdefault(username, []).append(ex_id)
+
+    for username in usernames[-args.recreated:] if args.recreated else []:
+        annotate.UserManager.delete_user(username)
+        if not annotate.UserManager.user_exists(username):
+            annotate.UserManager.create_user(username)
+    results.put(expected)
+
+
+def persisted_counts(storage):
+    """The assignment counts as the assigner sees them; choosing nothing leaves them untouched."""
+    seen = {}
+    storage.assign_questionnaire(lambda counts: seen.update(counts))
+    return {q: n for q, n in seen.items() if n}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--users", type=int, default=60, help="Annotators every worker logs in")
+    parser.add_argument("--shared", type=int, default=6, help="Annotators every worker appends to")
+    parser.add_argument("--events", type=int, default=100, help="Appends per worker and shared annotator")
+    parser.add_argument("--recreated", type=int, default=10, help="Annotators every worker deletes and re-creates")
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    args = parser.parse_args()
+    if args.shared + args.recreated > args.users:
+        sys.exit("--shared and --recreated annotators must be distinct: need --users >= --shared + --recreated")
+
+    data_dir = tempfile.mkdtemp(prefix="bias_multiprocess_")
+    context = multiprocessing.get_context("spawn")
+    start, results = context.Event(), context.Queue()
+    try:
+        workers = [context.Process(target=worker, args=(i, data_dir, args.backend, args, start, results))
+                   for i in range(args.processes)]
+        for process in workers:
+            process.start()
+        time.sleep(1)  # Let the workers import annotate before they are released together
+        started = time.perf_counter()
+        start.set()
+        expected = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        configure(data_dir, args.backend)
+        storage = (annotate.SqliteStorage(os.path.join(data_dir, annotate.SQLITE_FILENAME)) if args.backend == "sqlite"
+                   else annotate.JsonFileStorage(data_dir))
+        missing, wrong_versions = 0, 0
+        for username in [f"user_{i}" for i in range(args.shared)]:
+            data = storage.load_user(username)
+            appended = [ex_id for per_worker in expected for ex_id in per_worker.get(username, [])]
+            missing += sum(ex_id not in data["annotations"] for ex_id in appended)
+            wrong_versions += data["version"] != 1 + len(appended)
+
+        stored = storage.questionnaire_counts()
+        persisted = persisted_counts(storage)
+        loads = [stored.get(q, 0) for q in annotate.QUESTIONNAIRE_DIRS]
+        n_users = sum(stored.values())
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"{args.processes} processes, {args.backend}: {elapsed:.1f} s")
+    print(f"  users stored:             {n_users} (expected {args.users})")
+    print(f"  missing appended fields:  {missing} of {args.processes * args.events * args.shared}")
+    print(f"  wrong document versions:  {wrong_versions} of {args.shared}")
+    print(f"  assignment counts:        persisted {persisted}, stored users {stored}")
+    failures = []
+    if n_users != args.users:
+        failures.append("users")
+    if missing or wrong_versions:
+        failures.append("lost updates")
+    if persisted != stored:
+        failures.append("assignment counts")
+    if max(loads) - min(loads) > 1:
+        failures.append("balance")
+    if failures:
+        sys.exit(f"FAILED: {', '.join(failures)}")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
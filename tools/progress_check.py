@@ -0,0 +1,97 @@
+"""
+Checks that completion is counted in one unit everywhere: the annotator's progress (ProgressIndex), the
+superuser's user list (n_completed of both storage engines) and the "Finished" column of the questionnaire
+overview (datapoint_count) all count distinct example ids, also when an id appears in more than one folder.
+
+For every questionnaire, with a duplicated id added to its examples when it has none of its own, the check
+stores two annotators in a temporary DATA_DIR: one who rated every distinct id, and one who rated all but
+the first. It fails unless the first is finished and complete in ProgressIndex, and the second is neither,
+with the missing id (not a later occurrence of another id) as the next incomplete datapoint.
+
+Usage:
+    python tools/progress_check.py [--backend json|sqlite|both]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotate  # noqa: E402
+
+
+def rated():
+    return {"toxic_label": "Toxic", "timestamp": "2026-01-01 00:00:00",
+            "ratings": {m: {"interpretability": 3, "bias": 3} for m in annotate.MODEL_KEYS}}
+
+
+def check_questionnaire(storage, q_id):
+    """Problems found for one questionnaire; stores its two annotators in storage."""
+    problems = []
+    examples = annotate.get_example_store().get(q_id, annotate.DataLoader._load_from_disk)[0]
+    if not examples:
+        return [f"{q_id}: no examples"]
+    ids = list(dict.fromkeys(ex["id"] for ex in examples))
+    if len(ids) == len(examples):
+        examples = list(examples) + [examples[0]]  # The same example in a second folder
+    total = annotate.datapoint_count(q_id)
+    if total != len(ids):
+        problems.append(f"{q_id}: datapoint_count {total}, distinct ids {len(ids)}")
+
+    for username, annotated in ((f"{q_id}_all", ids), (f"{q_id}_partial", ids[1:])):
+        annotations = {ex_id: rated() for ex_id in annotated}
+        storage.save_user(username, {"username": username, "questionnaire": q_id, "annotations": annotations,
+                                     "current_index": 0, "has_seen_instructions": True})
+        expect_done = annotated is ids
+        progress = annotate.ProgressIndex(examples, annotations)
+        if (progress.completed_count == progress.total) != expect_done:
+            problems.append(f"{username}: ProgressIndex {progress.completed_count} / {progress.total} completed")
+        next_incomplete = progress.next_incomplete(0)
+        expected_next = None if expect_done else 0
+        if next_incomplete != expected_next:
+            problems.append(f"{username}: next incomplete {next_incomplete}, expected {expected_next}")
+
+    for summary in storage.list_user_summaries():
+        if summary["questionnaire"] != q_id:
+            continue
+        expect_done = summary["username"].endswith("_all")
+        if (summary["n_completed"] >= total) != expect_done:
+            problems.append(f"{summary['username']}: n_completed {summary['n_completed']} of {total} datapoints")
+    return problems
+
+
+def run(backend):
+    data_dir = tempfile.mkdtemp(prefix="progress_check_")
+    try:
+        if backend == "sqlite":
+            storage = annotate.SqliteStorage(os.path.join(data_dir, annotate.SQLITE_FILENAME))
+        else:
+            storage = annotate.JsonFileStorage(data_dir)
+        problems = []
+        for q_id in annotate.QUESTIONNAIRE_DIRS:
+            problems.extend(check_questionnaire(storage, q_id))
+        return problems
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=("json", "sqlite", "both"), default="both")
+    args = parser.parse_args()
+
+    failed = False
+    for backend in (("json", "sqlite") if args.backend == "both" else (args.backend,)):
+        problems = run(backend)
+        print(f"{backend}: {len(annotate.QUESTIONNAIRE_DIRS)} questionnaires, {len(problems)} problems")
+        for problem in problems:
+            print(f"  {problem}")
+        failed = failed or bool(problems)
+    print("FAILED" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Rebuilds the persisted questionnaire assignment index from a full scan of the stored users.
+
+Run this after restoring a backup, deleting user files by hand, or if the index was lost:
+    python tools/rebuild_assignment_index.py [--backend json|sqlite] [--data-dir bias_annotation_ICLR]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import annotate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=annotate.STORAGE_BACKEND, choices=["json", "sqlite"])
+    parser.add_argument("--data-dir", default=annotate.DATA_DIR)
+    args = parser.parse_args()
+
+    annotate.STORAGE_BACKEND = args.backend
+    annotate.DATA_DIR = args.data_dir
+    counts = annotate.UserManager.rebuild_assignment_index()
+    for q_id in sorted(counts, key=str):
+        print(f"{q_id}: {counts[q_id]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Readiness probe for rolling restarts. Streamlit runs no app code until a session connects, so a freshly
+started server would leave loading and rendering the questionnaires to its first annotator. This waits
+for the server's health check, then opens one session with ?warm_up: its script run starts the
+process's WarmStart and only finishes once every questionnaire is loaded and rendered. Send annotators
+to the server once this exits 0.
+
+Usage:
+    python tools/warm_up.py [--url http://127.0.0.1:8501] [--timeout 300]
+"""
+import argparse
+import sys
+import time
+import urllib.request
+
+from websockets.sync.client import connect
+
+from load_test import BrowserSession
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8501", help="Base URL of the server to warm up")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds allowed until the server is warm")
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    started = time.monotonic()
+    deadline = started + args.timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"{base}/_stcore/health", timeout=1):
+                break
+        except OSError:
+            if time.monotonic() > deadline:
+                sys.exit(f"{base} did not become healthy within {args.timeout:.0f} s")
+            time.sleep(0.2)
+    healthy = time.monotonic()
+
+    ws_url = "ws" + base[len("http"):] + "/_stcore/stream"
+    with connect(ws_url, subprotocols=["streamlit"], max_size=None, open_timeout=args.timeout) as ws:
+        BrowserSession("warm-up", ws, max(1.0, deadline - time.monotonic()), query_string="warm_up")
+    print(f"{base}: healthy after {healthy - started:.1f} s, warm after {time.monotonic() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()